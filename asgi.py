@@ -0,0 +1,6 @@
+from backend.api.asgi_server import create_asgi_app, run_server
+
+app = create_asgi_app()
+
+if __name__ == "__main__":
+    run_server()
@@ -4,21 +4,33 @@ API服务器
 """
 
 import os
-from flask import Flask, jsonify, send_from_directory, redirect
+from flask import Flask, Response, abort, jsonify, send_from_directory, redirect
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import logging
 
 # 导入路由
 from backend.api.routes import api_bp
+from backend.services import ingest_service, snapshot_service
+from backend.utils import helpers, metrics
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+class SafeJSONProvider(DefaultJSONProvider):
+    """jsonify时将非有限数值（如买卖压力比inf）输出为null，避免浏览器无法解析Infinity"""
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault("allow_nan", False)
+        return super().dumps(helpers.json_safe(obj), **kwargs)
+
+
 def create_app():
     """创建Flask应用"""
     app = Flask(__name__)
+    app.json = SafeJSONProvider(app)
     
     # 获取项目根目录
     root_dir = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -35,6 +47,14 @@ def create_app():
     # 注册蓝图
     app.register_blueprint(api_bp, url_prefix='/api')
     
+    # Prometheus指标（多进程部署时汇总所有工作进程），ASGI模式下同样由Flask应用提供
+    @app.route('/metrics')
+    def serve_metrics():
+        if not metrics.METRICS_ENABLED:
+            abort(404)
+        content, content_type = metrics.render()
+        return Response(content, content_type=content_type)
+
     # 添加根路由 - 重定向到前端首页
     @app.route('/')
     def index():
@@ -73,6 +93,8 @@ def create_app():
 def run_server(host='0.0.0.0', port=5000, debug=False):
     """运行API服务器"""
     app = create_app()
+    ingest_service.start()
+    snapshot_service.start()
     logger.info(f"API服务器启动在 http://{host}:{port}")
     app.run(host=host, port=port, debug=debug)
 
@@ -0,0 +1,174 @@
+"""
+ASGI服务器
+异步模式入口：提交分析任务、批量分析和流式分析这几个等待网络I/O的端点由异步视图处理，
+等待币安和DeepSeek响应期间不占用线程；其余请求转交Flask应用（在线程池中执行）。
+
+启动方式:
+    gunicorn -c gunicorn.conf.py asgi:app     （SERVER_MODE=asgi）
+    python -m backend.api.asgi_server          （开发调试）
+"""
+
+import os
+import json
+import logging
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from backend.api.api_server import create_app
+from backend.api.routes import BATCH_MAX_SYMBOLS, check_limit, format_sse
+from backend.services import job_service, pipeline_service, ingest_service, snapshot_service
+from backend.utils import async_http_client, helpers
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 处理转交给Flask应用的请求的线程数
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "8"))
+
+
+class _JSONResponse(JSONResponse):
+    """与Flask应用的JSON输出一致，非有限数值（如买卖压力比inf）输出为null"""
+
+    def render(self, content):
+        return json.dumps(helpers.json_safe(content), ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def _error(message, status_code):
+    return _JSONResponse({"status": "error", "message": message}, status_code=status_code)
+
+
+async def _parse_request(request, max_symbols=None):
+    """解析分析请求，返回 (symbols, interval, limit, 错误响应)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return None, None, None, _error("请求数据为空", 400)
+
+    symbols = data.get('symbols', [])
+    interval = data.get('interval', '1h')
+    if not symbols:
+        return None, None, None, _error("未提供交易对", 400)
+    if max_symbols is not None and len(symbols) > max_symbols:
+        return None, None, None, _error(f"单次最多分析{max_symbols}个交易对", 400)
+
+    limit, message = check_limit(data)
+    if message:
+        return None, None, None, _error(message, 400)
+    return symbols, interval, limit, None
+
+
+async def analyze_symbols(request):
+    """提交交易对资金流向分析任务（任务在事件循环中执行）"""
+    symbols, interval, limit, error = await _parse_request(request)
+    if error:
+        return error
+
+    try:
+        job = await job_service.submit_analysis_async(symbols, interval, limit)
+    except job_service.JobQueueFullError as e:
+        return _error(str(e), 429)
+    except Exception as e:
+        logger.error(f"提交分析任务失败: {str(e)}", exc_info=True)
+        return _error(f"提交分析任务失败: {str(e)}", 500)
+
+    data = {
+        "job_id": job["id"],
+        "job_status": job["status"]
+    }
+    # 结果已缓存时任务直接完成，随响应一并返回
+    if job["status"] == job_service.JOB_SUCCESS:
+        data["result"] = job["result"]
+        return _JSONResponse({"status": "success", "data": data})
+
+    return _JSONResponse({
+        "status": "success",
+        "data": data
+    }, status_code=202)
+
+
+async def analyze_symbols_batch(request):
+    """批量分析交易对资金流向（不含AI解读）"""
+    symbols, interval, limit, error = await _parse_request(request, BATCH_MAX_SYMBOLS)
+    if error:
+        return error
+
+    try:
+        result = await pipeline_service.analyze_batch_async(symbols, interval, limit)
+    except Exception as e:
+        logger.error(f"批量分析过程中发生错误: {str(e)}", exc_info=True)
+        return _error(f"批量分析过程中发生错误: {str(e)}", 500)
+
+    return _JSONResponse({
+        "status": "success",
+        "data": result
+    })
+
+
+async def analyze_symbols_stream(request):
+    """以Server-Sent Events流式返回分析进度、单个交易对结果和AI解读"""
+    symbols, interval, limit, error = await _parse_request(request)
+    if error:
+        return error
+
+    async def generate():
+        try:
+            async for event, payload in pipeline_service.aiter_analysis(symbols, interval, limit):
+                yield format_sse(event, payload)
+        except Exception as e:
+            logger.error(f"分析过程中发生错误: {str(e)}", exc_info=True)
+            yield format_sse("error", {"message": f"分析过程中发生错误: {str(e)}"})
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁用Nginx缓冲，保证事件实时送达
+        }
+    )
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    yield
+    await async_http_client.close()
+
+
+def create_asgi_app():
+    """创建ASGI应用，未列出的路径（包括其余API和前端静态文件）由Flask应用处理"""
+    flask_app = create_app()
+
+    routes = [
+        Route('/api/analyze', analyze_symbols, methods=['POST']),
+        Route('/api/analyze/batch', analyze_symbols_batch, methods=['POST']),
+        Route('/api/analyze/stream', analyze_symbols_stream, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+    ]
+    middleware = [
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ]
+    return Starlette(routes=routes, middleware=middleware, lifespan=_lifespan)
+
+
+def run_server(host='0.0.0.0', port=5000):
+    """以单进程运行ASGI服务器"""
+    import uvicorn
+
+    app = create_asgi_app()
+    ingest_service.start()
+    snapshot_service.start()
+    logger.info(f"ASGI服务器启动在 http://{host}:{port}")
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == "__main__":
+    run_server(os.getenv("API_HOST", "0.0.0.0"), int(os.getenv("API_PORT", "5000")))
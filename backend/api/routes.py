@@ -3,13 +3,15 @@ API路由
 定义REST API的端点
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import json
 import logging
-from datetime import datetime
+import os
 
 # 导入服务模块
-from backend.services import binance_service, analysis_service, ai_service
-from backend.utils import helpers
+from backend.services import job_service, pipeline_service, ingest_service, snapshot_service, screener_service
+from backend.utils import helpers, rate_limiter
+from backend.utils.helpers import DEFAULT_SYMBOLS, SUPPORTED_INTERVALS
 
 # 创建蓝图
 api_bp = Blueprint('api', __name__)
@@ -18,8 +20,28 @@ api_bp = Blueprint('api', __name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# 在routes.py中添加全局变量来跟踪分析状态
-_analysis_in_progress = False
+# 批量分析单次请求允许的最大交易对数量
+BATCH_MAX_SYMBOLS = int(os.getenv("BATCH_MAX_SYMBOLS", "100"))
+
+
+def check_limit(data):
+    """校验请求中的K线数量，返回 (limit, 错误信息)"""
+    limit = data.get('limit', pipeline_service.ANALYSIS_KLINES_LIMIT)
+    max_limit = pipeline_service.max_klines_limit()
+    if not isinstance(limit, int) or isinstance(limit, bool) or not 20 <= limit <= max_limit:
+        return None, f"K线数量必须是20到{max_limit}之间的整数"
+    return limit, None
+
+
+def _parse_limit(data):
+    """解析请求中的K线数量，返回 (limit, 错误响应)"""
+    limit, message = check_limit(data)
+    if message:
+        return None, (jsonify({
+            "status": "error",
+            "message": message
+        }), 400)
+    return limit, None
 
 
 @api_bp.route('/symbols', methods=['GET'])
@@ -27,7 +49,7 @@ def get_default_symbols():
     """获取默认交易对列表"""
     return jsonify({
         "status": "success",
-        "data": ["BTCUSDT", "ETHUSDT"]
+        "data": DEFAULT_SYMBOLS
     })
 
 
@@ -36,194 +58,298 @@ def get_intervals():
     """获取可用的K线时间间隔"""
     return jsonify({
         "status": "success",
-        "data": ["5m", "15m", "30m", "1h", "4h", "1d"]
+        "data": SUPPORTED_INTERVALS
     })
 
 
 @api_bp.route('/analyze', methods=['POST'])
 def analyze_symbols():
-    """分析交易对的资金流向"""
-    global _analysis_in_progress
-    
-    # 检查是否有正在进行的分析
-    if _analysis_in_progress:
+    """提交交易对资金流向分析任务"""
+    data = request.json
+    if not data:
+        return jsonify({
+            "status": "error",
+            "message": "请求数据为空"
+        }), 400
+
+    symbols = data.get('symbols', [])
+    interval = data.get('interval', '1h')
+
+    if not symbols:
+        return jsonify({
+            "status": "error",
+            "message": "未提供交易对"
+        }), 400
+
+    limit, error = _parse_limit(data)
+    if error:
+        return error
+
+    try:
+        job = job_service.submit_analysis(symbols, interval, limit)
+    except job_service.JobQueueFullError as e:
         return jsonify({
             "status": "error",
-            "message": "已有分析正在进行中，请等待完成后再试"
+            "message": str(e)
         }), 429  # 使用429状态码表示请求过多
-    
+    except Exception as e:
+        logger.error(f"提交分析任务失败: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error",
+            "message": f"提交分析任务失败: {str(e)}"
+        }), 500
+
+    data = {
+        "job_id": job["id"],
+        "job_status": job["status"]
+    }
+    # 结果已缓存时任务直接完成，随响应一并返回
+    if job["status"] == job_service.JOB_SUCCESS:
+        data["result"] = job["result"]
+        return jsonify({
+            "status": "success",
+            "data": data
+        })
+
+    return jsonify({
+        "status": "success",
+        "data": data
+    }), 202
+
+
+@api_bp.route('/analyze/batch', methods=['POST'])
+def analyze_symbols_batch():
+    """批量分析交易对资金流向（不含AI解读），复用已缓存的单个交易对结果"""
+    data = request.json
+    if not data:
+        return jsonify({
+            "status": "error",
+            "message": "请求数据为空"
+        }), 400
+
+    symbols = data.get('symbols', [])
+    interval = data.get('interval', '1h')
+
+    if not symbols:
+        return jsonify({
+            "status": "error",
+            "message": "未提供交易对"
+        }), 400
+
+    if len(symbols) > BATCH_MAX_SYMBOLS:
+        return jsonify({
+            "status": "error",
+            "message": f"单次最多分析{BATCH_MAX_SYMBOLS}个交易对"
+        }), 400
+
+    limit, error = _parse_limit(data)
+    if error:
+        return error
+
     try:
-        _analysis_in_progress = True
-        data = request.json
-        if not data:
-            return jsonify({
-                "status": "error",
-                "message": "请求数据为空"
-            }), 400
-
-        symbols = data.get('symbols', [])
-        interval = data.get('interval', '1h')
-
-        if not symbols:
-            return jsonify({
-                "status": "error",
-                "message": "未提供交易对"
-            }), 400
-
-        # 记录开始时间
-        start_time = datetime.now()
-        logger.info(f"开始分析 {', '.join(symbols)}, 时间间隔: {interval}")
-
-        # 获取现货和期货的K线数据
-        spot_klines_data = {}
-        futures_klines_data = {}
-
-        for symbol in symbols:
-            helpers.log_progress(f"正在获取 {symbol} 现货{interval}K线数据...")
-            spot_klines_data[symbol] = binance_service.get_klines_data(
-                symbol, interval=interval, limit=50, is_futures=False
-            )
-
-            helpers.log_progress(f"正在获取 {symbol} 期货{interval}K线数据...")
-            futures_klines_data[symbol] = binance_service.get_klines_data(
-                symbol, interval=interval, limit=50, is_futures=True
-            )
-
-        # 获取订单簿数据
-        spot_order_books = {}
-        futures_order_books = {}
-
-        for symbol in symbols:
-            helpers.log_progress(f"正在获取 {symbol} 订单簿数据...")
-            spot_order_books[symbol] = binance_service.get_orderbook_stats(symbol, is_futures=False)
-            futures_order_books[symbol] = binance_service.get_orderbook_stats(symbol, is_futures=True)
-
-        # 分析资金流向趋势
-        spot_trend_analysis = {}
-        futures_trend_analysis = {}
-
-        for symbol in symbols:
-            helpers.log_progress(f"正在分析 {symbol} 资金流向趋势...")
-            spot_trend_analysis[symbol] = analysis_service.analyze_funding_flow_trend(spot_klines_data[symbol])
-            futures_trend_analysis[symbol] = analysis_service.analyze_funding_flow_trend(futures_klines_data[symbol])
-
-        # 检测异常交易
-        spot_anomalies = {}
-        futures_anomalies = {}
-
-        for symbol in symbols:
-            helpers.log_progress(f"正在检测 {symbol} 异常交易...")
-            spot_anomalies[symbol] = analysis_service.detect_anomalies(spot_klines_data[symbol])
-            futures_anomalies[symbol] = analysis_service.detect_anomalies(futures_klines_data[symbol])
-
-        # 分析资金压力
-        spot_pressure_analysis = {}
-        futures_pressure_analysis = {}
-
-        for symbol in symbols:
-            helpers.log_progress(f"正在分析 {symbol} 资金压力...")
-            spot_pressure_analysis[symbol] = analysis_service.analyze_funding_pressure(
-                spot_klines_data[symbol], spot_order_books[symbol]
-            )
-            futures_pressure_analysis[symbol] = analysis_service.analyze_funding_pressure(
-                futures_klines_data[symbol], futures_order_books[symbol]
-            )
-
-        # 整合数据
-        analysis_data = {}
-
-        for symbol in symbols:
-            analysis_data[symbol] = {
-                "spot": {
-                    "klines_summary": {
-                        "first_time": spot_klines_data[symbol][0]["open_time"] if spot_klines_data[symbol] else None,
-                        "last_time": spot_klines_data[symbol][-1]["close_time"] if spot_klines_data[symbol] else None,
-                        "price_change": (spot_klines_data[symbol][-1]["close"] - spot_klines_data[symbol][0]["open"]) /
-                                        spot_klines_data[symbol][0]["open"] * 100 if spot_klines_data[symbol] else 0,
-                        "current_price": spot_klines_data[symbol][-1]["close"] if spot_klines_data[symbol] else 0,
-                        "total_volume": sum(k["volume"] for k in spot_klines_data[symbol]) if spot_klines_data[
-                            symbol] else 0,
-                        "total_quote_volume": sum(k["quote_volume"] for k in spot_klines_data[symbol]) if
-                        spot_klines_data[symbol] else 0
-                    },
-                    "funding_trend": spot_trend_analysis[symbol],
-                    "anomalies": spot_anomalies[symbol],
-                    "order_book": spot_order_books[symbol],
-                    "funding_pressure": spot_pressure_analysis[symbol]
-                },
-                "futures": {
-                    "klines_summary": {
-                        "first_time": futures_klines_data[symbol][0]["open_time"] if futures_klines_data[
-                            symbol] else None,
-                        "last_time": futures_klines_data[symbol][-1]["close_time"] if futures_klines_data[
-                            symbol] else None,
-                        "price_change": (futures_klines_data[symbol][-1]["close"] - futures_klines_data[symbol][0][
-                            "open"]) / futures_klines_data[symbol][0]["open"] * 100 if futures_klines_data[
-                            symbol] else 0,
-                        "current_price": futures_klines_data[symbol][-1]["close"] if futures_klines_data[symbol] else 0,
-                        "total_volume": sum(k["volume"] for k in futures_klines_data[symbol]) if futures_klines_data[
-                            symbol] else 0,
-                        "total_quote_volume": sum(k["quote_volume"] for k in futures_klines_data[symbol]) if
-                        futures_klines_data[symbol] else 0
-                    },
-                    "funding_trend": futures_trend_analysis[symbol],
-                    "anomalies": futures_anomalies[symbol],
-                    "order_book": futures_order_books[symbol],
-                    "funding_pressure": futures_pressure_analysis[symbol]
-                },
-                "comparison": {
-                    "spot_vs_futures_price_diff": (spot_klines_data[symbol][-1]["close"] -
-                                                   futures_klines_data[symbol][-1]["close"]) /
-                                                  spot_klines_data[symbol][-1]["close"] * 100 if spot_klines_data[
-                                                      symbol] and futures_klines_data[symbol] else 0,
-                    "spot_vs_futures_volume_ratio": sum(k["volume"] for k in spot_klines_data[symbol]) / sum(
-                        k["volume"] for k in futures_klines_data[symbol]) if spot_klines_data[symbol] and
-                                                   futures_klines_data[symbol] and sum(
-                        k["volume"] for k in futures_klines_data[symbol]) > 0 else 0,
-                    "spot_vs_futures_net_inflow_diff": spot_trend_analysis[symbol]["net_inflow_total"] -
-                                                       futures_trend_analysis[symbol]["net_inflow_total"] if
-                    spot_trend_analysis[symbol] and futures_trend_analysis[symbol] else 0
-                }
-            }
-
-        # 添加分析时间和参数信息
-        analysis_metadata = helpers.create_analysis_metadata(interval, symbols)
-
-        # 整合所有数据
-        deepseek_data = {
-            "metadata": analysis_metadata,
-            "analysis": analysis_data
+        result = pipeline_service.analyze_batch(symbols, interval, limit)
+    except Exception as e:
+        logger.error(f"批量分析过程中发生错误: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error",
+            "message": f"批量分析过程中发生错误: {str(e)}"
+        }), 500
+
+    return jsonify({
+        "status": "success",
+        "data": result
+    })
+
+
+@api_bp.route('/analyze/timeframes', methods=['POST'])
+def analyze_symbols_timeframes():
+    """多周期分析交易对资金流向（不含AI解读），各周期由同一份基础周期K线聚合得到"""
+    data = request.json
+    if not data:
+        return jsonify({
+            "status": "error",
+            "message": "请求数据为空"
+        }), 400
+
+    symbols = data.get('symbols', [])
+    intervals = data.get('intervals', ["15m", "1h", "4h"])
+
+    if not symbols:
+        return jsonify({
+            "status": "error",
+            "message": "未提供交易对"
+        }), 400
+
+    if len(symbols) > BATCH_MAX_SYMBOLS:
+        return jsonify({
+            "status": "error",
+            "message": f"单次最多分析{BATCH_MAX_SYMBOLS}个交易对"
+        }), 400
+
+    if not intervals or not isinstance(intervals, list) or any(i not in SUPPORTED_INTERVALS for i in intervals):
+        return jsonify({
+            "status": "error",
+            "message": f"时间间隔必须是以下之一: {', '.join(SUPPORTED_INTERVALS)}"
+        }), 400
+
+    limit, error = _parse_limit(data)
+    if error:
+        return error
+
+    try:
+        result = pipeline_service.analyze_timeframes(symbols, intervals, limit)
+    except Exception as e:
+        logger.error(f"多周期分析过程中发生错误: {str(e)}", exc_info=True)
+        return jsonify({
+            "status": "error",
+            "message": f"多周期分析过程中发生错误: {str(e)}"
+        }), 500
+
+    return jsonify({
+        "status": "success",
+        "data": result
+    })
+
+
+def format_sse(event, payload):
+    """格式化Server-Sent Events消息（非有限数值输出为null）"""
+    data = json.dumps(helpers.json_safe(payload), ensure_ascii=False, allow_nan=False)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@api_bp.route('/analyze/stream', methods=['POST'])
+def analyze_symbols_stream():
+    """以Server-Sent Events流式返回分析进度、单个交易对结果和AI解读"""
+    data = request.json
+    if not data:
+        return jsonify({
+            "status": "error",
+            "message": "请求数据为空"
+        }), 400
+
+    symbols = data.get('symbols', [])
+    interval = data.get('interval', '1h')
+
+    if not symbols:
+        return jsonify({
+            "status": "error",
+            "message": "未提供交易对"
+        }), 400
+
+    limit, error = _parse_limit(data)
+    if error:
+        return error
+
+    def generate():
+        try:
+            for event, payload in pipeline_service.iter_analysis(symbols, interval, limit):
+                yield format_sse(event, payload)
+        except Exception as e:
+            logger.error(f"分析过程中发生错误: {str(e)}", exc_info=True)
+            yield format_sse("error", {"message": f"分析过程中发生错误: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁用Nginx缓冲，保证事件实时送达
         }
+    )
 
-        # 发送到DeepSeek进行解读
-        helpers.log_progress("正在通过AI解读分析结果...")
-        deepseek_result = ai_service.send_to_deepseek(deepseek_data, interval)
 
-        # 计算总耗时
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
+@api_bp.route('/watchlist', methods=['GET'])
+def get_watchlist():
+    """获取行情采集交易对的增量资金流向趋势和异常（每根K线收盘时更新）"""
+    return jsonify({
+        "status": "success",
+        "data": ingest_service.get_watchlist(
+            interval=request.args.get('interval'),
+            market=request.args.get('market')
+        )
+    })
 
-        # 返回结果
+
+@api_bp.route('/screener', methods=['GET'])
+def screen_symbols():
+    """全市场筛选：按净流入、盘口失衡和异常偏离对成交额靠前的交易对评分排序"""
+    market = request.args.get('market', 'spot')
+    interval = request.args.get('interval', '1h')
+    sort = request.args.get('sort', 'score')
+    top = request.args.get('top', 20, type=int)
+
+    if market not in ("spot", "futures"):
         return jsonify({
-            "status": "success",
-            "data": {
-                "raw_analysis": deepseek_data,
-                "ai_interpretation": deepseek_result,
-                "metadata": {
-                    **analysis_metadata,
-                    "duration": duration
-                }
-            }
-        })
+            "status": "error",
+            "message": "市场必须是 spot 或 futures"
+        }), 400
+
+    if interval not in SUPPORTED_INTERVALS:
+        return jsonify({
+            "status": "error",
+            "message": f"时间间隔必须是以下之一: {', '.join(SUPPORTED_INTERVALS)}"
+        }), 400
+
+    if sort not in screener_service.SORT_FIELDS:
+        return jsonify({
+            "status": "error",
+            "message": f"排序字段必须是以下之一: {', '.join(screener_service.SORT_FIELDS)}"
+        }), 400
 
+    if top is None or not 1 <= top <= 500:
+        return jsonify({
+            "status": "error",
+            "message": "返回数量必须是1到500之间的整数"
+        }), 400
+
+    try:
+        result = screener_service.screen(interval, is_futures=market == "futures", sort=sort, top=top,
+                                         ascending=request.args.get('order') == 'asc')
     except Exception as e:
-        logger.error(f"分析过程中发生错误: {str(e)}", exc_info=True)
+        logger.error(f"全市场筛选过程中发生错误: {str(e)}", exc_info=True)
         return jsonify({
             "status": "error",
-            "message": f"分析过程中发生错误: {str(e)}"
+            "message": f"全市场筛选过程中发生错误: {str(e)}"
         }), 500
-    finally:
-        _analysis_in_progress = False
+
+    return jsonify({
+        "status": "success",
+        "data": result
+    })
+
+
+@api_bp.route('/snapshots', methods=['GET'])
+def get_snapshots():
+    """获取关注列表各时间间隔最近一次快照的版本、刷新时间和失败的交易对"""
+    return jsonify({
+        "status": "success",
+        "data": snapshot_service.get_status()
+    })
+
+
+@api_bp.route('/ratelimit', methods=['GET'])
+def get_rate_limit():
+    """获取币安现货和期货接口当前分钟的请求权重使用情况"""
+    return jsonify({
+        "status": "success",
+        "data": rate_limiter.get_status()
+    })
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询分析任务状态和结果"""
+    job = job_service.get_job(job_id)
+    if not job:
+        return jsonify({
+            "status": "error",
+            "message": "分析任务不存在或已过期"
+        }), 404
+
+    return jsonify({
+        "status": "success",
+        "data": job
+    })
 
 
 @api_bp.route('/health', methods=['GET'])
@@ -4,21 +4,106 @@ AI服务
 """
 
 import requests
+import httpx
 import json
+import queue
+import asyncio
+import hashlib
 import logging
 import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlsplit
+
+from backend.services import prompt_builder
+from backend.utils import helpers, http_client, async_http_client, metrics
+from backend.utils.cache import call_async, get_cache
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# API端点URL
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+# API端点URL（可指向本地模拟服务进行测试）
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+# 指标中记录的接口路径
+_DEEPSEEK_ENDPOINT = urlsplit(DEEPSEEK_API_URL).path
 
+# 请求超时（秒）：连接超时和读取超时
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv("DEEPSEEK_CONNECT_TIMEOUT", "10"))
+DEEPSEEK_READ_TIMEOUT = float(os.getenv("DEEPSEEK_READ_TIMEOUT", "120"))
 
-def send_to_deepseek(data, interval="1h"):
-    """将数据发送给DeepSeek API并获取解读"""
+# AI解读缓存：相同行情快照在同一根K线收盘前直接返回缓存结果
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "True").lower() == "true"
+# 生成缓存键时数值保留的有效数字位数，位数越少越容易命中
+AI_CACHE_SIGNIFICANT_DIGITS = int(os.getenv("AI_CACHE_SIGNIFICANT_DIGITS", "3"))
+
+# 分组解读：交易对数量超过AI_CHUNK_SIZE时按组并发请求，0表示始终使用单次请求
+AI_CHUNK_SIZE = int(os.getenv("AI_CHUNK_SIZE", "5"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+# 分组时额外请求一段跨交易对的简短总结（与各组并发执行）
+AI_SUMMARY_ENABLED = os.getenv("AI_SUMMARY_ENABLED", "True").lower() == "true"
+AI_SUMMARY_MAX_TOKENS = int(os.getenv("AI_SUMMARY_MAX_TOKENS", "800"))
+
+# 分组解读队列中表示该组已结束的标记
+_DONE = object()
+
+
+def _normalize_payload(value):
+    """规范化分析数据：浮点数按有效数字取整，字典按键排序"""
+    if isinstance(value, float):
+        return float(f"{value:.{AI_CACHE_SIGNIFICANT_DIGITS}g}")
+    if isinstance(value, dict):
+        return {k: _normalize_payload(value[k]) for k in sorted(value)}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_payload(v) for v in value]
+    return value
+
+
+def _ai_cache_key(data, interval, summary=False):
+    """根据规范化后的分析数据生成内容寻址的缓存键，分析时间等元数据不参与计算"""
+    metadata = {k: v for k, v in data.get("metadata", {}).items() if k != "analysis_time"}
+    content = {
+        "interval": interval,
+        "metadata": metadata,
+        "analysis": _normalize_payload(data.get("analysis", data))
+    }
+    if summary:
+        content["kind"] = "summary"
+    content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return f"ai:{digest}"
+
+
+def _ai_cache_ttl(interval):
+    """缓存有效期为当前K线收盘前的剩余秒数"""
+    try:
+        interval_ms = helpers.interval_to_ms(interval)
+    except ValueError:
+        interval_ms = helpers.interval_to_ms("1h")
+    return (interval_ms - helpers.get_current_time_ms() % interval_ms) / 1000
+
+
+def _get_cached_interpretation(cache_key):
+    """读取AI解读缓存"""
+    if not AI_CACHE_ENABLED:
+        return None
+    cached = get_cache().get(cache_key)
+    metrics.cache_lookup("ai", cached is not None)
+    if cached is not None:
+        logger.info("命中AI解读缓存")
+    return cached
+
+
+def _store_interpretation(cache_key, content, interval):
+    """写入AI解读缓存"""
+    if AI_CACHE_ENABLED and content:
+        get_cache().set(cache_key, content, ttl=_ai_cache_ttl(interval))
+
+
+def _request_headers():
+    """构建DeepSeek API请求头"""
     # 在函数内部获取环境变量，确保每次调用都能获取到最新值
     DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
     
@@ -28,11 +113,31 @@ def send_to_deepseek(data, interval="1h"):
     
     logger.info(f"使用API密钥：{DEEPSEEK_API_KEY[:8]}...（部分隐藏）")
 
-    headers = {
+    return {
         "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
         "Content-Type": "application/json"
     }
 
+
+def _chat_payload(prompt, max_tokens, stream):
+    """构建DeepSeek API请求体"""
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+        "stream": stream
+    }
+    if stream:
+        # 流式响应的最后一个事件附带实际的token用量
+        payload["stream_options"] = {"include_usage": True}
+    return payload
+
+
+def _build_request(data, interval, stream=False):
+    """构建DeepSeek API请求头和请求体"""
+    headers = _request_headers()
+
     # 根据不同时间间隔设置相应的分析参数
     interval_settings = {
         "5m": {
@@ -86,9 +191,15 @@ def send_to_deepseek(data, interval="1h"):
 
     settings = interval_settings[interval_key]
 
+    # 分析数据压缩为表格文本，超出token预算时自动截断
+    data_text, data_stats = prompt_builder.build_prompt_data(data)
+    klines_count = data.get("metadata", {}).get("klines_count", 50)
+    logger.info(f"AI输入数据约 {data_stats['estimated_tokens']} tokens，"
+                f"{data_stats['symbols_detailed']}/{data_stats['symbols']} 个交易对列出明细")
+
     prompt = (
             f"## Binance资金流向专业分析任务 (K线周期: {interval})\n\n"
-            f"我已收集了Binance现货和期货市场过去50根{interval}K线的资金流向数据（已剔除最新未完成的一根），包括：\n"
+            f"我已收集了Binance现货和期货市场过去{klines_count}根{interval}K线的资金流向数据（已剔除最新未完成的一根），包括：\n"
             "- 各交易对的资金流向趋势分析\n"
             "- 价格所处阶段预测（顶部、底部、上涨中、下跌中、整理中）\n"
             "- 订单簿数据（买卖盘不平衡度）\n"
@@ -122,21 +233,57 @@ def send_to_deepseek(data, interval="1h"):
             f"   - {settings['position_sizing']}\n"
             "   - 评估风险和回报比\n\n"
 
-            "请使用专业术语，保持分析简洁但深入，避免泛泛而谈。数据如下：\n\n" +
-            json.dumps(data, indent=2, ensure_ascii=False) +
+            "请使用专业术语，保持分析简洁但深入，避免泛泛而谈。数据如下（表格以|分隔）：\n\n" +
+            data_text +
             "\n\n回复格式要求：中文，使用markdown格式，重点突出，适当使用表格对比分析。"
     )
 
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 2000,
-        "temperature": 0.7
-    }
+    return headers, _chat_payload(prompt, 2000, stream)
+
+
+def _build_summary_request(data, interval, stream=False):
+    """构建跨交易对总结的请求头和请求体（各交易对的详细解读由分组请求完成）"""
+    headers = _request_headers()
+    data_text, _ = prompt_builder.build_prompt_data(data)
+
+    prompt = (
+            f"## Binance资金流向跨交易对总结 (K线周期: {interval})\n\n"
+            "以下是多个交易对现货和期货市场的资金流向分析数据，各交易对的详细解读会单独给出，"
+            "这里只需要给出简短的整体总结：\n"
+            "1. 整体资金流向和市场情绪\n"
+            "2. 资金流入和流出最明显的交易对\n"
+            "3. 交易对之间可能的轮动关系\n"
+            "4. 3-5条最值得关注的要点\n\n"
+            "数据如下（表格以|分隔）：\n\n" +
+            data_text +
+            "\n\n回复格式要求：中文，使用markdown格式，不超过300字。"
+    )
+
+    return headers, _chat_payload(prompt, AI_SUMMARY_MAX_TOKENS, stream)
+
 
+def _log_usage(usage):
+    """记录DeepSeek返回的实际token用量"""
+    if usage:
+        logger.info(f"DeepSeek token用量: 输入 {usage.get('prompt_tokens')}，输出 {usage.get('completion_tokens')}")
+
+
+def send_to_deepseek(data, interval="1h"):
+    """将数据发送给DeepSeek API并获取解读"""
+    cache_key = _ai_cache_key(data, interval)
+    cached = _get_cached_interpretation(cache_key)
+    if cached is not None:
+        return cached
+
+    headers, payload = _build_request(data, interval)
+
+    start = time.perf_counter()
+    status = "error"
     try:
         logger.info("正在发送数据到DeepSeek API...")
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload)
+        response = http_client.post(DEEPSEEK_API_URL, headers=headers, json=payload,
+                                    timeout=(DEEPSEEK_CONNECT_TIMEOUT, DEEPSEEK_READ_TIMEOUT))
+        status = response.status_code
         response.raise_for_status()
         
         # 检查响应内容类型
@@ -158,10 +305,267 @@ def send_to_deepseek(data, interval="1h"):
             raise Exception("DeepSeek API响应格式不正确")
             
         logger.info("成功获取DeepSeek API响应")
-        return result['choices'][0]['message']['content']
+        _log_usage(result.get("usage"))
+        content = result['choices'][0]['message']['content']
+        _store_interpretation(cache_key, content, interval)
+        return content
     except requests.exceptions.RequestException as e:
         logger.error(f"DeepSeek API请求错误: {e}")
         raise Exception(f"AI分析失败: 网络请求错误 - {str(e)}")
     except Exception as e:
         logger.error(f"DeepSeek API error: {e}")
-        raise Exception(f"AI分析失败: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"AI分析失败: {str(e)}") 
+    finally:
+        metrics.observe_upstream("deepseek", _DEEPSEEK_ENDPOINT, status, time.perf_counter() - start)
+
+def _parse_stream_line(line):
+    """解析流式响应的一行，返回内容片段（可能为None），遇到结束标记时返回_DONE"""
+    # 流式响应为SSE格式，每条数据以"data: "开头，以"data: [DONE]"结束
+    if not line.startswith("data:"):
+        return None
+    data_str = line[len("data:"):].strip()
+    if data_str == "[DONE]":
+        return _DONE
+
+    try:
+        event = json.loads(data_str)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON解析错误: {e}, 内容: {data_str[:500]}")
+        raise Exception("无法解析DeepSeek API的流式响应")
+
+    _log_usage(event.get("usage"))
+    choices = event.get("choices") or []
+    return choices[0].get("delta", {}).get("content") if choices else None
+
+
+def stream_deepseek(data, interval="1h", summary=False):
+    """以流式方式获取DeepSeek解读，逐段产出内容片段
+
+    命中缓存时一次性产出完整内容；完整接收后写入缓存。summary为True时请求跨交易对总结。
+    """
+    cache_key = _ai_cache_key(data, interval, summary)
+    cached = _get_cached_interpretation(cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    build = _build_summary_request if summary else _build_request
+    headers, payload = build(data, interval, stream=True)
+    chunks = []
+
+    # 响应时间记录到流式响应结束为止，另外单独记录收到首个内容片段的时间
+    start = time.perf_counter()
+    status = "error"
+    try:
+        logger.info("正在以流式方式发送数据到DeepSeek API...")
+        with http_client.post(DEEPSEEK_API_URL, headers=headers, json=payload, stream=True,
+                              timeout=(DEEPSEEK_CONNECT_TIMEOUT, DEEPSEEK_READ_TIMEOUT)) as response:
+            status = response.status_code
+            response.raise_for_status()
+
+            for raw_line in response.iter_lines():
+                delta = _parse_stream_line(raw_line.decode("utf-8"))
+                if delta is _DONE:
+                    break
+                if delta:
+                    if not chunks:
+                        metrics.observe_stage("ai.first_token", time.perf_counter() - start)
+                    chunks.append(delta)
+                    yield delta
+    except requests.exceptions.RequestException as e:
+        logger.error(f"DeepSeek API请求错误: {e}")
+        raise Exception(f"AI分析失败: 网络请求错误 - {str(e)}")
+    except Exception as e:
+        logger.error(f"DeepSeek API error: {e}")
+        raise Exception(f"AI分析失败: {str(e)}")
+    finally:
+        metrics.observe_upstream("deepseek", _DEEPSEEK_ENDPOINT, status, time.perf_counter() - start)
+
+    if not chunks:
+        raise Exception("AI分析失败: DeepSeek API未返回任何内容")
+
+    logger.info("成功获取DeepSeek API流式响应")
+    _store_interpretation(cache_key, "".join(chunks), interval)
+
+
+async def astream_deepseek(data, interval="1h", summary=False):
+    """stream_deepseek的异步版本（ASGI模式），等待DeepSeek响应期间不占用线程"""
+    cache_key = _ai_cache_key(data, interval, summary)
+    cached = await call_async(_get_cached_interpretation, cache_key)
+    if cached is not None:
+        yield cached
+        return
+
+    build = _build_summary_request if summary else _build_request
+    headers, payload = build(data, interval, stream=True)
+    chunks = []
+
+    start = time.perf_counter()
+    status = "error"
+    try:
+        logger.info("正在以流式方式发送数据到DeepSeek API...")
+        async with async_http_client.stream(
+                "POST", DEEPSEEK_API_URL, headers=headers, json=payload,
+                timeout=httpx.Timeout(DEEPSEEK_READ_TIMEOUT, connect=DEEPSEEK_CONNECT_TIMEOUT)) as response:
+            status = response.status_code
+            response.raise_for_status()
+
+            async for line in response.aiter_lines():
+                delta = _parse_stream_line(line)
+                if delta is _DONE:
+                    break
+                if delta:
+                    if not chunks:
+                        metrics.observe_stage("ai.first_token", time.perf_counter() - start)
+                    chunks.append(delta)
+                    yield delta
+    except httpx.HTTPError as e:
+        logger.error(f"DeepSeek API请求错误: {e}")
+        raise Exception(f"AI分析失败: 网络请求错误 - {str(e)}")
+    except Exception as e:
+        logger.error(f"DeepSeek API error: {e}")
+        raise Exception(f"AI分析失败: {str(e)}")
+    finally:
+        metrics.observe_upstream("deepseek", _DEEPSEEK_ENDPOINT, status, time.perf_counter() - start)
+
+    if not chunks:
+        raise Exception("AI分析失败: DeepSeek API未返回任何内容")
+
+    logger.info("成功获取DeepSeek API流式响应")
+    await call_async(_store_interpretation, cache_key, "".join(chunks), interval)
+
+
+def _split_data(data, chunk_size):
+    """按交易对将分析数据拆分为若干组，每组保留各自的元数据"""
+    analysis = data.get("analysis", {})
+    symbols = list(analysis)
+    chunks = []
+    for start in range(0, len(symbols), chunk_size):
+        group = symbols[start:start + chunk_size]
+        chunks.append({
+            "metadata": {**data.get("metadata", {}), "symbols_analyzed": group},
+            "analysis": {symbol: analysis[symbol] for symbol in group}
+        })
+    return chunks
+
+
+def _sections(data):
+    """分组解读的各部分：(标题, 数据, 是否为总结)，交易对数量不需要分组时返回None"""
+    symbols = list(data.get("analysis", {}))
+    if not AI_CHUNK_SIZE or len(symbols) <= AI_CHUNK_SIZE:
+        return None
+
+    chunks = _split_data(data, AI_CHUNK_SIZE)
+    sections = [("## 整体总结", data, True)] if AI_SUMMARY_ENABLED else []
+    sections += [(f"## {', '.join(chunk['metadata']['symbols_analyzed'])}", chunk, False) for chunk in chunks]
+    logger.info(f"{len(symbols)} 个交易对分为 {len(chunks)} 组并发请求AI解读")
+    return sections
+
+
+def _pump(output, data, interval, summary):
+    """在线程中执行流式请求，将内容片段放入队列，结束时放入_DONE，失败时放入异常"""
+    try:
+        for delta in stream_deepseek(data, interval, summary):
+            output.put(delta)
+        output.put(_DONE)
+    except Exception as e:
+        output.put(e)
+
+
+def stream_interpretation(data, interval="1h"):
+    """获取AI解读，逐段产出内容片段
+
+    交易对数量不超过AI_CHUNK_SIZE时与stream_deepseek相同；否则按组并发请求（最多AI_MAX_CONCURRENCY个），
+    可选的整体总结与各组同时请求。各部分按固定顺序输出：当前部分实时转发，后续部分在后台缓冲，
+    总耗时接近最慢的一组而不是随交易对数量线性增长。单个分组失败时在对应位置输出失败原因。
+    """
+    sections = _sections(data)
+    if sections is None:
+        yield from stream_deepseek(data, interval)
+        return
+
+    queues = [queue.Queue() for _ in sections]
+    executor = ThreadPoolExecutor(max_workers=max(1, min(AI_MAX_CONCURRENCY, len(sections))),
+                                  thread_name_prefix="deepseek")
+    try:
+        for output, (_, section_data, summary) in zip(queues, sections):
+            # 在当前上下文中执行，继承请求截止时间
+            executor.submit(contextvars.copy_context().run, _pump, output, section_data, interval, summary)
+
+        failures = 0
+        for index, (output, (title, _, summary)) in enumerate(zip(queues, sections)):
+            yield ("\n\n" if index else "") + title + "\n\n"
+            while True:
+                item = output.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    if not summary:
+                        failures += 1
+                    yield f"（{str(item)}）"
+                    break
+                yield item
+
+        if failures == sum(1 for section in sections if not section[2]):
+            raise Exception("AI分析失败: 所有分组的解读均失败")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_cached_interpretation(data, interval="1h"):
+    """只读取缓存中的AI解读（内容与stream_interpretation的输出一致），任一部分未缓存时返回None"""
+    sections = _sections(data)
+    if sections is None:
+        return _get_cached_interpretation(_ai_cache_key(data, interval))
+
+    parts = []
+    for index, (title, section_data, summary) in enumerate(sections):
+        content = _get_cached_interpretation(_ai_cache_key(section_data, interval, summary))
+        if content is None:
+            return None
+        parts.append(("\n\n" if index else "") + title + "\n\n" + content)
+    return "".join(parts)
+
+
+async def astream_interpretation(data, interval="1h"):
+    """stream_interpretation的异步版本：各组作为事件循环中的任务并发请求，由信号量限制并发数"""
+    sections = _sections(data)
+    if sections is None:
+        async for delta in astream_deepseek(data, interval):
+            yield delta
+        return
+
+    semaphore = asyncio.Semaphore(max(1, AI_MAX_CONCURRENCY))
+    queues = [asyncio.Queue() for _ in sections]
+
+    async def pump(output, section_data, summary):
+        async with semaphore:
+            try:
+                async for delta in astream_deepseek(section_data, interval, summary):
+                    output.put_nowait(delta)
+                output.put_nowait(_DONE)
+            except Exception as e:
+                output.put_nowait(e)
+
+    tasks = [asyncio.create_task(pump(output, section_data, summary))
+             for output, (_, section_data, summary) in zip(queues, sections)]
+    try:
+        failures = 0
+        for index, (output, (title, _, summary)) in enumerate(zip(queues, sections)):
+            yield ("\n\n" if index else "") + title + "\n\n"
+            while True:
+                item = await output.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    if not summary:
+                        failures += 1
+                    yield f"（{str(item)}）"
+                    break
+                yield item
+
+        if failures == sum(1 for section in sections if not section[2]):
+            raise Exception("AI分析失败: 所有分组的解读均失败")
+    finally:
+        for task in tasks:
+            task.cancel()
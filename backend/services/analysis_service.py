@@ -6,11 +6,60 @@
 import numpy as np
 import logging
 
+from backend.utils import helpers
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+def _sequential_sum(values, axis=-1):
+    """按顺序累加求和，与Python内置sum的舍入结果一致"""
+    return np.cumsum(values, axis=axis).take(-1, axis=axis)
+
+
+def classify_trend(window_inflows):
+    """根据最近3个滑动窗口的净流入判断趋势，返回(趋势, 置信度)"""
+    window_inflows = np.asarray(window_inflows)
+    trend = "neutral"
+    if len(window_inflows) >= 3:
+        positive = window_inflows > 0
+        negative = window_inflows < 0
+        if positive.all() and window_inflows[-1] > window_inflows[-2]:
+            trend = "increasing"
+        elif negative.all() and window_inflows[-1] < window_inflows[-2]:
+            trend = "decreasing"
+        elif positive.sum() >= 2:
+            trend = "slightly_increasing"
+        elif negative.sum() >= 2:
+            trend = "slightly_decreasing"
+
+    # 计算趋势置信度
+    if trend in ["increasing", "decreasing"]:
+        confidence = 0.8
+    elif trend in ["slightly_increasing", "slightly_decreasing"]:
+        confidence = 0.6
+    else:
+        confidence = 0.4
+
+    return trend, confidence
+
+
+def classify_price_stage(latest_price, price_ma, price_volatility, trend):
+    """根据最新价格、均价、波动率和资金趋势判断价格所处阶段"""
+    if latest_price > price_ma * 1.05 and trend in ["increasing", "slightly_increasing"]:
+        return "上涨中"
+    elif latest_price < price_ma * 0.95 and trend in ["decreasing", "slightly_decreasing"]:
+        return "下跌中"
+    elif price_volatility < 0.01 and abs(latest_price - price_ma) / price_ma < 0.02:
+        return "整理中"
+    elif latest_price > price_ma * 1.08 and trend in ["decreasing", "slightly_decreasing"]:
+        return "可能顶部"
+    elif latest_price < price_ma * 0.92 and trend in ["increasing", "slightly_increasing"]:
+        return "可能底部"
+    return "波动中"
+
+
 def analyze_funding_flow_trend(klines_data, window_size=10):
     """分析资金流向趋势"""
     if not klines_data or len(klines_data) < window_size:
@@ -22,65 +71,36 @@ def analyze_funding_flow_trend(klines_data, window_size=10):
             "price_stage": "unknown"
         }
 
+    inflows = klines_data.net_inflow
+
     # 计算总净流入
-    net_inflow_total = sum(k["net_inflow"] for k in klines_data)
+    net_inflow_total = float(_sequential_sum(inflows))
 
     # 计算最近窗口的净流入
-    net_inflow_recent = sum(k["net_inflow"] for k in klines_data[-window_size:])
+    net_inflow_recent = float(_sequential_sum(inflows[-window_size:]))
 
-    # 计算净流入的移动平均
-    window_inflows = []
-    for i in range(len(klines_data) - window_size + 1):
-        window_inflow = sum(k["net_inflow"] for k in klines_data[i:i + window_size])
-        window_inflows.append(window_inflow)
+    # 计算最近3个滑动窗口的净流入（趋势判断只需要最后3个窗口）
+    windows = np.lib.stride_tricks.sliding_window_view(inflows, window_size)[-3:]
+    window_inflows = _sequential_sum(windows, axis=1)
 
     # 确定趋势
-    trend = "neutral"
-    if len(window_inflows) >= 3:
-        recent_inflows = window_inflows[-3:]
-        if all(x > 0 for x in recent_inflows) and recent_inflows[-1] > recent_inflows[-2]:
-            trend = "increasing"
-        elif all(x < 0 for x in recent_inflows) and recent_inflows[-1] < recent_inflows[-2]:
-            trend = "decreasing"
-        elif sum(1 for x in recent_inflows if x > 0) >= 2:
-            trend = "slightly_increasing"
-        elif sum(1 for x in recent_inflows if x < 0) >= 2:
-            trend = "slightly_decreasing"
-
-    # 计算趋势置信度
-    if trend in ["increasing", "decreasing"]:
-        confidence = 0.8
-    elif trend in ["slightly_increasing", "slightly_decreasing"]:
-        confidence = 0.6
-    else:
-        confidence = 0.4
+    trend, confidence = classify_trend(window_inflows)
 
     # 判断价格所处阶段
     price_stage = "unknown"
     if len(klines_data) >= 20:
-        recent_prices = [k["close"] for k in klines_data[-20:]]
-        price_changes = [recent_prices[i] - recent_prices[i - 1] for i in range(1, len(recent_prices))]
+        recent_prices = klines_data.close[-20:]
+        price_changes = np.diff(recent_prices)
 
         # 计算价格变化的移动平均
-        price_ma = sum(recent_prices) / len(recent_prices)
-        latest_price = recent_prices[-1]
+        price_ma = float(_sequential_sum(recent_prices)) / len(recent_prices)
+        latest_price = float(recent_prices[-1])
 
         # 计算价格波动率
         price_volatility = np.std(price_changes) / price_ma if price_ma > 0 else 0
 
         # 判断价格阶段
-        if latest_price > price_ma * 1.05 and trend in ["increasing", "slightly_increasing"]:
-            price_stage = "上涨中"
-        elif latest_price < price_ma * 0.95 and trend in ["decreasing", "slightly_decreasing"]:
-            price_stage = "下跌中"
-        elif price_volatility < 0.01 and abs(latest_price - price_ma) / price_ma < 0.02:
-            price_stage = "整理中"
-        elif latest_price > price_ma * 1.08 and trend in ["decreasing", "slightly_decreasing"]:
-            price_stage = "可能顶部"
-        elif latest_price < price_ma * 0.92 and trend in ["increasing", "slightly_increasing"]:
-            price_stage = "可能底部"
-        else:
-            price_stage = "波动中"
+        price_stage = classify_price_stage(latest_price, price_ma, price_volatility, trend)
 
     return {
         "trend": trend,
@@ -91,7 +111,7 @@ def analyze_funding_flow_trend(klines_data, window_size=10):
     }
 
 
-def detect_anomalies(klines_data, window_size=10, threshold=2.0):
+def detect_anomalies(klines_data, window_size=10, threshold=2.0, max_results=5):
     """检测异常交易"""
     if not klines_data or len(klines_data) < window_size * 2:
         return {
@@ -99,55 +119,58 @@ def detect_anomalies(klines_data, window_size=10, threshold=2.0):
             "anomalies": []
         }
 
-    anomalies = []
-
     # 计算成交量和净流入的均值和标准差
-    volumes = [k["volume"] for k in klines_data]
-    inflows = [k["net_inflow"] for k in klines_data]
+    volumes = klines_data.volume
+    inflows = klines_data.net_inflow
+    price_changes = klines_data.price_change_pct
 
     volume_mean = np.mean(volumes)
     volume_std = np.std(volumes)
     inflow_mean = np.mean(inflows)
     inflow_std = np.std(inflows)
 
-    # 检测异常成交量和净流入
-    for i, kline in enumerate(klines_data):
+    # 计算所有K线的z-score
+    volume_z_scores = (volumes - volume_mean) / volume_std if volume_std > 0 else np.zeros_like(volumes)
+    inflow_z_scores = (inflows - inflow_mean) / inflow_std if inflow_std > 0 else np.zeros_like(inflows)
+
+    # 异常成交量、异常净流入，以及价格和成交量不匹配的情况
+    volume_mask = np.abs(volume_z_scores) > threshold
+    inflow_mask = np.abs(inflow_z_scores) > threshold
+    mismatch_mask = (np.abs(price_changes) > 1.0) & (volume_z_scores < 0)
+
+    anomaly_indices = np.flatnonzero(volume_mask | inflow_mask | mismatch_mask)
+
+    # 只为最近的异常构建结果
+    anomalies = []
+    for i in anomaly_indices[-max_results:]:
         anomaly = {}
 
-        # 检测异常成交量
-        volume_z_score = (kline["volume"] - volume_mean) / volume_std if volume_std > 0 else 0
-        if abs(volume_z_score) > threshold:
+        if volume_mask[i]:
             anomaly["volume"] = {
-                "value": kline["volume"],
-                "z_score": volume_z_score,
-                "direction": "high" if volume_z_score > 0 else "low"
+                "value": float(volumes[i]),
+                "z_score": float(volume_z_scores[i]),
+                "direction": "high" if volume_z_scores[i] > 0 else "low"
             }
 
-        # 检测异常净流入
-        inflow_z_score = (kline["net_inflow"] - inflow_mean) / inflow_std if inflow_std > 0 else 0
-        if abs(inflow_z_score) > threshold:
+        if inflow_mask[i]:
             anomaly["net_inflow"] = {
-                "value": kline["net_inflow"],
-                "z_score": inflow_z_score,
-                "direction": "high" if inflow_z_score > 0 else "low"
+                "value": float(inflows[i]),
+                "z_score": float(inflow_z_scores[i]),
+                "direction": "high" if inflow_z_scores[i] > 0 else "low"
             }
 
-        # 检测价格和成交量不匹配的情况
-        price_change = kline["price_change_pct"]
-        if abs(price_change) > 1.0 and volume_z_score < 0:
+        if mismatch_mask[i]:
             anomaly["price_volume_mismatch"] = {
-                "price_change": price_change,
-                "volume_z_score": volume_z_score
+                "price_change": float(price_changes[i]),
+                "volume_z_score": float(volume_z_scores[i])
             }
 
-        # 如果存在异常，添加到列表
-        if anomaly:
-            anomaly["time"] = kline["close_time"]
-            anomalies.append(anomaly)
+        anomaly["time"] = helpers.format_timestamp_ms(klines_data.close_time[i])
+        anomalies.append(anomaly)
 
     return {
-        "has_anomalies": len(anomalies) > 0,
-        "anomalies": anomalies[-5:] if anomalies else []  # 只返回最近的5个异常
+        "has_anomalies": len(anomaly_indices) > 0,
+        "anomalies": anomalies  # 只返回最近的异常
     }
 
 
@@ -164,9 +187,8 @@ def analyze_funding_pressure(klines_data, orderbook_stats):
     imbalance = orderbook_stats["imbalance"]
 
     # 获取最近的价格变化
-    recent_klines = klines_data[-5:] if len(klines_data) >= 5 else klines_data
-    recent_price_changes = [k["price_change_pct"] for k in recent_klines]
-    avg_price_change = sum(recent_price_changes) / len(recent_price_changes) if recent_price_changes else 0
+    recent_price_changes = klines_data.price_change_pct[-5:]
+    avg_price_change = float(_sequential_sum(recent_price_changes)) / len(recent_price_changes)
 
     # 判断资金压力方向
     pressure_direction = "neutral"
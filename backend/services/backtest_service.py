@@ -0,0 +1,218 @@
+"""
+回测服务
+将本地归档的K线逐根回放给增量分析器（与分析接口的趋势和价格阶段判定一致），
+记录每根K线收盘时的信号及之后若干根K线的收益，统计各信号的命中率。
+
+每个(交易对, 市场)在独立进程中回放，进程只返回汇总计数，结果在主进程中合并。
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+from backend.services import kline_archive
+from backend.services.indicators import IncrementalAnalyzer, INDICATOR_WINDOW
+from backend.utils import helpers
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 回测进程数，默认为CPU核数
+BACKTEST_MAX_WORKERS = int(os.getenv("BACKTEST_MAX_WORKERS", "0")) or os.cpu_count() or 1
+
+# 信号取值及其预期方向（1看涨，-1看跌，0不判断方向）
+SIGNALS = {
+    "trend": {
+        "increasing": 1,
+        "slightly_increasing": 1,
+        "neutral": 0,
+        "slightly_decreasing": -1,
+        "decreasing": -1
+    },
+    "price_stage": {
+        "上涨中": 1,
+        "可能底部": 1,
+        "整理中": 0,
+        "波动中": 0,
+        "可能顶部": -1,
+        "下跌中": -1
+    },
+    "anomaly": {
+        "net_inflow_high": 1,
+        "net_inflow_low": -1,
+        "volume_only": 0
+    }
+}
+
+
+def _anomaly_signal(anomaly):
+    """将异常信息归类为信号取值，没有异常时返回None"""
+    if not anomaly:
+        return None
+    if "net_inflow" in anomaly:
+        return f"net_inflow_{anomaly['net_inflow']['direction']}"
+    return "volume_only"
+
+
+def _check_horizons(horizons):
+    """持有期必须是正整数（K线数量）"""
+    invalid = [horizon for horizon in horizons if int(horizon) != horizon or horizon <= 0]
+    if invalid:
+        raise ValueError(f"持有期必须是正整数: {invalid}")
+
+
+def _replay(records, window):
+    """逐根回放归档记录，返回每根K线收盘时各信号的取值编号（-1表示无信号）
+
+    所有滚动窗口填满（analyzer.warmup根K线）之前的K线不记录信号。
+    """
+    analyzer = IncrementalAnalyzer(window=window)
+    codes = {name: np.full(len(records), -1, dtype=np.int8) for name in SIGNALS}
+    lookup = {name: {value: index for index, value in enumerate(values)} for name, values in SIGNALS.items()}
+
+    fields = ("close_time", "open", "close", "volume", "quote_volume", "taker_buy_volume", "taker_buy_quote_volume")
+    for i, bar in enumerate(zip(*(records[field].tolist() for field in fields))):
+        anomaly = analyzer.push(*bar)
+        if analyzer.count < analyzer.warmup:
+            continue
+
+        trend = analyzer.funding_trend()
+        codes["trend"][i] = lookup["trend"].get(trend["trend"], -1)
+        codes["price_stage"][i] = lookup["price_stage"].get(trend["price_stage"], -1)
+        signal = _anomaly_signal(anomaly)
+        if signal is not None:
+            codes["anomaly"][i] = lookup["anomaly"][signal]
+
+    return codes
+
+
+def _signal_counts(codes, close, horizons):
+    """按信号取值统计各持有期的样本数、收益之和与命中数"""
+    counts = {}
+    for name, values in SIGNALS.items():
+        directions = np.array(list(values.values()), dtype=np.float64)
+        counts[name] = {}
+        for horizon in horizons:
+            if len(close) <= horizon:
+                continue
+            forward = close[horizon:] / close[:-horizon] - 1
+            signal = codes[name][:-horizon]
+            valid = signal >= 0
+            signal = signal[valid]
+            forward = forward[valid]
+
+            size = len(directions)
+            hits = (np.sign(forward) * directions[signal]) > 0
+            counts[name][horizon] = {
+                "count": np.bincount(signal, minlength=size).tolist(),
+                "return_sum": np.bincount(signal, weights=forward, minlength=size).tolist(),
+                "hits": np.bincount(signal, weights=hits, minlength=size).tolist()
+            }
+    return counts
+
+
+def backtest_symbol(symbol, interval, is_futures=False, start_time=None, end_time=None,
+                    horizons=(1, 5, 10), window=INDICATOR_WINDOW):
+    """回测单个交易对和市场，返回原始计数（可在进程间传递并合并）"""
+    _check_horizons(horizons)
+    interval_ms = helpers.interval_to_ms(interval)
+    # 多读取预热所需的K线，使start_time处的第一根K线已经填满所有滚动窗口
+    warmup = IncrementalAnalyzer(window=window).warmup
+    warmup_start = None if start_time is None else start_time - (warmup - 1) * interval_ms
+    records = kline_archive.get_records(symbol, interval, is_futures, warmup_start, end_time)
+
+    codes = _replay(records, window)
+    return {
+        "symbol": symbol,
+        "market": "futures" if is_futures else "spot",
+        "bars": max(len(records) - warmup + 1, 0),
+        "first_time": helpers.format_timestamp_ms(records["open_time"][0]) if len(records) else None,
+        "last_time": helpers.format_timestamp_ms(records["close_time"][-1]) if len(records) else None,
+        "counts": _signal_counts(codes, np.asarray(records["close"]), horizons)
+    }
+
+
+def _merge_counts(total, counts):
+    """合并两份原始计数"""
+    for name, by_horizon in counts.items():
+        for horizon, stats in by_horizon.items():
+            target = total.setdefault(name, {}).setdefault(horizon, {
+                key: [0.0] * len(values) for key, values in stats.items()
+            })
+            for key, values in stats.items():
+                target[key] = [a + b for a, b in zip(target[key], values)]
+    return total
+
+
+def _summarize(counts):
+    """将原始计数转换为各信号取值的样本数、平均收益(%)和命中率"""
+    summary = {}
+    for name, by_horizon in counts.items():
+        values = list(SIGNALS[name].items())
+        summary[name] = {}
+        for horizon, stats in by_horizon.items():
+            summary[name][str(horizon)] = {
+                value: {
+                    "count": int(stats["count"][i]),
+                    "mean_return_pct": stats["return_sum"][i] / stats["count"][i] * 100 if stats["count"][i] else None,
+                    # 无方向的信号不计算命中率
+                    "hit_rate": stats["hits"][i] / stats["count"][i] if stats["count"][i] and direction else None
+                }
+                for i, (value, direction) in enumerate(values)
+            }
+    return summary
+
+
+def run_backtest(symbols, interval="1h", markets=("spot", "futures"), start_time=None, end_time=None,
+                 horizons=(1, 5, 10), window=INDICATOR_WINDOW, max_workers=None):
+    """在进程池中回测多个交易对，返回各交易对及汇总的信号统计
+
+    需要先用 tools/kline_backfill.py 回补归档数据。持有期不是正整数时抛出ValueError。
+    """
+    _check_horizons(horizons)
+    begin = datetime.now()
+    tasks = [(symbol, market == "futures") for symbol in symbols for market in markets]
+    results = {}
+    errors = {}
+    total = {}
+
+    with ProcessPoolExecutor(max_workers=min(max_workers or BACKTEST_MAX_WORKERS, len(tasks)) or 1) as executor:
+        futures = {
+            executor.submit(backtest_symbol, symbol, interval, is_futures, start_time, end_time,
+                            tuple(horizons), window): (symbol, is_futures)
+            for symbol, is_futures in tasks
+        }
+        for future in as_completed(futures):
+            symbol, is_futures = futures[future]
+            market = "futures" if is_futures else "spot"
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"回测 {market} {symbol} 失败: {e}")
+                errors.setdefault(symbol, {})[market] = str(e)
+                continue
+
+            _merge_counts(total, result["counts"])
+            results.setdefault(symbol, {})[market] = {
+                "bars": result["bars"],
+                "first_time": result["first_time"],
+                "last_time": result["last_time"],
+                "signals": _summarize(result["counts"])
+            }
+
+    return {
+        "interval": interval,
+        "horizons": list(horizons),
+        "window": window,
+        "results": results,
+        "summary": _summarize(total),
+        "errors": errors,
+        "metadata": {
+            "bars": sum(market["bars"] for symbol in results.values() for market in symbol.values()),
+            "duration": (datetime.now() - begin).total_seconds()
+        }
+    }
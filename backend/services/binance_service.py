@@ -5,146 +5,222 @@
 
 import requests
 import logging
-from datetime import datetime
 import os
-from urllib.parse import quote_plus
+import time
+
+from backend.utils import helpers, http_client, async_http_client, metrics, rate_limiter
+from backend.utils.cache import call_async, get_cache
+from backend.utils.klines import Klines
+from backend.services.orderbook import OrderBook
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # 设置API密钥和URL
-BINANCE_API_URL = "https://api.binance.com"
-BINANCE_FUTURES_API_URL = "https://fapi.binance.com"
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com")
+BINANCE_FUTURES_API_URL = os.getenv("BINANCE_FUTURES_API_URL", "https://fapi.binance.com")
 BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
 BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET")
 
-# 代理设置
-USE_PROXY = os.getenv("USE_PROXY", "False").lower() == "true"
-HTTP_PROXY = os.getenv("HTTP_PROXY")
-HTTPS_PROXY = os.getenv("HTTPS_PROXY")
-PROXY_USERNAME = os.getenv("PROXY_USERNAME")
-PROXY_PASSWORD = os.getenv("PROXY_PASSWORD")
-
-def get_proxies():
-    """获取代理设置"""
-    if not USE_PROXY:
-        return None
-        
-    proxies = {}
-    
-    # 处理HTTP代理
-    if HTTP_PROXY:
-        if PROXY_USERNAME and PROXY_PASSWORD:
-            # 如果提供了用户名和密码，构建带认证的代理URL
-            username = quote_plus(PROXY_USERNAME)
-            password = quote_plus(PROXY_PASSWORD)
-            proxy_url = HTTP_PROXY.replace("://", f"://{username}:{password}@")
-            proxies['http'] = proxy_url
-        else:
-            proxies['http'] = HTTP_PROXY
-            
-    # 处理HTTPS代理
-    if HTTPS_PROXY:
-        if PROXY_USERNAME and PROXY_PASSWORD:
-            # 如果提供了用户名和密码，构建带认证的代理URL
-            username = quote_plus(PROXY_USERNAME)
-            password = quote_plus(PROXY_PASSWORD)
-            proxy_url = HTTPS_PROXY.replace("://", f"://{username}:{password}@")
-            proxies['https'] = proxy_url
-        else:
-            proxies['https'] = HTTPS_PROXY
-        
-    if proxies:
-        # 在日志中隐藏密码
-        logged_proxies = {k: v.replace(PROXY_PASSWORD, '******') if PROXY_PASSWORD and v else v 
-                         for k, v in proxies.items()}
-        logger.info(f"使用代理: {logged_proxies}")
-    else:
-        logger.warning("USE_PROXY=True 但未配置代理地址")
-        
-    return proxies if proxies else None
+# K线缓存设置：已收盘的K线不会再变化，缓存到下一根K线收盘为止
+KLINE_CACHE_ENABLED = os.getenv("KLINE_CACHE_ENABLED", "True").lower() == "true"
+KLINE_CACHE_MAX_BARS = int(os.getenv("KLINE_CACHE_MAX_BARS", "1000"))
 
-def get_klines_data(symbol, interval="5m", limit=50, is_futures=False):
-    """获取K线数据"""
+# 订单簿统计缓存时间（秒），合并短时间内对同一订单簿的重复请求，0表示不缓存
+ORDERBOOK_CACHE_TTL = float(os.getenv("ORDERBOOK_CACHE_TTL", "5"))
+
+# 逐笔成交资金流设置：统计最近几根已收盘K线、最多翻页次数（每页1000笔）和大单阈值（计价货币）
+TRADE_FLOW_BARS = int(os.getenv("TRADE_FLOW_BARS", "3"))
+TRADE_FLOW_MAX_PAGES = int(os.getenv("TRADE_FLOW_MAX_PAGES", "20"))
+TRADE_FLOW_LARGE_QUOTE = float(os.getenv("TRADE_FLOW_LARGE_QUOTE", "100000"))
+
+# 全市场24小时行情缓存时间（秒），该接口权重较高（现货80、期货40）
+TICKER_CACHE_TTL = float(os.getenv("TICKER_CACHE_TTL", "30"))
+
+
+def _binance_headers():
+    """构建币安API请求头"""
+    headers = {}
+    if BINANCE_API_KEY:
+        headers["X-MBX-APIKEY"] = BINANCE_API_KEY
+    return headers
+
+
+def _binance_get(endpoint, params, is_futures):
+    """发送币安GET请求，请求前按接口权重预留预算，请求后用响应头校准已用权重"""
+    base_url = BINANCE_FUTURES_API_URL if is_futures else BINANCE_API_URL
+    family = "futures" if is_futures else "spot"
+
+    with metrics.span("binance.weight_wait"):
+        rate_limiter.acquire(family, rate_limiter.request_weight(family, endpoint, params))
+    start = time.perf_counter()
     try:
-        base_url = BINANCE_FUTURES_API_URL if is_futures else BINANCE_API_URL
-        endpoint = "/fapi/v1/klines" if is_futures else "/api/v3/klines"
-
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "limit": limit + 1  # 多获取一根，用于计算最后一根的变化
-        }
-
-        # 添加代理支持
-        proxies = get_proxies()
-        
-        headers = {}
-        if BINANCE_API_KEY:
-            headers["X-MBX-APIKEY"] = BINANCE_API_KEY
-
-        response = requests.get(
+        response = http_client.get(
             f"{base_url}{endpoint}",
             params=params,
-            proxies=proxies,
-            headers=headers,
+            headers=_binance_headers(),
             timeout=10  # 添加超时设置
         )
-        response.raise_for_status()
+    except Exception:
+        metrics.observe_upstream("binance", endpoint, "error", time.perf_counter() - start)
+        raise
+    metrics.observe_upstream("binance", endpoint, response.status_code, time.perf_counter() - start)
+    rate_limiter.observe(family, response)
+    response.raise_for_status()
+    return response
+
+
+async def _binance_get_async(endpoint, params, is_futures):
+    """_binance_get的异步版本（ASGI模式）"""
+    base_url = BINANCE_FUTURES_API_URL if is_futures else BINANCE_API_URL
+    family = "futures" if is_futures else "spot"
+
+    with metrics.span("binance.weight_wait"):
+        await rate_limiter.acquire_async(family, rate_limiter.request_weight(family, endpoint, params))
+    start = time.perf_counter()
+    try:
+        response = await async_http_client.get(
+            f"{base_url}{endpoint}",
+            params=params,
+            headers=_binance_headers(),
+            timeout=10
+        )
+    except Exception:
+        metrics.observe_upstream("binance", endpoint, "error", time.perf_counter() - start)
+        raise
+    metrics.observe_upstream("binance", endpoint, response.status_code, time.perf_counter() - start)
+    await call_async(rate_limiter.observe, family, response)
+    response.raise_for_status()
+    return response
+
+
+def _klines_request(symbol, interval, limit, is_futures, start_time=None):
+    """K线请求的接口路径和参数"""
+    endpoint = "/fapi/v1/klines" if is_futures else "/api/v3/klines"
+
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "limit": limit
+    }
+    if start_time is not None:
+        params["startTime"] = start_time
+    return endpoint, params
+
+
+def _request_klines(symbol, interval, limit, is_futures, start_time=None):
+    """请求原始K线数据（包含最后一根未完成的K线）"""
+    endpoint, params = _klines_request(symbol, interval, limit, is_futures, start_time)
+    return _binance_get(endpoint, params, is_futures).json()
+
+
+async def _request_klines_async(symbol, interval, limit, is_futures, start_time=None):
+    """_request_klines的异步版本"""
+    endpoint, params = _klines_request(symbol, interval, limit, is_futures, start_time)
+    return (await _binance_get_async(endpoint, params, is_futures)).json()
+
+
+def _klines_cache_key(symbol, interval, is_futures):
+    return f"klines:{'futures' if is_futures else 'spot'}:{symbol}:{interval}"
+
+
+def _plan_klines(entry, interval, limit, now_ms):
+    """根据缓存条目决定如何获取K线
+
+    返回 (rows, None) 表示直接使用缓存；返回 (None, (数量, 开始时间)) 表示需要请求，
+    开始时间不为空时只增量获取自上次缓存以来新收盘的K线。
+    """
+    if entry and len(entry["rows"]) >= limit:
+        if now_ms < entry["expires_at"]:
+            return entry["rows"][-limit:], None
+
+        # 计算自上次缓存以来新收盘的K线数量，不超过请求数量时增量获取
+        interval_ms = helpers.interval_to_ms(interval)
+        last_open_time = entry["rows"][-1][0]
+        missing = (now_ms - entry["expires_at"]) // interval_ms + 1
+        if missing < limit:
+            return None, (missing + 1, last_open_time + interval_ms)
+
+    # 多获取一根，用于剔除最后一根未完成的K线
+    return None, (limit + 1, None)
+
+
+def _merge_klines(cache_key, entry, klines, interval, limit, now_ms):
+    """合并请求到的K线并写入缓存，entry为空时整体替换"""
+    if entry:
+        last_open_time = entry["rows"][-1][0]
+        new_rows = [k for k in klines[:-1] if k[0] > last_open_time]
+        rows = (entry["rows"] + new_rows)[-KLINE_CACHE_MAX_BARS:]
+    else:
+        rows = klines[:-1]
+    # 最后一根为未完成K线，其收盘时间即为缓存的过期时间
+    expires_at = klines[-1][6] + 1 if klines else now_ms
+    _store_klines(cache_key, rows, expires_at, interval)
+    return rows[-limit:]
+
+
+def get_closed_klines(symbol, interval, limit, is_futures):
+    """获取已收盘的原始K线，优先使用缓存，过期后只增量获取新K线"""
+    cache_key = _klines_cache_key(symbol, interval, is_futures)
+    now_ms = helpers.get_current_time_ms()
+
+    entry = get_cache().get(cache_key) if KLINE_CACHE_ENABLED else None
+    rows, request = _plan_klines(entry, interval, limit, now_ms)
+    if KLINE_CACHE_ENABLED:
+        metrics.cache_lookup("klines", rows is not None)
+    if rows is not None:
+        return rows
+    count, start_time = request
+
+    klines = _request_klines(symbol, interval, count, is_futures, start_time=start_time)
+    return _merge_klines(cache_key, entry if start_time is not None else None, klines, interval, limit, now_ms)
+
+
+async def get_closed_klines_async(symbol, interval, limit, is_futures):
+    """get_closed_klines的异步版本，与同步版本共用缓存（缓存读写不阻塞事件循环）"""
+    cache_key = _klines_cache_key(symbol, interval, is_futures)
+    now_ms = helpers.get_current_time_ms()
+
+    entry = await call_async(get_cache().get, cache_key) if KLINE_CACHE_ENABLED else None
+    rows, request = _plan_klines(entry, interval, limit, now_ms)
+    if KLINE_CACHE_ENABLED:
+        metrics.cache_lookup("klines", rows is not None)
+    if rows is not None:
+        return rows
+    count, start_time = request
+
+    klines = await _request_klines_async(symbol, interval, count, is_futures, start_time=start_time)
+    return await call_async(_merge_klines, cache_key, entry if start_time is not None else None, klines, interval,
+                            limit, now_ms)
+
+
+def get_historical_klines(symbol, interval, start_time, limit=1000, is_futures=False):
+    """从start_time开始获取一页历史K线，只返回已收盘的K线"""
+    klines = _request_klines(symbol, interval, limit, is_futures, start_time=start_time)
+    now_ms = helpers.get_current_time_ms()
+    return [k for k in klines if k[6] < now_ms]
+
+
+def _store_klines(cache_key, rows, expires_at, interval):
+    """写入K线缓存
 
-        klines = response.json()
+    过期时间之后条目仍保留一段时间，以便下次刷新时只增量获取新K线，
+    直到缓存的K线全部滑出窗口为止。
+    """
+    if not KLINE_CACHE_ENABLED or not rows:
+        return
+    retention_ms = expires_at - helpers.get_current_time_ms() + helpers.interval_to_ms(interval) * len(rows)
+    get_cache().set(cache_key, {"rows": rows, "expires_at": expires_at}, ttl=max(retention_ms, 0) / 1000)
 
-        # 移除最后一根未完成的K线
-        klines = klines[:-1]
+
+def get_klines_data(symbol, interval="5m", limit=50, is_futures=False):
+    """获取K线数据，返回列式的Klines"""
+    try:
+        klines = get_closed_klines(symbol, interval, limit, is_futures)
 
         # 处理K线数据
-        processed_klines = []
-        for i, kline in enumerate(klines):
-            open_time = datetime.fromtimestamp(kline[0] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-            close_time = datetime.fromtimestamp(kline[6] / 1000).strftime('%Y-%m-%d %H:%M:%S')
-
-            open_price = float(kline[1])
-            high_price = float(kline[2])
-            low_price = float(kline[3])
-            close_price = float(kline[4])
-            volume = float(kline[5])
-            quote_asset_volume = float(kline[7])
-
-            # 计算买入和卖出量（简化估算）
-            if close_price >= open_price:
-                # 上涨K线，假设60%的成交量是买入
-                buy_volume = volume * 0.6
-                sell_volume = volume * 0.4
-            else:
-                # 下跌K线，假设40%的成交量是买入
-                buy_volume = volume * 0.4
-                sell_volume = volume * 0.6
-
-            # 计算净流入资金
-            net_inflow = (buy_volume - sell_volume) * close_price
-
-            # 计算价格变化百分比
-            price_change_pct = ((close_price - open_price) / open_price) * 100
-
-            processed_kline = {
-                "open_time": open_time,
-                "close_time": close_time,
-                "open": open_price,
-                "high": high_price,
-                "low": low_price,
-                "close": close_price,
-                "volume": volume,
-                "quote_volume": quote_asset_volume,
-                "buy_volume": buy_volume,
-                "sell_volume": sell_volume,
-                "net_inflow": net_inflow,
-                "price_change_pct": price_change_pct
-            }
-
-            processed_klines.append(processed_kline)
-
-        return processed_klines
+        return Klines.from_raw(klines)
 
     except requests.exceptions.RequestException as e:
         logger.error(f"获取K线数据出错: {e}")
@@ -154,74 +230,196 @@ def get_klines_data(symbol, interval="5m", limit=50, is_futures=False):
         raise Exception(f"获取{symbol} {interval}K线数据失败: {str(e)}")
 
 
+async def get_klines_data_async(symbol, interval="5m", limit=50, is_futures=False):
+    """get_klines_data的异步版本"""
+    try:
+        klines = await get_closed_klines_async(symbol, interval, limit, is_futures)
+        return Klines.from_raw(klines)
+    except Exception as e:
+        logger.error(f"获取K线数据出错: {e}")
+        raise Exception(f"获取{symbol} {interval}K线数据失败: {str(e)}")
+
+
+def _orderbook_cache_key(symbol, is_futures, limit):
+    return f"orderbook:{'futures' if is_futures else 'spot'}:{symbol}:{limit}"
+
+
 def get_orderbook_stats(symbol, is_futures=False, limit=1000):
     """获取订单簿数据并计算统计信息"""
+    cache_key = _orderbook_cache_key(symbol, is_futures, limit)
+    if ORDERBOOK_CACHE_TTL > 0:
+        cached = get_cache().get(cache_key)
+        metrics.cache_lookup("orderbook", cached is not None)
+        if cached is not None:
+            return cached
+
+    stats = _fetch_orderbook_stats(symbol, is_futures, limit)
+    if ORDERBOOK_CACHE_TTL > 0:
+        get_cache().set(cache_key, stats, ttl=ORDERBOOK_CACHE_TTL)
+    return stats
+
+
+async def get_orderbook_stats_async(symbol, is_futures=False, limit=1000):
+    """get_orderbook_stats的异步版本，与同步版本共用缓存（缓存读写不阻塞事件循环）"""
+    cache_key = _orderbook_cache_key(symbol, is_futures, limit)
+    if ORDERBOOK_CACHE_TTL > 0:
+        cached = await call_async(get_cache().get, cache_key)
+        metrics.cache_lookup("orderbook", cached is not None)
+        if cached is not None:
+            return cached
+
     try:
-        base_url = BINANCE_FUTURES_API_URL if is_futures else BINANCE_API_URL
-        endpoint = "/fapi/v1/depth" if is_futures else "/api/v3/depth"
+        endpoint, params = _depth_request(symbol, is_futures, limit)
+        orderbook = (await _binance_get_async(endpoint, params, is_futures)).json()
+        stats = OrderBook.from_snapshot(orderbook).stats()
+    except Exception as e:
+        logger.error(f"获取订单簿数据出错: {e}")
+        raise Exception(f"获取{symbol}订单簿数据失败: {str(e)}")
 
-        params = {
-            "symbol": symbol,
-            "limit": limit
-        }
+    if ORDERBOOK_CACHE_TTL > 0:
+        await call_async(get_cache().set, cache_key, stats, ttl=ORDERBOOK_CACHE_TTL)
+    return stats
 
-        # 添加代理支持
-        proxies = get_proxies()
-        headers = {}
-        if BINANCE_API_KEY:
-            headers["X-MBX-APIKEY"] = BINANCE_API_KEY
 
-        response = requests.get(
-            f"{base_url}{endpoint}",
-            params=params,
-            proxies=proxies,
-            headers=headers,
-            timeout=10
-        )
-        response.raise_for_status()
+def _depth_request(symbol, is_futures, limit):
+    """订单簿快照请求的接口路径和参数"""
+    endpoint = "/fapi/v1/depth" if is_futures else "/api/v3/depth"
+
+    params = {
+        "symbol": symbol,
+        "limit": limit
+    }
+    return endpoint, params
+
+
+def get_orderbook_snapshot(symbol, is_futures=False, limit=1000):
+    """请求原始订单簿快照"""
+    endpoint, params = _depth_request(symbol, is_futures, limit)
+    return _binance_get(endpoint, params, is_futures).json()
+
 
-        orderbook = response.json()
+def _fetch_orderbook_stats(symbol, is_futures=False, limit=1000):
+    """请求订单簿快照并计算统计信息"""
+    try:
+        orderbook = get_orderbook_snapshot(symbol, is_futures, limit)
 
         # 处理订单簿数据
-        bids = [[float(price), float(qty)] for price, qty in orderbook["bids"]]
-        asks = [[float(price), float(qty)] for price, qty in orderbook["asks"]]
-
-        # 计算买卖盘总量
-        total_bid_qty = sum(bid[1] for bid in bids)
-        total_ask_qty = sum(ask[1] for ask in asks)
-
-        # 计算买卖盘不平衡度
-        imbalance = (total_bid_qty - total_ask_qty) / (total_bid_qty + total_ask_qty) if (
-                total_bid_qty + total_ask_qty) > 0 else 0
-
-        # 计算买卖盘压力
-        bid_pressure = sum(bid[0] * bid[1] for bid in bids)
-        ask_pressure = sum(ask[0] * ask[1] for ask in asks)
-
-        # 计算买卖盘压力比
-        pressure_ratio = bid_pressure / ask_pressure if ask_pressure > 0 else float('inf')
-
-        # 计算价格范围
-        bid_prices = [bid[0] for bid in bids]
-        ask_prices = [ask[0] for ask in asks]
-
-        price_range = {
-            "highest_bid": max(bid_prices) if bid_prices else 0,
-            "lowest_ask": min(ask_prices) if ask_prices else 0,
-            "spread": min(ask_prices) - max(bid_prices) if bid_prices and ask_prices else 0,
-            "spread_pct": ((min(ask_prices) - max(bid_prices)) / max(bid_prices) * 100) if bid_prices and ask_prices else 0
-        }
-
-        return {
-            "total_bid_qty": total_bid_qty,
-            "total_ask_qty": total_ask_qty,
-            "imbalance": imbalance,
-            "bid_pressure": bid_pressure,
-            "ask_pressure": ask_pressure,
-            "pressure_ratio": pressure_ratio,
-            "price_range": price_range
-        }
+        return OrderBook.from_snapshot(orderbook).stats()
 
     except Exception as e:
         logger.error(f"获取订单簿数据出错: {e}")
-        raise Exception(f"获取{symbol}订单簿数据失败: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"获取{symbol}订单簿数据失败: {str(e)}")
+
+
+def get_24hr_tickers(is_futures=False):
+    """一次请求获取全市场所有交易对的24小时行情统计"""
+    cache_key = f"tickers:{'futures' if is_futures else 'spot'}:24hr"
+    if TICKER_CACHE_TTL > 0:
+        cached = get_cache().get(cache_key)
+        metrics.cache_lookup("tickers", cached is not None)
+        if cached is not None:
+            return cached
+
+    endpoint = "/fapi/v1/ticker/24hr" if is_futures else "/api/v3/ticker/24hr"
+    try:
+        tickers = _binance_get(endpoint, {}, is_futures).json()
+    except Exception as e:
+        logger.error(f"获取24小时行情出错: {e}")
+        raise Exception(f"获取{'期货' if is_futures else '现货'}24小时行情失败: {str(e)}")
+
+    if TICKER_CACHE_TTL > 0:
+        get_cache().set(cache_key, tickers, ttl=TICKER_CACHE_TTL)
+    return tickers
+
+
+def _iter_agg_trades(symbol, start_time, end_time, is_futures=False, max_pages=TRADE_FLOW_MAX_PAGES):
+    """按成交ID顺序逐页获取[start_time, end_time)内的归集成交，每次只保留一页数据
+
+    生成器的返回值（StopIteration.value）表示是否完整：读到end_time之后的成交或已没有更多成交时为True，
+    达到最大页数时为False。不依赖每页的成交数量判断是否结束。
+    """
+    endpoint = "/fapi/v1/aggTrades" if is_futures else "/api/v3/aggTrades"
+    params = {"symbol": symbol, "startTime": start_time, "limit": 1000}
+
+    for _ in range(max_pages):
+        trades = _binance_get(endpoint, params, is_futures).json()
+        if not trades:
+            return True
+
+        for trade in trades:
+            if trade["T"] >= end_time:
+                return True
+            yield trade
+
+        params = {"symbol": symbol, "fromId": trades[-1]["a"] + 1, "limit": 1000}
+    return False
+
+
+def get_trade_flow(symbol, interval="1h", bars=TRADE_FLOW_BARS, is_futures=False, max_pages=TRADE_FLOW_MAX_PAGES):
+    """按逐笔成交统计最近bars根已收盘K线的资金净流入，并单独统计大单净流入
+
+    逐笔成交汇总后的净流入与K线的主动买入字段一致，这里额外提供K线无法给出的大单资金流。
+    数据逐页流式累加到每根K线的计数器中，内存占用与成交笔数无关。结果缓存到当前K线收盘。
+    """
+    interval_ms = helpers.interval_to_ms(interval)
+    now_ms = helpers.get_current_time_ms()
+    end_time = now_ms - now_ms % interval_ms
+    start_time = end_time - bars * interval_ms
+
+    cache_key = f"trade_flow:{'futures' if is_futures else 'spot'}:{symbol}:{interval}:{bars}:{max_pages}"
+    cached = get_cache().get(cache_key)
+    metrics.cache_lookup("trade_flow", cached is not None and cached["end_time"] == end_time)
+    if cached is not None and cached["end_time"] == end_time:
+        return cached
+
+    net_inflow = [0.0] * bars
+    large_net_inflow = [0.0] * bars
+    trade_count = 0
+    large_quote = 0.0
+    total_quote = 0.0
+    last_trade_time = None
+
+    try:
+        trades = _iter_agg_trades(symbol, start_time, end_time, is_futures, max_pages)
+        while True:
+            try:
+                trade = next(trades)
+            except StopIteration as stop:
+                # 达到翻页上限时只统计到了最后一页的成交时间
+                complete = stop.value
+                break
+
+            quote = float(trade["p"]) * float(trade["q"])
+            # m为True表示买方是挂单方，即主动卖出
+            signed = -quote if trade["m"] else quote
+            index = (trade["T"] - start_time) // interval_ms
+
+            net_inflow[index] += signed
+            if quote >= TRADE_FLOW_LARGE_QUOTE:
+                large_net_inflow[index] += signed
+                large_quote += quote
+            total_quote += quote
+            trade_count += 1
+            last_trade_time = trade["T"]
+    except requests.exceptions.RequestException as e:
+        logger.error(f"获取逐笔成交数据出错: {e}")
+        raise Exception(f"获取{symbol}逐笔成交数据失败: {str(e)}")
+    except Exception as e:
+        logger.error(f"处理逐笔成交数据出错: {e}")
+        raise Exception(f"获取{symbol}逐笔成交数据失败: {str(e)}")
+
+    flow = {
+        "bars": bars,
+        "end_time": end_time,
+        "complete": complete,
+        "covered_until": helpers.format_timestamp_ms(last_trade_time) if last_trade_time else None,
+        "trade_count": trade_count,
+        "net_inflow": sum(net_inflow),
+        "large_net_inflow": sum(large_net_inflow),
+        "large_trade_threshold": TRADE_FLOW_LARGE_QUOTE,
+        "large_trade_ratio": large_quote / total_quote if total_quote > 0 else 0,
+        "net_inflow_by_bar": net_inflow,
+        "large_net_inflow_by_bar": large_net_inflow
+    }
+    get_cache().set(cache_key, flow, ttl=(end_time + interval_ms - now_ms) / 1000)
+    return flow
@@ -0,0 +1,287 @@
+"""
+增量指标服务
+在每根K线收盘时以O(1)的代价更新资金流向趋势和异常检测所需的统计量：
+滚动求和使用环形缓冲区，滚动均值/方差使用滑动窗口版的Welford算法。
+
+与 analysis_service 的批量计算相比，异常是在每根K线到达时用当时窗口的均值和标准差判定的，
+之后窗口滑动也不会重新评估已经判定过的K线。
+"""
+
+import os
+import math
+import logging
+import threading
+from collections import deque
+
+from backend.services import analysis_service
+from backend.utils import helpers
+from backend.utils.klines import derive_flow
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 增量分析的窗口长度（K线数量），与分析接口默认获取的K线数量一致
+INDICATOR_WINDOW = int(os.getenv("INDICATOR_WINDOW", "50"))
+
+_analyzers = {}
+_analyzers_lock = threading.Lock()
+
+
+class RollingSum:
+    """固定长度的滚动求和（环形缓冲区）"""
+
+    __slots__ = ("size", "_buffer", "_pos", "_count", "_evictions", "total")
+
+    def __init__(self, size):
+        self.size = size
+        self._buffer = [0.0] * size
+        self._pos = 0
+        self._count = 0
+        self._evictions = 0
+        self.total = 0.0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        return self._count == self.size
+
+    def push(self, value):
+        """加入新值，窗口已满时返回被移出的旧值，否则返回None"""
+        evicted = None
+        if self.full:
+            evicted = self._buffer[self._pos]
+            self.total += value - evicted
+            self._evictions += 1
+        else:
+            self._count += 1
+            self.total += value
+        self._buffer[self._pos] = value
+        self._pos = (self._pos + 1) % self.size
+
+        # 每滑动一整个窗口精确重算一次，避免浮点误差累积（均摊O(1)）
+        if self._evictions >= self.size:
+            self.total = math.fsum(self.values())
+            self._evictions = 0
+        return evicted
+
+    def values(self):
+        """按时间顺序返回窗口内的值"""
+        if not self.full:
+            return self._buffer[:self._count]
+        return self._buffer[self._pos:] + self._buffer[:self._pos]
+
+
+class RollingStats:
+    """固定长度窗口的滚动均值和总体标准差（滑动窗口Welford算法）"""
+
+    __slots__ = ("_window", "mean", "_m2")
+
+    def __init__(self, size):
+        self._window = RollingSum(size)
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def __len__(self):
+        return len(self._window)
+
+    def push(self, value):
+        """加入新值并更新均值和方差"""
+        evicted = self._window.push(value)
+        count = len(self._window)
+        if evicted is None:
+            delta = value - self.mean
+            self.mean += delta / count
+            self._m2 += delta * (value - self.mean)
+        else:
+            old_mean = self.mean
+            self.mean += (value - evicted) / count
+            self._m2 += (value - evicted) * (value - self.mean + evicted - old_mean)
+
+        # 与RollingSum同步重算，消除累积误差
+        if self._window._evictions == 0 and evicted is not None:
+            values = self._window.values()
+            self.mean = math.fsum(values) / count
+            self._m2 = math.fsum((v - self.mean) ** 2 for v in values)
+
+    @property
+    def std(self):
+        count = len(self._window)
+        return math.sqrt(max(self._m2, 0.0) / count) if count else 0.0
+
+    def z_score(self, value):
+        std = self.std
+        return (value - self.mean) / std if std > 0 else 0.0
+
+
+class IncrementalAnalyzer:
+    """单个交易对、市场和周期的增量分析器，按收盘顺序逐根输入K线"""
+
+    # 价格阶段使用的K线数量
+    PRICE_WINDOW = 20
+
+    def __init__(self, window=INDICATOR_WINDOW, window_size=10, threshold=2.0, max_results=5):
+        self.window = window
+        self.window_size = window_size
+        self.threshold = threshold
+        self.count = 0
+        self.last_close_time = None
+
+        # 资金流向趋势
+        self._inflow_total = RollingSum(window)
+        self._inflow_recent = RollingSum(window_size)
+        self._window_inflows = deque(maxlen=3)
+
+        # 价格阶段（最近PRICE_WINDOW根K线）
+        self._closes = RollingSum(self.PRICE_WINDOW)
+        self._price_changes = RollingStats(self.PRICE_WINDOW - 1)
+        self._prev_close = None
+
+        # 异常检测
+        self._volume_stats = RollingStats(window)
+        self._inflow_stats = RollingStats(window)
+        # (K线序号, 异常信息)
+        self._anomalies = deque(maxlen=max_results)
+
+    @property
+    def warmup(self):
+        """所有滚动窗口都填满所需的K线数量，此前的趋势、价格阶段和异常基于不完整的窗口"""
+        return max(self.window, self.PRICE_WINDOW, self.window_size + self._window_inflows.maxlen - 1,
+                   self.window_size * 2)
+
+    def update(self, row):
+        """输入一根已收盘的币安原始K线，返回该K线的异常信息（没有异常时返回None）"""
+        return self.push(int(row[6]), float(row[1]), float(row[4]), float(row[5]), float(row[7]),
+                         float(row[9]), float(row[10]))
+
+    def push(self, close_time, open_price, close, volume, quote_volume, taker_buy_volume, taker_buy_quote_volume):
+        """按字段输入一根已收盘的K线，返回该K线的异常信息（没有异常时返回None）"""
+        _, _, inflow, price_change = derive_flow(open_price, close, volume, quote_volume,
+                                                 taker_buy_volume, taker_buy_quote_volume)
+
+        self.count += 1
+        self.last_close_time = close_time
+
+        self._inflow_total.push(inflow)
+        self._inflow_recent.push(inflow)
+        if self._inflow_recent.full:
+            self._window_inflows.append(self._inflow_recent.total)
+
+        if self._prev_close is not None:
+            self._price_changes.push(close - self._prev_close)
+        self._prev_close = close
+        self._closes.push(close)
+
+        self._volume_stats.push(volume)
+        self._inflow_stats.push(inflow)
+        return self._check_anomaly(volume, inflow, price_change)
+
+    def _check_anomaly(self, volume, inflow, price_change):
+        """用当前窗口的统计量判断最新K线是否异常"""
+        if len(self._volume_stats) < self.window_size * 2:
+            return None
+
+        volume_z = self._volume_stats.z_score(volume)
+        inflow_z = self._inflow_stats.z_score(inflow)
+
+        anomaly = {}
+        if abs(volume_z) > self.threshold:
+            anomaly["volume"] = {
+                "value": volume,
+                "z_score": volume_z,
+                "direction": "high" if volume_z > 0 else "low"
+            }
+        if abs(inflow_z) > self.threshold:
+            anomaly["net_inflow"] = {
+                "value": inflow,
+                "z_score": inflow_z,
+                "direction": "high" if inflow_z > 0 else "low"
+            }
+        if abs(price_change) > 1.0 and volume_z < 0:
+            anomaly["price_volume_mismatch"] = {
+                "price_change": price_change,
+                "volume_z_score": volume_z
+            }
+        if not anomaly:
+            return None
+
+        anomaly["time"] = helpers.format_timestamp_ms(self.last_close_time)
+        self._anomalies.append((self.count, anomaly))
+        return anomaly
+
+    def funding_trend(self):
+        """资金流向趋势，结构与 analysis_service.analyze_funding_flow_trend 一致"""
+        if len(self._inflow_total) < self.window_size:
+            return {
+                "trend": "unknown",
+                "confidence": 0,
+                "net_inflow_total": 0,
+                "net_inflow_recent": 0,
+                "price_stage": "unknown"
+            }
+
+        trend, confidence = analysis_service.classify_trend(list(self._window_inflows))
+
+        price_stage = "unknown"
+        if len(self._inflow_total) >= self.PRICE_WINDOW:
+            price_ma = self._closes.total / len(self._closes)
+            price_volatility = self._price_changes.std / price_ma if price_ma > 0 else 0
+            price_stage = analysis_service.classify_price_stage(self._prev_close, price_ma, price_volatility, trend)
+
+        return {
+            "trend": trend,
+            "confidence": confidence,
+            "net_inflow_total": self._inflow_total.total,
+            "net_inflow_recent": self._inflow_recent.total,
+            "price_stage": price_stage
+        }
+
+    def anomalies(self):
+        """窗口内最近的异常，结构与 analysis_service.detect_anomalies 一致"""
+        anomalies = [anomaly for index, anomaly in self._anomalies if self.count - index < self.window]
+        return {
+            "has_anomalies": len(anomalies) > 0,
+            "anomalies": anomalies
+        }
+
+
+def reset(market, symbol, interval, rows):
+    """用一段连续的已收盘K线重建分析器（回补K线后调用）"""
+    analyzer = IncrementalAnalyzer()
+    for row in rows:
+        analyzer.update(row)
+    with _analyzers_lock:
+        _analyzers[(market, symbol, interval)] = analyzer
+
+
+def on_bar_close(market, symbol, interval, row):
+    """输入一根新收盘的K线，返回异常信息（没有异常时返回None）"""
+    with _analyzers_lock:
+        analyzer = _analyzers.get((market, symbol, interval))
+        if analyzer is None:
+            analyzer = _analyzers[(market, symbol, interval)] = IncrementalAnalyzer()
+        anomaly = analyzer.update(row)
+
+    if anomaly:
+        logger.info(f"{market} {symbol} {interval} 检测到异常: {', '.join(k for k in anomaly if k != 'time')}")
+    return anomaly
+
+
+def get_snapshot(interval=None, market=None):
+    """返回所有增量分析器的当前结果"""
+    with _analyzers_lock:
+        return [
+            {
+                "market": key[0],
+                "symbol": key[1],
+                "interval": key[2],
+                "last_close_time": helpers.format_timestamp_ms(analyzer.last_close_time)
+                if analyzer.last_close_time is not None else None,
+                "funding_trend": analyzer.funding_trend(),
+                "anomalies": analyzer.anomalies()
+            }
+            for key, analyzer in sorted(_analyzers.items())
+            if (interval is None or key[2] == interval) and (market is None or key[0] == market)
+        ]
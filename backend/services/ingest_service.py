@@ -0,0 +1,478 @@
+"""
+行情数据采集服务
+订阅币安现货和期货的K线与增量深度WebSocket流，在内存中维护滚动K线窗口和本地同步的订单簿，
+分析时直接从内存读取，数据未就绪时由调用方回退到REST接口；
+每根K线收盘时同时更新 indicators 中的增量趋势和异常统计
+
+多个工作进程时通过共享缓存中的租约选出一个进程运行采集（需要使用 sqlite 或 redis 缓存后端），
+该进程把已收盘K线、订单簿统计和增量指标发布到共享缓存，其余进程从缓存读取，币安连接数和请求权重与工作进程数无关；
+采集进程退出后租约过期，由其他进程接手。
+
+测试时可将 BINANCE_WS_URL / BINANCE_FUTURES_WS_URL 指向 tools/ws_replay.py 启动的本地回放服务。
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+
+from websockets.sync.client import connect
+
+from backend.services import binance_service, indicators
+from backend.services.orderbook import OrderBook
+from backend.utils import helpers, rate_limiter
+from backend.utils.cache import get_cache
+from backend.utils.klines import Klines
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 采集配置
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "False").lower() == "true"
+INGEST_SYMBOLS = [s.strip().upper() for s in os.getenv("INGEST_SYMBOLS", "BTCUSDT,ETHUSDT").split(",") if s.strip()]
+INGEST_INTERVALS = [i.strip() for i in os.getenv("INGEST_INTERVALS", "1h").split(",") if i.strip()]
+INGEST_KLINE_WINDOW = int(os.getenv("INGEST_KLINE_WINDOW", "200"))
+INGEST_DEPTH_LIMIT = int(os.getenv("INGEST_DEPTH_LIMIT", "1000"))
+INGEST_RECONNECT_DELAY = float(os.getenv("INGEST_RECONNECT_DELAY", "5"))
+# 订单簿快照获取失败后重试的间隔（秒），以及等待快照期间最多缓存的深度事件数
+INGEST_SNAPSHOT_RETRY = float(os.getenv("INGEST_SNAPSHOT_RETRY", "10"))
+INGEST_DEPTH_BUFFER = int(os.getenv("INGEST_DEPTH_BUFFER", "1000"))
+# K线收盘后等待推送的宽限时间（毫秒），超过后认为内存数据已过期
+INGEST_KLINE_GRACE_MS = int(os.getenv("INGEST_KLINE_GRACE_MS", "10000"))
+# 采集进程租约的有效期（秒），以及向共享缓存发布订单簿统计的间隔（秒）
+INGEST_LEASE_TTL = float(os.getenv("INGEST_LEASE_TTL", "30"))
+INGEST_PUBLISH_INTERVAL = float(os.getenv("INGEST_PUBLISH_INTERVAL", "1"))
+
+# WebSocket地址
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+BINANCE_FUTURES_WS_URL = os.getenv("BINANCE_FUTURES_WS_URL", "wss://fstream.binance.com")
+
+_ingestors = {}
+_ingestors_lock = threading.Lock()
+_leader = None
+_leader_lock = threading.Lock()
+
+_LEADER_KEY = "ingest:leader"
+_WATCHLIST_KEY = "ingest:watchlist"
+
+
+def _klines_key(market, symbol, interval):
+    return f"ingest:klines:{market}:{symbol}:{interval}"
+
+
+def _book_key(market, symbol):
+    return f"ingest:book:{market}:{symbol}"
+
+
+def _publish(key, value, ttl):
+    """写入共享缓存，失败时只记录日志，不影响采集"""
+    try:
+        get_cache().set(key, value, ttl=ttl)
+    except Exception as e:
+        logger.error(f"发布采集数据 {key} 失败: {e}")
+
+
+def _unpublish(keys):
+    """删除已发布的数据，其他进程回退到REST接口"""
+    try:
+        cache = get_cache()
+        for key in keys:
+            cache.delete(key)
+    except Exception as e:
+        logger.error(f"清除已发布的采集数据失败: {e}")
+
+
+def _window_klines(rows, interval, limit):
+    """从K线窗口取最近limit根，数据不足或最后一根K线已过期时返回None"""
+    if not rows or len(rows) < limit:
+        return None
+    if helpers.get_current_time_ms() > rows[-1][6] + helpers.interval_to_ms(interval) + INGEST_KLINE_GRACE_MS:
+        return None
+    return Klines.from_raw(list(rows)[-limit:])
+
+
+class _DepthState:
+    """单个交易对的订单簿同步状态
+
+    快照在独立线程中获取，期间收到的增量事件暂存在buffer中，快照到达后依次应用；
+    generation在每次重置时递增，重置前发起的快照请求返回后直接丢弃。
+    """
+
+    def __init__(self):
+        self.book = OrderBook(max_depth=INGEST_DEPTH_LIMIT)
+        self.synced = False
+        self.prev_update_id = None
+        self.buffer = deque(maxlen=INGEST_DEPTH_BUFFER)
+        self.generation = 0
+        self.loading = False
+        self.retry_at = 0
+
+    def reset(self):
+        self.book = OrderBook(max_depth=INGEST_DEPTH_LIMIT)
+        self.synced = False
+        self.prev_update_id = None
+        self.buffer.clear()
+        self.generation += 1
+
+
+class MarketIngestor:
+    """单个市场（现货或期货）的WebSocket采集器，在后台线程中运行"""
+
+    def __init__(self, is_futures, symbols=None, intervals=None, ws_url=None):
+        self.is_futures = is_futures
+        self.market = "futures" if is_futures else "spot"
+        self.symbols = symbols or INGEST_SYMBOLS
+        self.intervals = intervals or INGEST_INTERVALS
+        self.ws_url = ws_url or (BINANCE_FUTURES_WS_URL if is_futures else BINANCE_WS_URL)
+
+        self._lock = threading.Lock()
+        self._klines = {(symbol, interval): deque(maxlen=INGEST_KLINE_WINDOW)
+                        for symbol in self.symbols for interval in self.intervals}
+        self._depth = {symbol: _DepthState() for symbol in self.symbols}
+        self._connected = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台采集线程和订单簿统计发布线程"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{self.market}", daemon=True)
+        self._thread.start()
+        threading.Thread(target=self._publish_books, name=f"ingest-{self.market}-publish", daemon=True).start()
+
+    def stop(self):
+        """停止采集"""
+        self._stop.set()
+
+    def stream_url(self):
+        """组合流订阅地址"""
+        streams = [f"{symbol.lower()}@kline_{interval}" for symbol in self.symbols for interval in self.intervals]
+        streams += [f"{symbol.lower()}@depth@100ms" for symbol in self.symbols]
+        return f"{self.ws_url}/stream?streams={'/'.join(streams)}"
+
+    def _run(self):
+        """连接WebSocket并处理消息，断开后自动重连"""
+        while not self._stop.is_set():
+            try:
+                with connect(self.stream_url(), open_timeout=10, max_size=None) as websocket:
+                    logger.info(f"{self.market} 行情流已连接: {', '.join(self.symbols)}")
+                    # 先建立连接再回补K线，期间推送的消息由连接缓存，不会丢失
+                    # 回补属于后台请求，不与分析接口争抢请求权重
+                    with rate_limiter.background():
+                        for key in self._klines:
+                            self._backfill_klines(*key)
+                    self._connected = True
+
+                    for message in websocket:
+                        if self._stop.is_set():
+                            break
+                        self._handle_message(json.loads(message))
+            except Exception as e:
+                logger.error(f"{self.market} 行情流连接异常: {e}")
+            finally:
+                self._connected = False
+                with self._lock:
+                    for state in self._depth.values():
+                        state.reset()
+                # 连接异常断开时清除已发布的数据；主动停止（失去租约）时接手的进程可能已经发布了新数据，不能清除
+                if not self._stop.is_set():
+                    _unpublish([_klines_key(self.market, *key) for key in self._klines] +
+                               [_book_key(self.market, symbol) for symbol in self.symbols])
+
+            self._stop.wait(INGEST_RECONNECT_DELAY)
+
+    def _backfill_klines(self, symbol, interval):
+        """通过REST接口回补K线窗口"""
+        rows = binance_service.get_closed_klines(symbol, interval, INGEST_KLINE_WINDOW, self.is_futures)
+        with self._lock:
+            window = self._klines[(symbol, interval)]
+            window.clear()
+            window.extend(rows)
+        indicators.reset(self.market, symbol, interval, rows)
+        self._publish_klines(symbol, interval, rows)
+        _publish_watchlist()
+
+    def _publish_klines(self, symbol, interval, rows):
+        """发布K线窗口，保留到下一根K线收盘后的宽限时间结束"""
+        ttl = (helpers.interval_to_ms(interval) * 2 + INGEST_KLINE_GRACE_MS) / 1000
+        _publish(_klines_key(self.market, symbol, interval), rows, ttl)
+
+    def _publish_books(self):
+        """每隔INGEST_PUBLISH_INTERVAL秒发布已同步交易对的订单簿统计，未同步的交易对到期后由其他进程回退到REST接口"""
+        while not self._stop.wait(INGEST_PUBLISH_INTERVAL):
+            for symbol in self.symbols:
+                stats = self.get_orderbook_stats(symbol)
+                if stats is not None:
+                    _publish(_book_key(self.market, symbol), stats, INGEST_PUBLISH_INTERVAL * 3)
+
+    def _handle_message(self, message):
+        """分发组合流消息"""
+        stream = message.get("stream", "")
+        data = message.get("data", {})
+        if "@kline_" in stream:
+            self._on_kline(data)
+        elif "@depth" in stream:
+            self._on_depth(data)
+
+    def _on_kline(self, data):
+        """处理K线推送，只保存已收盘的K线"""
+        kline = data["k"]
+        if not kline["x"]:
+            return
+
+        key = (kline["s"], kline["i"])
+        row = [kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"],
+               kline["T"], kline["q"], kline["n"], kline["V"], kline["Q"], "0"]
+
+        with self._lock:
+            window = self._klines.get(key)
+            if window is None or (window and row[0] <= window[-1][0]):
+                return
+            has_gap = bool(window) and row[0] != window[-1][0] + helpers.interval_to_ms(kline["i"])
+            if not has_gap:
+                window.append(row)
+                rows = list(window)
+
+        # 出现缺口（例如重连期间漏掉了K线）时重新回补；失败时保留原窗口（过期后分析回退到REST），下一根K线收盘时再试
+        if has_gap:
+            logger.warning(f"{self.market} {key[0]} {key[1]} K线出现缺口，重新回补")
+            try:
+                with rate_limiter.background():
+                    self._backfill_klines(*key)
+            except Exception as e:
+                logger.error(f"{self.market} {key[0]} {key[1]} K线回补失败: {e}")
+        else:
+            indicators.on_bar_close(self.market, key[0], key[1], row)
+            self._publish_klines(key[0], key[1], rows)
+            _publish_watchlist()
+
+    def _on_depth(self, data):
+        """处理增量深度推送，按币安文档的流程与REST快照同步
+
+        尚无快照时暂存事件并在独立线程中获取快照，不阻塞消息接收。
+        """
+        symbol = data["s"]
+        state = self._depth.get(symbol)
+        if state is None:
+            return
+
+        with self._lock:
+            if state.book.last_update_id is not None:
+                self._apply_depth_event(state, data)
+                return
+
+            state.buffer.append(data)
+            if state.loading or time.time() < state.retry_at:
+                return
+            state.loading = True
+            generation = state.generation
+
+        threading.Thread(target=self._load_snapshot, args=(symbol, state, generation),
+                         name=f"ingest-{self.market}-snapshot", daemon=True).start()
+
+    def _load_snapshot(self, symbol, state, generation):
+        """获取订单簿快照（后台请求）并应用暂存的事件；失败时只影响该交易对，间隔一段时间后重试"""
+        try:
+            with rate_limiter.background():
+                snapshot = binance_service.get_orderbook_snapshot(symbol, self.is_futures, INGEST_DEPTH_LIMIT)
+        except Exception as e:
+            logger.error(f"{self.market} {symbol} 订单簿快照获取失败，{INGEST_SNAPSHOT_RETRY} 秒后重试: {e}")
+            with self._lock:
+                state.loading = False
+                state.retry_at = time.time() + INGEST_SNAPSHOT_RETRY
+            return
+
+        with self._lock:
+            state.loading = False
+            if state.generation != generation:
+                # 获取期间连接断开或序号不连续已重置，丢弃该快照
+                return
+            state.book.apply_snapshot(snapshot)
+            events = list(state.buffer)
+            state.buffer.clear()
+            for event in events:
+                self._apply_depth_event(state, event)
+                if state.book.last_update_id is None:
+                    # 暂存的事件不连续，已重置，等待下一条事件重新获取快照
+                    break
+
+    def _apply_depth_event(self, state, event):
+        """应用一条增量深度事件，序号不连续时重置并等待重新同步"""
+        first_id, last_id = event["U"], event["u"]
+        snapshot_id = state.book.last_update_id
+
+        if not state.synced:
+            # 丢弃快照之前的事件；第一条事件必须覆盖快照的lastUpdateId
+            if self.is_futures:
+                if last_id < snapshot_id:
+                    return
+                in_sequence = first_id <= snapshot_id
+            else:
+                if last_id <= snapshot_id:
+                    return
+                in_sequence = first_id <= snapshot_id + 1
+        elif self.is_futures:
+            in_sequence = event["pu"] == state.prev_update_id
+        else:
+            in_sequence = first_id == state.prev_update_id + 1
+
+        if not in_sequence:
+            logger.warning(f"{self.market} {event['s']} 深度事件不连续，重新同步订单簿")
+            state.reset()
+            return
+
+        state.book.apply_update(event["b"], event["a"], last_id)
+        state.prev_update_id = last_id
+        state.synced = True
+
+    def get_klines(self, symbol, interval, limit):
+        """读取内存中的K线，数据不足或已过期时返回None"""
+        if not self._connected:
+            return None
+
+        with self._lock:
+            return _window_klines(self._klines.get((symbol, interval)), interval, limit)
+
+    def get_orderbook_stats(self, symbol):
+        """读取本地订单簿统计信息，未同步时返回None"""
+        if not self._connected:
+            return None
+
+        with self._lock:
+            state = self._depth.get(symbol)
+            if state is None or not state.synced:
+                return None
+            return state.book.stats()
+
+
+def _publish_watchlist():
+    """发布本进程增量分析器的结果，供其他进程的 /api/watchlist 读取"""
+    _publish(_WATCHLIST_KEY, indicators.get_snapshot(), INGEST_LEASE_TTL * 2)
+
+
+def _start_ingestors():
+    with _ingestors_lock:
+        for is_futures in (False, True):
+            if is_futures not in _ingestors:
+                ingestor = MarketIngestor(is_futures)
+                ingestor.start()
+                _ingestors[is_futures] = ingestor
+
+
+def _stop_ingestors():
+    with _ingestors_lock:
+        for ingestor in _ingestors.values():
+            ingestor.stop()
+        _ingestors.clear()
+
+
+class IngestLeader:
+    """采集进程选举：抢到共享缓存中租约的进程运行采集并定期续约，失去租约时停止采集"""
+
+    def __init__(self):
+        self.owner = uuid.uuid4().hex
+        self.leading = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台选举线程"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采集并释放租约"""
+        self._stop.set()
+        if self.leading:
+            self.leading = False
+            _stop_ingestors()
+            cache = get_cache()
+            if cache.get(_LEADER_KEY) == self.owner:
+                cache.delete(_LEADER_KEY)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._check()
+            except Exception as e:
+                logger.error(f"采集租约检查失败: {e}")
+            self._stop.wait(INGEST_LEASE_TTL / 3)
+
+    def _check(self):
+        """续约或尝试获取租约"""
+        cache = get_cache()
+        if self.leading:
+            if cache.get(_LEADER_KEY) == self.owner:
+                cache.set(_LEADER_KEY, self.owner, ttl=INGEST_LEASE_TTL)
+                _publish_watchlist()
+                return
+            logger.warning("采集租约已被其他进程获取，停止本进程的行情采集")
+            self.leading = False
+            _stop_ingestors()
+
+        if cache.add(_LEADER_KEY, self.owner, ttl=INGEST_LEASE_TTL):
+            logger.info(f"本进程（{os.getpid()}）获得采集租约，开始行情采集")
+            self.leading = True
+            _start_ingestors()
+
+
+def start():
+    """在每个工作进程中调用（线程无法跨fork继承），由抢到租约的进程运行现货和期货行情采集"""
+    global _leader
+
+    if not INGEST_ENABLED:
+        return
+
+    with _leader_lock:
+        if _leader is None:
+            _leader = IngestLeader()
+            _leader.start()
+
+
+def stop():
+    """停止行情采集"""
+    global _leader
+
+    with _leader_lock:
+        if _leader is not None:
+            _leader.stop()
+            _leader = None
+
+
+def _subscribed(symbol, interval=None):
+    return INGEST_ENABLED and symbol in INGEST_SYMBOLS and (interval is None or interval in INGEST_INTERVALS)
+
+
+def get_live_klines(symbol, interval, limit, is_futures=False):
+    """读取实时采集的K线（采集进程读内存，其他进程读共享缓存），未订阅或未就绪时返回None"""
+    ingestor = _ingestors.get(is_futures)
+    if ingestor:
+        return ingestor.get_klines(symbol, interval, limit)
+    if not _subscribed(symbol, interval):
+        return None
+    market = "futures" if is_futures else "spot"
+    return _window_klines(get_cache().get(_klines_key(market, symbol, interval)), interval, limit)
+
+
+def get_live_orderbook_stats(symbol, is_futures=False):
+    """读取本地同步订单簿的统计信息（其他进程读取采集进程最近发布的结果），未订阅或未同步时返回None"""
+    ingestor = _ingestors.get(is_futures)
+    if ingestor:
+        return ingestor.get_orderbook_stats(symbol)
+    if not _subscribed(symbol):
+        return None
+    return get_cache().get(_book_key("futures" if is_futures else "spot", symbol))
+
+
+def get_watchlist(interval=None, market=None):
+    """采集交易对的增量资金流向趋势和异常，结构与 indicators.get_snapshot 一致"""
+    if _ingestors:
+        return indicators.get_snapshot(interval=interval, market=market)
+    items = get_cache().get(_WATCHLIST_KEY) if INGEST_ENABLED else None
+    return [item for item in items or []
+            if (interval is None or item["interval"] == interval) and (market is None or item["market"] == market)]
@@ -0,0 +1,274 @@
+"""
+分析任务服务
+将分析请求放入有界工作线程池异步执行，并合并相同参数的进行中任务；
+ASGI模式下任务作为事件循环中的协程执行，不占用线程
+
+任务状态保存在共享缓存中，因此任意gunicorn工作进程都可以查询任务状态
+（多进程部署时需要使用 sqlite 或 redis 缓存后端，gunicorn.conf.py 在多个工作进程时默认使用 sqlite）。
+"""
+
+import os
+import time
+import asyncio
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services import pipeline_service
+from backend.utils import http_client, metrics
+from backend.utils.cache import call_async, get_cache
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 任务配置：每个进程的并发任务数、排队上限、任务超时（秒）和结果保留时间（秒）
+JOB_MAX_WORKERS = int(os.getenv("JOB_MAX_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "20"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# ASGI模式下每个进程同时进行的任务上限（任务在等待网络响应时不占用线程）
+JOB_MAX_ASYNC = int(os.getenv("JOB_MAX_ASYNC", "200"))
+
+# 任务状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCESS = "success"
+JOB_ERROR = "error"
+
+_executor = None
+_executor_lock = threading.Lock()
+_active_jobs = 0
+_active_jobs_lock = threading.Lock()
+# 持有进行中的协程任务的引用，避免被垃圾回收
+_async_tasks = set()
+
+
+class JobQueueFullError(Exception):
+    """任务队列已满"""
+
+
+def _get_executor():
+    """获取当前进程的任务线程池（在工作进程中首次使用时创建）"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix="analysis-job")
+    return _executor
+
+
+def _coalesce_key(symbols, interval, limit):
+    """相同交易对集合、时间间隔和K线数量的请求共享同一个任务"""
+    return f"job:inflight:{interval}:{limit}:{','.join(sorted(set(symbols)))}"
+
+
+def _save_job(job):
+    """保存任务状态快照"""
+    get_cache().set(f"job:{job['id']}", dict(job), ttl=JOB_RESULT_TTL)
+
+
+def get_job(job_id):
+    """查询任务，不存在或已过期时返回None"""
+    return get_cache().get(f"job:{job_id}")
+
+
+def _new_job(job_id, symbols, interval, limit):
+    return {
+        "id": job_id,
+        "status": JOB_PENDING,
+        "symbols": symbols,
+        "interval": interval,
+        "limit": limit,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "message": None
+    }
+
+
+def _enqueue(symbols, interval, limit, max_active):
+    """登记新任务并占用任务名额，返回 (任务, 合并记录的键)
+
+    结果已缓存或合并到进行中的任务时合并记录的键为None，不需要执行。
+    """
+    global _active_jobs
+
+    result = pipeline_service.get_cached_analysis(symbols, interval, limit)
+    if result is not None:
+        job = _new_job(uuid.uuid4().hex, symbols, interval, limit)
+        job.update(status=JOB_SUCCESS, started_at=job["created_at"], finished_at=job["created_at"], result=result)
+        _save_job(job)
+        logger.info(f"分析结果已缓存，直接完成任务 {job['id']}: {', '.join(symbols)}, 时间间隔: {interval}")
+        return job, None
+
+    cache = get_cache()
+    coalesce_key = _coalesce_key(symbols, interval, limit)
+    job = _new_job(uuid.uuid4().hex, symbols, interval, limit)
+    job_id = job["id"]
+
+    # 先保存任务记录再写入合并记录，其他请求读到合并记录时一定能查到对应的任务
+    _save_job(job)
+    while not cache.add(coalesce_key, job_id, ttl=JOB_TIMEOUT):
+        existing_id = cache.get(coalesce_key)
+        existing = get_job(existing_id) if existing_id else None
+        if existing and existing["status"] in (JOB_PENDING, JOB_RUNNING):
+            cache.delete(f"job:{job_id}")
+            logger.info(f"合并到进行中的分析任务 {existing_id}")
+            return existing, None
+        # 记录已失效（任务已结束或丢失），确认未被其他请求替换后清除并重试
+        if cache.get(coalesce_key) == existing_id:
+            cache.delete(coalesce_key)
+
+    with _active_jobs_lock:
+        if _active_jobs >= max_active:
+            cache.delete(coalesce_key)
+            cache.delete(f"job:{job_id}")
+            raise JobQueueFullError("分析任务队列已满，请稍后再试")
+        _active_jobs += 1
+    metrics.job_state(None, JOB_PENDING)
+    return job, coalesce_key
+
+
+def _release(job, coalesce_key):
+    """任务未能开始执行时释放任务名额和合并记录"""
+    global _active_jobs
+
+    with _active_jobs_lock:
+        _active_jobs -= 1
+    metrics.job_state(JOB_PENDING, None)
+    get_cache().delete(coalesce_key)
+
+
+def submit_analysis(symbols, interval, limit=pipeline_service.ANALYSIS_KLINES_LIMIT):
+    """提交分析任务，返回任务信息；已有相同参数的进行中任务时直接返回该任务
+
+    分析结果（快照中的行情分析和AI解读）已全部缓存时不进入队列，直接返回已完成的任务。
+    """
+    job, coalesce_key = _enqueue(symbols, interval, limit, JOB_MAX_WORKERS + JOB_MAX_PENDING)
+    if coalesce_key is None:
+        return job
+
+    try:
+        _get_executor().submit(_run_job, job, coalesce_key)
+    except Exception:
+        _release(job, coalesce_key)
+        raise
+
+    logger.info(f"已提交分析任务 {job['id']}: {', '.join(symbols)}, 时间间隔: {interval}")
+    return job
+
+
+async def submit_analysis_async(symbols, interval, limit=pipeline_service.ANALYSIS_KLINES_LIMIT):
+    """submit_analysis的异步版本（需要在事件循环中调用）：任务作为协程在当前事件循环中执行，
+    登记任务时的缓存读写不阻塞事件循环
+    """
+    job, coalesce_key = await call_async(_enqueue, symbols, interval, limit, JOB_MAX_ASYNC)
+    if coalesce_key is None:
+        return job
+
+    try:
+        task = asyncio.get_running_loop().create_task(_run_job_async(job, coalesce_key))
+        _async_tasks.add(task)
+        task.add_done_callback(_async_tasks.discard)
+    except Exception:
+        await call_async(_release, job, coalesce_key)
+        raise
+
+    logger.info(f"已提交分析任务 {job['id']}: {', '.join(symbols)}, 时间间隔: {interval}")
+    return job
+
+
+def _start_job(job):
+    job["status"] = JOB_RUNNING
+    job["started_at"] = time.time()
+    metrics.job_state(JOB_PENDING, JOB_RUNNING)
+    metrics.observe_stage("job.queue_wait", job["started_at"] - job["created_at"])
+    _save_job(job)
+
+
+def _fail_job(job, message):
+    logger.error(f"分析任务 {job['id']} 失败: {message}", exc_info=True)
+    job["status"] = JOB_ERROR
+    job["message"] = f"分析过程中发生错误: {message}"
+
+
+def _finish_job(job, coalesce_key):
+    """保存最终状态并释放合并记录和任务名额"""
+    global _active_jobs
+
+    job["finished_at"] = time.time()
+    _save_job(job)
+    if get_cache().get(coalesce_key) == job["id"]:
+        get_cache().delete(coalesce_key)
+    with _active_jobs_lock:
+        _active_jobs -= 1
+    # 开始执行前就失败的任务仍计在排队数中
+    metrics.job_state(JOB_RUNNING if job["started_at"] is not None else JOB_PENDING, None)
+
+
+def _deadline(job):
+    """任务的截止时间：提交后JOB_TIMEOUT秒，与合并记录的有效期一致"""
+    return job["created_at"] + JOB_TIMEOUT
+
+
+def _timeout_message():
+    return f"分析超过时限（{JOB_TIMEOUT}秒）"
+
+
+def _run_analysis(job):
+    """在工作线程中执行分析流程（线程无法被强制终止）
+
+    币安和DeepSeek请求的超时以及等待请求权重的时间都不超过截止时间，阻塞的请求到期后失败；
+    每个阶段事件之后也检查一次截止时间。
+    """
+    deadline = _deadline(job)
+    if time.time() > deadline:
+        raise Exception(_timeout_message())
+
+    with http_client.deadline(deadline):
+        events = pipeline_service.iter_analysis(job["symbols"], job["interval"], job["limit"])
+        try:
+            for event, payload in events:
+                if event == "result":
+                    return payload
+                if time.time() > deadline:
+                    raise Exception(_timeout_message())
+        finally:
+            events.close()
+    return None
+
+
+def _run_job(job, coalesce_key):
+    """在工作线程中执行分析任务，超过截止时间时停止"""
+    try:
+        _start_job(job)
+        job["result"] = _run_analysis(job)
+        job["status"] = JOB_SUCCESS
+    except Exception as e:
+        message = str(e)
+        # 请求因截止时间失败时说明是超时
+        if time.time() > _deadline(job) and message != _timeout_message():
+            message = f"{_timeout_message()}: {message}"
+        _fail_job(job, message)
+    finally:
+        _finish_job(job, coalesce_key)
+
+
+async def _run_job_async(job, coalesce_key):
+    """在事件循环中执行分析任务，超过截止时间时取消"""
+    try:
+        await call_async(_start_job, job)
+        job["result"] = await asyncio.wait_for(
+            pipeline_service.run_analysis_async(job["symbols"], job["interval"], job["limit"]),
+            max(_deadline(job) - time.time(), 0))
+        job["status"] = JOB_SUCCESS
+    except asyncio.TimeoutError:
+        _fail_job(job, _timeout_message())
+    except Exception as e:
+        _fail_job(job, str(e))
+    finally:
+        await call_async(_finish_job, job, coalesce_key)
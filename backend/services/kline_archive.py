@@ -0,0 +1,199 @@
+"""
+K线归档服务
+将已收盘的K线按 市场/交易对/时间间隔 保存为定长二进制记录的追加文件，
+读取时通过内存映射访问，按时间范围查询时对开盘时间列二分查找，不扫描整个文件。
+
+文件布局: {KLINE_ARCHIVE_DIR}/{market}/{symbol}/{interval}.bin
+"""
+
+import os
+import fcntl
+import logging
+from contextlib import contextmanager
+
+import numpy as np
+
+from backend.services import binance_service
+from backend.utils import helpers
+from backend.utils.klines import Klines
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 归档配置
+KLINE_ARCHIVE_ENABLED = os.getenv("KLINE_ARCHIVE_ENABLED", "False").lower() == "true"
+KLINE_ARCHIVE_DIR = os.getenv("KLINE_ARCHIVE_DIR", "data/klines")
+
+# 每次请求的K线数量（现货接口上限为1000）
+_PAGE_SIZE = 1000
+
+# 定长记录格式（小端，88字节），字段顺序与币安K线一致
+RECORD_DTYPE = np.dtype([
+    ("open_time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("close_time", "<i8"),
+    ("quote_volume", "<f8"),
+    ("trades", "<i8"),
+    ("taker_buy_volume", "<f8"),
+    ("taker_buy_quote_volume", "<f8"),
+])
+
+
+def _market(is_futures):
+    return "futures" if is_futures else "spot"
+
+
+def archive_path(symbol, interval, is_futures=False):
+    """归档文件路径"""
+    return os.path.join(KLINE_ARCHIVE_DIR, _market(is_futures), symbol, f"{interval}.bin")
+
+
+@contextmanager
+def _locked(path):
+    """对归档文件加排他锁，避免多个进程同时写入"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _to_records(rows):
+    """将币安原始K线行转换为定长记录"""
+    records = np.empty(len(rows), dtype=RECORD_DTYPE)
+    if rows:
+        data = np.array(rows, dtype=object)
+        for index, field in enumerate(RECORD_DTYPE.names):
+            records[field] = data[:, index].astype(RECORD_DTYPE[field])
+    return records
+
+
+def _open(path):
+    """以只读内存映射打开归档文件（忽略末尾未写完的记录）"""
+    try:
+        count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+    except FileNotFoundError:
+        count = 0
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+
+def _to_klines(records):
+    """将定长记录转换为Klines"""
+    return Klines.from_columns(
+        records["open_time"], records["close_time"], records["open"], records["high"], records["low"],
+        records["close"], records["volume"], records["quote_volume"], records["taker_buy_volume"],
+        records["taker_buy_quote_volume"]
+    )
+
+
+def get_records(symbol, interval, is_futures=False, start_time=None, end_time=None):
+    """读取开盘时间在[start_time, end_time)内的定长记录（内存映射的切片）"""
+    records = _open(archive_path(symbol, interval, is_futures))
+    open_times = records["open_time"]
+    start = 0 if start_time is None else int(np.searchsorted(open_times, start_time, side="left"))
+    end = len(records) if end_time is None else int(np.searchsorted(open_times, end_time, side="left"))
+    return records[start:end]
+
+
+def get_range(symbol, interval, is_futures=False, start_time=None, end_time=None):
+    """读取开盘时间在[start_time, end_time)内的K线"""
+    return _to_klines(get_records(symbol, interval, is_futures, start_time, end_time))
+
+
+def get_last(symbol, interval, count, is_futures=False):
+    """读取最近count根K线"""
+    records = _open(archive_path(symbol, interval, is_futures))
+    return _to_klines(records[-count:] if count else records[:0])
+
+
+def get_info(symbol, interval, is_futures=False):
+    """归档概况：K线数量和时间范围"""
+    records = _open(archive_path(symbol, interval, is_futures))
+    if not len(records):
+        return {"count": 0, "first_time": None, "last_time": None}
+    return {
+        "count": len(records),
+        "first_time": helpers.format_timestamp_ms(records["open_time"][0]),
+        "last_time": helpers.format_timestamp_ms(records["close_time"][-1])
+    }
+
+
+def _fetch_pages(symbol, interval, is_futures, start_time, end_time=None):
+    """从start_time开始逐页获取已收盘的K线，直到end_time（不含）或最新的已收盘K线"""
+    while True:
+        rows = binance_service.get_historical_klines(symbol, interval, start_time, _PAGE_SIZE, is_futures)
+        if end_time is not None:
+            rows = [row for row in rows if row[0] < end_time]
+        if rows:
+            yield rows
+        if len(rows) < _PAGE_SIZE:
+            return
+        start_time = rows[-1][0] + helpers.interval_to_ms(interval)
+
+
+def backfill(symbol, interval, is_futures=False, start_time=None):
+    """回补归档：补齐从start_time（或归档末尾）到最新已收盘K线之间的数据，返回新增的K线数量
+
+    start_time早于归档的第一根K线时，先获取更早的数据并与现有归档合并后整体替换文件。
+    """
+    path = archive_path(symbol, interval, is_futures)
+    interval_ms = helpers.interval_to_ms(interval)
+    added = 0
+
+    with _locked(path):
+        records = _open(path)
+
+        if start_time is not None and len(records) and start_time < records["open_time"][0]:
+            older = [_to_records(rows) for rows in
+                     _fetch_pages(symbol, interval, is_futures, start_time, int(records["open_time"][0]))]
+            if older:
+                merged = np.concatenate(older + [np.asarray(records)])
+                tmp_path = f"{path}.tmp"
+                merged.tofile(tmp_path)
+                os.replace(tmp_path, path)
+                added += len(merged) - len(records)
+                records = _open(path)
+
+        if len(records):
+            next_time = int(records["open_time"][-1]) + interval_ms
+            # 下一根K线尚未收盘时无需请求
+            if next_time + interval_ms > helpers.get_current_time_ms():
+                return added
+        elif start_time is None:
+            raise ValueError(f"{symbol} {interval} 没有归档数据，需要指定回补的开始时间")
+        else:
+            next_time = start_time
+
+        with open(path, "ab") as f:
+            for rows in _fetch_pages(symbol, interval, is_futures, next_time):
+                _to_records(rows).tofile(f)
+                f.flush()
+                added += len(rows)
+
+    if added:
+        logger.info(f"{_market(is_futures)} {symbol} {interval} 归档新增 {added} 根K线")
+    return added
+
+
+def get_klines(symbol, interval, limit, is_futures=False):
+    """读取最近limit根已收盘K线，归档不足或落后时先增量回补"""
+    records = _open(archive_path(symbol, interval, is_futures))
+    interval_ms = helpers.interval_to_ms(interval)
+    now_ms = helpers.get_current_time_ms()
+
+    if len(records) < limit:
+        # 从所需窗口的起点开始回补（多留一根的余量）
+        backfill(symbol, interval, is_futures, start_time=now_ms - now_ms % interval_ms - (limit + 1) * interval_ms)
+    elif int(records["open_time"][-1]) + 2 * interval_ms <= now_ms:
+        backfill(symbol, interval, is_futures)
+
+    return get_last(symbol, interval, limit, is_futures)
@@ -0,0 +1,686 @@
+"""
+分析流水线服务
+串联数据获取、资金流向分析和AI解读，生成完整的分析结果
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from datetime import datetime
+
+from backend.services import binance_service, analysis_service, ai_service, ingest_service, kline_archive
+from backend.utils import helpers, metrics, rate_limiter
+from backend.utils.cache import call_async, get_cache
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 并发获取配置：最大并发请求数和单次分析的数据获取时限（秒）
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", "8"))
+FETCH_DEADLINE = float(os.getenv("FETCH_DEADLINE", "30"))
+
+# 单元结果缓存时间（秒）：每个(交易对, 市场, 时间间隔)的分析结果独立缓存，
+# 实际有效期不超过当前K线收盘时间，0表示不缓存
+UNIT_CACHE_TTL = float(os.getenv("UNIT_CACHE_TTL", "30"))
+
+# 快照保留时间（秒）：K线收盘后预先计算的单元结果保存到下一根K线收盘之后，超出部分用于容错
+SNAPSHOT_GRACE = float(os.getenv("SNAPSHOT_GRACE", "60"))
+
+# 每个市场分析的K线数量：默认值和上限（未启用K线归档时受单次REST请求数量限制）
+ANALYSIS_KLINES_LIMIT = int(os.getenv("ANALYSIS_KLINES_LIMIT", "50"))
+ANALYSIS_MAX_KLINES = int(os.getenv("ANALYSIS_MAX_KLINES", "5000"))
+_REST_MAX_KLINES = 999
+
+# 是否按逐笔成交统计大单资金流（每个市场额外的请求数取决于成交笔数）
+TRADE_FLOW_ENABLED = os.getenv("TRADE_FLOW_ENABLED", "False").lower() == "true"
+
+# 市场类型及是否为期货
+_MARKETS = {"spot": False, "futures": True}
+_MARKET_LABELS = {"spot": "现货", "futures": "期货"}
+
+
+
+def max_klines_limit():
+    """单次分析允许的最大K线数量"""
+    return ANALYSIS_MAX_KLINES if kline_archive.KLINE_ARCHIVE_ENABLED else min(ANALYSIS_MAX_KLINES, _REST_MAX_KLINES)
+
+
+@metrics.timed("fetch.klines")
+def _get_klines(symbol, is_futures, interval, limit):
+    """获取K线数据，优先读取实时采集的内存数据，其次读取本地归档"""
+    klines = ingest_service.get_live_klines(symbol, interval, limit, is_futures)
+    if klines is not None:
+        return klines
+    if kline_archive.KLINE_ARCHIVE_ENABLED:
+        return kline_archive.get_klines(symbol, interval, limit, is_futures)
+    return binance_service.get_klines_data(symbol, interval=interval, limit=limit, is_futures=is_futures)
+
+
+@metrics.timed("fetch.order_book")
+def _get_order_book(symbol, is_futures, interval, limit):
+    """获取订单簿统计，优先读取本地同步的订单簿"""
+    stats = ingest_service.get_live_orderbook_stats(symbol, is_futures)
+    if stats is not None:
+        return stats
+    return binance_service.get_orderbook_stats(symbol, is_futures=is_futures)
+
+
+@metrics.timed("fetch.trade_flow")
+def _get_trade_flow(symbol, is_futures, interval, limit):
+    """按逐笔成交统计最近几根K线的资金流"""
+    return binance_service.get_trade_flow(symbol, interval=interval, is_futures=is_futures)
+
+
+# 每个市场需要获取的数据项
+_FETCH_TASKS = {
+    "klines": ("K线", _get_klines),
+    "order_book": ("订单簿", _get_order_book),
+}
+if TRADE_FLOW_ENABLED:
+    _FETCH_TASKS["trade_flow"] = ("逐笔成交", _get_trade_flow)
+
+
+@metrics.timed("fetch.klines")
+async def _get_klines_async(symbol, is_futures, interval, limit):
+    """_get_klines的异步版本，读取归档（可能触发回补）时在线程中执行"""
+    klines = await call_async(ingest_service.get_live_klines, symbol, interval, limit, is_futures)
+    if klines is not None:
+        return klines
+    if kline_archive.KLINE_ARCHIVE_ENABLED:
+        return await asyncio.to_thread(kline_archive.get_klines, symbol, interval, limit, is_futures)
+    return await binance_service.get_klines_data_async(symbol, interval=interval, limit=limit, is_futures=is_futures)
+
+
+@metrics.timed("fetch.order_book")
+async def _get_order_book_async(symbol, is_futures, interval, limit):
+    """_get_order_book的异步版本"""
+    stats = await call_async(ingest_service.get_live_orderbook_stats, symbol, is_futures)
+    if stats is not None:
+        return stats
+    return await binance_service.get_orderbook_stats_async(symbol, is_futures=is_futures)
+
+
+async def _get_trade_flow_async(symbol, is_futures, interval, limit):
+    """逐笔成交需要连续翻页，在线程中执行（耗时由_get_trade_flow记录）"""
+    return await asyncio.to_thread(_get_trade_flow, symbol, is_futures, interval, limit)
+
+
+# 异步模式下各数据项的获取函数（与 _FETCH_TASKS 一一对应）
+_ASYNC_FETCH_TASKS = {
+    "klines": _get_klines_async,
+    "order_book": _get_order_book_async,
+    "trade_flow": _get_trade_flow_async,
+}
+
+
+def _unit_cache_key(symbol, market, interval, limit):
+    return f"unit:{market}:{symbol}:{interval}:{limit}"
+
+
+def _unit_cache_ttl(interval):
+    """单元结果的缓存时间，不跨越K线收盘"""
+    interval_ms = helpers.interval_to_ms(interval)
+    until_close = (interval_ms - helpers.get_current_time_ms() % interval_ms) / 1000
+    return min(UNIT_CACHE_TTL, until_close)
+
+
+def snapshot_version(interval, now_ms=None):
+    """当前快照版本：最近一根已收盘K线的收盘时间（即当前K线的开盘时间）"""
+    interval_ms = helpers.interval_to_ms(interval)
+    now_ms = helpers.get_current_time_ms() if now_ms is None else now_ms
+    return now_ms - now_ms % interval_ms
+
+
+def _snapshot_key(symbol, market, interval, limit, version):
+    return f"snapshot:{interval}:{version}:{market}:{symbol}:{limit}"
+
+
+def _snapshot_ttl(interval):
+    """快照保留到下一根K线收盘之后，届时由新版本替代"""
+    return helpers.interval_to_ms(interval) / 1000 + SNAPSHOT_GRACE
+
+
+class _UnitCollector:
+    """收集各工作单元的数据获取结果
+
+    每个(交易对, 市场, 时间间隔)是一个独立的工作单元，创建时先读取缓存的单元结果和当前版本的快照，
+    只为缺失的单元生成数据获取任务；单元的数据到齐后立即分析并缓存。
+    refresh为True时（快照调度器使用）忽略已有结果，重新获取并保存为当前版本的快照。
+    """
+
+    def __init__(self, symbols, interval, limit, refresh=False):
+        self.symbols = symbols
+        self.interval = interval
+        self.limit = limit
+        self.refresh = refresh
+        self.version = snapshot_version(interval)
+        self.cache = get_cache()
+        self.units = {symbol: {} for symbol in symbols}
+        self.errors = {symbol: [] for symbol in symbols}
+        self.fetched = {}
+        self.remaining = {}
+
+        # 读取已缓存的单元结果
+        self.missing = []
+        for symbol in symbols:
+            for market in _MARKETS:
+                cached = None if refresh else self._read_cached(symbol, market)
+                if cached is not None:
+                    self.units[symbol][market] = cached
+                else:
+                    self.missing.append((symbol, market))
+
+    def _read_cached(self, symbol, market):
+        """依次读取单元缓存和当前版本的快照"""
+        if UNIT_CACHE_TTL > 0:
+            cached = self.cache.get(_unit_cache_key(symbol, market, self.interval, self.limit))
+            metrics.cache_lookup("unit", cached is not None)
+            if cached is not None:
+                return cached
+        cached = self.cache.get(_snapshot_key(symbol, market, self.interval, self.limit, self.version))
+        metrics.cache_lookup("snapshot", cached is not None)
+        return cached
+
+    def cached(self):
+        """所有单元均已缓存的交易对，产出 (symbol, units, errors)"""
+        missing_symbols = {symbol for symbol, market in self.missing}
+        for symbol in self.symbols:
+            if symbol not in missing_symbols:
+                yield symbol, self.units[symbol], []
+
+    def tasks(self):
+        """需要执行的数据获取任务，产出 (symbol, market, name, label)"""
+        for symbol, market in self.missing:
+            self.fetched[(symbol, market)] = {}
+            for name, (label, fetch) in _FETCH_TASKS.items():
+                self.remaining[symbol] = self.remaining.get(symbol, 0) + 1
+                yield symbol, market, name, f"{_MARKET_LABELS[market]}{label}"
+
+    def add(self, symbol, market, name, label, result, error=None):
+        """记录一个数据项的结果，交易对的所有数据项完成时返回 (symbol, units, errors)，否则返回None"""
+        if error is not None:
+            logger.error(f"获取 {symbol} {label}数据失败: {error}")
+            self.errors[symbol].append(str(error))
+        else:
+            self.fetched[(symbol, market)][name] = result
+
+        # 单元的数据到齐后立即分析并缓存
+        unit_data = self.fetched[(symbol, market)]
+        if error is None and len(unit_data) == len(_FETCH_TASKS):
+            self.units[symbol][market] = _analyze_market(unit_data["klines"], unit_data["order_book"],
+                                                         unit_data.get("trade_flow"))
+            if UNIT_CACHE_TTL > 0:
+                self.cache.set(_unit_cache_key(symbol, market, self.interval, self.limit),
+                               self.units[symbol][market], ttl=_unit_cache_ttl(self.interval))
+            if self.refresh:
+                self.cache.set(_snapshot_key(symbol, market, self.interval, self.limit, self.version),
+                               self.units[symbol][market], ttl=_snapshot_ttl(self.interval))
+
+        self.remaining[symbol] -= 1
+        if self.remaining[symbol] == 0:
+            return symbol, (None if self.errors[symbol] else self.units[symbol]), self.errors[symbol]
+        return None
+
+    def timed_out(self, pending):
+        """超过时限时记录未完成的数据项，产出未完成的交易对"""
+        logger.error(f"数据获取超过时限 {FETCH_DEADLINE} 秒，{len(pending)} 个请求未完成")
+        for symbol, market, name, label in pending:
+            self.errors[symbol].append(f"获取{symbol}{label}数据超时（{FETCH_DEADLINE}秒）")
+        for symbol in self.symbols:
+            if self.remaining.get(symbol, 0) > 0:
+                yield symbol, None, self.errors[symbol]
+
+
+def _iter_symbol_units(symbols, interval, limit=ANALYSIS_KLINES_LIMIT, refresh=False):
+    """获取并分析各交易对现货和期货市场的数据
+
+    所有请求在有界线程池中并行执行，按交易对完成的先后顺序产出 (symbol, units, errors)，
+    units 为 {"spot": ..., "futures": ...}。任一数据项失败或超过时限时 units 为 None，
+    errors 中记录失败原因，不影响其他交易对。
+    """
+    collector = _UnitCollector(symbols, interval, limit, refresh)
+    yield from collector.cached()
+    if not collector.missing:
+        return
+
+    max_workers = max(1, min(FETCH_MAX_WORKERS, len(collector.missing) * len(_FETCH_TASKS)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="binance-fetch")
+    pending = {}
+
+    try:
+        for task in collector.tasks():
+            symbol, market, name, label = task
+            # 在提交时的上下文中执行，快照调度器等后台调用的请求优先级随之传递到获取线程
+            future = rate_limiter.submit(executor, _FETCH_TASKS[name][1], symbol, _MARKETS[market], interval, limit)
+            pending[future] = task
+
+        try:
+            for future in as_completed(list(pending), timeout=FETCH_DEADLINE):
+                task = pending.pop(future)
+                try:
+                    result, error = future.result(), None
+                except Exception as e:
+                    result, error = None, e
+                done = collector.add(*task, result, error)
+                if done:
+                    yield done
+        except FuturesTimeoutError:
+            yield from collector.timed_out(pending.values())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _aiter_symbol_units(symbols, interval, limit=ANALYSIS_KLINES_LIMIT):
+    """_iter_symbol_units的异步版本：数据获取作为事件循环中的任务并发执行，读写单元缓存时不阻塞事件循环"""
+    collector = await call_async(_UnitCollector, symbols, interval, limit)
+    for item in collector.cached():
+        yield item
+    if not collector.missing:
+        return
+
+    async def run(task):
+        symbol, market, name, label = task
+        try:
+            return task, await _ASYNC_FETCH_TASKS[name](symbol, _MARKETS[market], interval, limit), None
+        except Exception as e:
+            return task, None, e
+
+    pending = set(collector.tasks())
+    futures = [asyncio.ensure_future(run(task)) for task in pending]
+    try:
+        try:
+            for next_done in asyncio.as_completed(futures, timeout=FETCH_DEADLINE):
+                task, result, error = await next_done
+                pending.discard(task)
+                done = await call_async(collector.add, *task, result, error)
+                if done:
+                    yield done
+        except asyncio.TimeoutError:
+            for item in collector.timed_out(pending):
+                yield item
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _analyze_market(klines_data, order_book, trade_flow=None):
+    """分析单个市场（现货或期货）的资金流向"""
+    with metrics.span("analysis.funding_flow_trend"):
+        funding_trend = analysis_service.analyze_funding_flow_trend(klines_data)
+    with metrics.span("analysis.anomalies"):
+        anomalies = analysis_service.detect_anomalies(klines_data)
+    with metrics.span("analysis.funding_pressure"):
+        funding_pressure = analysis_service.analyze_funding_pressure(klines_data, order_book)
+
+    result = {
+        "klines_summary": klines_data.summary(),
+        "funding_trend": funding_trend,
+        "anomalies": anomalies,
+        "order_book": order_book,
+        "funding_pressure": funding_pressure
+    }
+    if trade_flow is not None:
+        result["trade_flow"] = trade_flow
+    return result
+
+
+def _compare_markets(spot, futures):
+    """对比现货和期货市场"""
+    spot_summary = spot["klines_summary"]
+    futures_summary = futures["klines_summary"]
+
+    price_diff = 0
+    if spot_summary["current_price"] and futures_summary["current_price"]:
+        price_diff = (spot_summary["current_price"] - futures_summary["current_price"]) / \
+                     spot_summary["current_price"] * 100
+
+    volume_ratio = 0
+    if spot_summary["total_volume"] and futures_summary["total_volume"] > 0:
+        volume_ratio = spot_summary["total_volume"] / futures_summary["total_volume"]
+
+    net_inflow_diff = 0
+    if spot["funding_trend"] and futures["funding_trend"]:
+        net_inflow_diff = spot["funding_trend"]["net_inflow_total"] - futures["funding_trend"]["net_inflow_total"]
+
+    return {
+        "spot_vs_futures_price_diff": price_diff,
+        "spot_vs_futures_volume_ratio": volume_ratio,
+        "spot_vs_futures_net_inflow_diff": net_inflow_diff
+    }
+
+
+def _combine_units(units):
+    """合并单个交易对现货和期货市场的分析结果"""
+    return {
+        "spot": units["spot"],
+        "futures": units["futures"],
+        "comparison": _compare_markets(units["spot"], units["futures"])
+    }
+
+
+def _analyze_symbols(symbols, interval, limit=ANALYSIS_KLINES_LIMIT):
+    """分析多个交易对，逐个产出 (symbol, analysis, errors)"""
+    for symbol, units, errors in _iter_symbol_units(symbols, interval, limit):
+        yield symbol, (_combine_units(units) if units else None), errors
+
+
+async def _aanalyze_symbols(symbols, interval, limit=ANALYSIS_KLINES_LIMIT):
+    """_analyze_symbols的异步版本"""
+    async for symbol, units, errors in _aiter_symbol_units(symbols, interval, limit):
+        yield symbol, (_combine_units(units) if units else None), errors
+
+
+def analyze_batch(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """批量分析多个交易对（不含AI解读），单个交易对失败不影响其他交易对"""
+    start_time = datetime.now()
+    analysis_results = {}
+    fetch_errors = {}
+
+    for symbol, analysis, errors in _analyze_symbols(symbols, interval, limit):
+        if errors:
+            fetch_errors[symbol] = errors
+        else:
+            analysis_results[symbol] = analysis
+
+    return _batch_result(symbols, interval, limit, analysis_results, fetch_errors, start_time)
+
+
+async def analyze_batch_async(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """analyze_batch的异步版本（ASGI模式）"""
+    start_time = datetime.now()
+    analysis_results = {}
+    fetch_errors = {}
+
+    async for symbol, analysis, errors in _aanalyze_symbols(symbols, interval, limit):
+        if errors:
+            fetch_errors[symbol] = errors
+        else:
+            analysis_results[symbol] = analysis
+
+    return _batch_result(symbols, interval, limit, analysis_results, fetch_errors, start_time)
+
+
+def _batch_result(symbols, interval, limit, analysis_results, fetch_errors, start_time):
+    """整理批量分析结果，保持请求中的交易对顺序"""
+    analyzed_symbols = [symbol for symbol in symbols if symbol in analysis_results]
+    return {
+        "analysis": {symbol: analysis_results[symbol] for symbol in analyzed_symbols},
+        "errors": fetch_errors,
+        "metadata": {
+            **helpers.create_analysis_metadata(interval, analyzed_symbols, limit),
+            "duration": (datetime.now() - start_time).total_seconds()
+        }
+    }
+
+
+def _plan_timeframes(intervals, limit):
+    """为多个周期选择需要获取的基础周期
+
+    较长的周期尽量由已选的较短周期聚合得到（需要整除且所需K线数量不超过上限），
+    返回 {基础周期: (获取数量, [由其得到的周期])}。
+    """
+    max_limit = max_klines_limit()
+    plan = {}
+    for interval in sorted(set(intervals), key=helpers.interval_to_ms):
+        interval_ms = helpers.interval_to_ms(interval)
+        for base, (count, derived) in plan.items():
+            ratio, remainder = divmod(interval_ms, helpers.interval_to_ms(base))
+            # 多取一个目标周期的基础K线，保证按周期对齐后仍有limit根完整K线
+            needed = (limit + 1) * ratio
+            if not remainder and needed <= max_limit:
+                plan[base] = (max(count, needed), derived + [interval])
+                break
+        else:
+            plan[interval] = (limit, [interval])
+    return plan
+
+
+def analyze_timeframes(symbols, intervals, limit=ANALYSIS_KLINES_LIMIT):
+    """多周期分析（不含AI解读）：每个市场只获取基础周期的K线和一次订单簿，其余周期由聚合得到"""
+    start_time = datetime.now()
+    plan = _plan_timeframes(intervals, limit)
+    fetched = {}
+    errors = {}
+
+    tasks = []
+    for symbol in symbols:
+        for market, is_futures in _MARKETS.items():
+            tasks.append((symbol, market, "订单簿", None, _get_order_book, (symbol, is_futures, None, None)))
+            for base, (count, derived) in plan.items():
+                tasks.append((symbol, market, f"{base}K线", base, _get_klines, (symbol, is_futures, base, count)))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(FETCH_MAX_WORKERS, len(tasks))),
+                                  thread_name_prefix="binance-fetch")
+    try:
+        pending = {rate_limiter.submit(executor, fetch, *args): (symbol, market, label, base)
+                   for symbol, market, label, base, fetch, args in tasks}
+        try:
+            for future in as_completed(list(pending), timeout=FETCH_DEADLINE):
+                symbol, market, label, base = pending.pop(future)
+                try:
+                    fetched[(symbol, market, base)] = future.result()
+                except Exception as e:
+                    logger.error(f"获取 {symbol} {_MARKET_LABELS[market]}{label}数据失败: {e}")
+                    errors.setdefault(symbol, []).append(str(e))
+        except FuturesTimeoutError:
+            logger.error(f"数据获取超过时限 {FETCH_DEADLINE} 秒，{len(pending)} 个请求未完成")
+            for symbol, market, label, base in pending.values():
+                errors.setdefault(symbol, []).append(
+                    f"获取{symbol}{_MARKET_LABELS[market]}{label}数据超时（{FETCH_DEADLINE}秒）")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    analysis = {}
+    for symbol in symbols:
+        if symbol in errors:
+            continue
+        analysis[symbol] = {}
+        for market in _MARKETS:
+            order_book = fetched[(symbol, market, None)]
+            timeframes = {}
+            for base, (count, derived) in plan.items():
+                klines = fetched[(symbol, market, base)]
+                for interval in derived:
+                    if interval != base:
+                        klines_tf = klines.resample(helpers.interval_to_ms(interval))[-limit:]
+                    else:
+                        klines_tf = klines[-limit:]
+                    result = _analyze_market(klines_tf, order_book)
+                    del result["order_book"]
+                    timeframes[interval] = result
+            analysis[symbol][market] = {
+                "order_book": order_book,
+                "timeframes": {interval: timeframes[interval] for interval in intervals}
+            }
+
+    analyzed_symbols = [symbol for symbol in symbols if symbol in analysis]
+    return {
+        "analysis": analysis,
+        "errors": errors,
+        "metadata": {
+            **helpers.create_analysis_metadata(",".join(intervals), analyzed_symbols, limit),
+            "intervals": intervals,
+            "fetched_intervals": {base: count for base, (count, derived) in plan.items()},
+            "duration": (datetime.now() - start_time).total_seconds()
+        }
+    }
+
+
+def _ai_input(symbols, analysis_results, fetch_errors, interval, limit):
+    """整合发送给AI的分析数据：保持请求中的交易对顺序，剔除获取失败的交易对"""
+    symbols = [symbol for symbol in symbols if symbol in analysis_results]
+    if not symbols:
+        raise Exception(f"所有交易对的数据获取均失败: {fetch_errors}")
+
+    return {
+        # 添加分析时间和参数信息
+        "metadata": helpers.create_analysis_metadata(interval, symbols, limit),
+        "analysis": {symbol: analysis_results[symbol] for symbol in symbols}
+    }
+
+
+def _analysis_result(deepseek_data, ai_chunks, fetch_errors, start_time):
+    """完整的分析结果"""
+    # 计算总耗时
+    duration = (datetime.now() - start_time).total_seconds()
+
+    return {
+        "raw_analysis": deepseek_data,
+        "ai_interpretation": "".join(ai_chunks),
+        "errors": fetch_errors,
+        "metadata": {
+            **deepseek_data["metadata"],
+            "duration": duration
+        }
+    }
+
+
+def _observe_pipeline(started, fetched):
+    """记录AI解读和整个分析流程的耗时，并在日志中输出各阶段耗时"""
+    finished = time.perf_counter()
+    metrics.observe_stage("pipeline.ai", finished - fetched)
+    metrics.observe_stage("pipeline.total", finished - started)
+    logger.info(f"分析完成: 行情数据 {fetched - started:.3f} 秒，AI解读 {finished - fetched:.3f} 秒，"
+                f"共 {finished - started:.3f} 秒")
+
+
+def iter_analysis(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """执行资金流向分析流程，并逐阶段产出事件
+
+    产出 (event, payload)：
+    - progress: 进度消息
+    - symbol: 单个交易对的分析结果（数据到达后立即产出）
+    - symbol_error: 单个交易对的数据获取失败原因
+    - ai_delta: AI解读的内容片段
+    - result: 完整的分析结果（最后一个事件）
+    """
+    # 记录开始时间
+    start_time = datetime.now()
+    logger.info(f"开始分析 {', '.join(symbols)}, 时间间隔: {interval}")
+
+    with metrics.analysis_in_flight():
+        # 并发获取行情数据，每个交易对的数据到齐后立即分析（已缓存的单元直接复用）
+        yield "progress", {"message": helpers.log_progress(
+            f"正在并发获取 {', '.join(symbols)} 的{interval}K线和订单簿数据...")}
+
+        started = time.perf_counter()
+        analysis_results = {}
+        fetch_errors = {}
+
+        for symbol, analysis, errors in _analyze_symbols(symbols, interval, limit):
+            if errors:
+                fetch_errors[symbol] = errors
+                yield "symbol_error", {"symbol": symbol, "errors": errors}
+                continue
+
+            analysis_results[symbol] = analysis
+            yield "symbol", {"symbol": symbol, "analysis": analysis}
+
+        fetched = time.perf_counter()
+        metrics.observe_stage("pipeline.market_data", fetched - started)
+        deepseek_data = _ai_input(symbols, analysis_results, fetch_errors, interval, limit)
+
+        # 发送到DeepSeek进行解读
+        yield "progress", {"message": helpers.log_progress("正在通过AI解读分析结果...")}
+        ai_chunks = []
+        for chunk in ai_service.stream_interpretation(deepseek_data, interval):
+            ai_chunks.append(chunk)
+            yield "ai_delta", {"content": chunk}
+
+        _observe_pipeline(started, fetched)
+        yield "result", _analysis_result(deepseek_data, ai_chunks, fetch_errors, start_time)
+
+
+async def aiter_analysis(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """iter_analysis的异步版本（ASGI模式），产出的事件相同
+
+    等待币安和DeepSeek响应期间不占用线程，单个进程可以同时处理大量进行中的分析。
+    """
+    start_time = datetime.now()
+    logger.info(f"开始分析 {', '.join(symbols)}, 时间间隔: {interval}")
+
+    with metrics.analysis_in_flight():
+        yield "progress", {"message": helpers.log_progress(
+            f"正在并发获取 {', '.join(symbols)} 的{interval}K线和订单簿数据...")}
+
+        started = time.perf_counter()
+        analysis_results = {}
+        fetch_errors = {}
+
+        async for symbol, analysis, errors in _aanalyze_symbols(symbols, interval, limit):
+            if errors:
+                fetch_errors[symbol] = errors
+                yield "symbol_error", {"symbol": symbol, "errors": errors}
+                continue
+
+            analysis_results[symbol] = analysis
+            yield "symbol", {"symbol": symbol, "analysis": analysis}
+
+        fetched = time.perf_counter()
+        metrics.observe_stage("pipeline.market_data", fetched - started)
+        deepseek_data = _ai_input(symbols, analysis_results, fetch_errors, interval, limit)
+
+        yield "progress", {"message": helpers.log_progress("正在通过AI解读分析结果...")}
+        ai_chunks = []
+        async for chunk in ai_service.astream_interpretation(deepseek_data, interval):
+            ai_chunks.append(chunk)
+            yield "ai_delta", {"content": chunk}
+
+        _observe_pipeline(started, fetched)
+        yield "result", _analysis_result(deepseek_data, ai_chunks, fetch_errors, start_time)
+
+
+def get_cached_analysis(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """只读取缓存组装完整的分析结果，任一单元或AI解读未缓存时返回None"""
+    start_time = datetime.now()
+    try:
+        collector = _UnitCollector(symbols, interval, limit)
+    except ValueError:
+        # 无法识别的时间间隔，交由正常的分析流程报错
+        return None
+    if collector.missing:
+        return None
+
+    analysis_results = {symbol: _combine_units(units) for symbol, units, errors in collector.cached()}
+    deepseek_data = _ai_input(symbols, analysis_results, {}, interval, limit)
+    interpretation = ai_service.get_cached_interpretation(deepseek_data, interval)
+    if interpretation is None:
+        return None
+    return _analysis_result(deepseek_data, [interpretation], {}, start_time)
+
+
+def refresh_snapshot(symbols, interval, limit=ANALYSIS_KLINES_LIMIT):
+    """重新获取并分析各交易对的数据，保存为当前版本的快照
+
+    返回 (快照版本, 成功的交易对列表, {交易对: 失败原因})。
+    """
+    version = snapshot_version(interval)
+    refreshed = []
+    fetch_errors = {}
+    for symbol, units, errors in _iter_symbol_units(symbols, interval, limit, refresh=True):
+        if errors:
+            fetch_errors[symbol] = errors
+        else:
+            refreshed.append(symbol)
+    return version, [symbol for symbol in symbols if symbol in refreshed], fetch_errors
+
+
+def run_analysis(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """执行完整的资金流向分析流程，返回最终结果"""
+    result = None
+    for event, payload in iter_analysis(symbols, interval, limit):
+        if event == "result":
+            result = payload
+    return result
+
+
+async def run_analysis_async(symbols, interval="1h", limit=ANALYSIS_KLINES_LIMIT):
+    """run_analysis的异步版本"""
+    result = None
+    async for event, payload in aiter_analysis(symbols, interval, limit):
+        if event == "result":
+            result = payload
+    return result
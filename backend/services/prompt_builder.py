@@ -0,0 +1,226 @@
+"""
+AI输入数据构建
+将分析结果压缩为按交易对逐行排列的表格文本（数值按量级取整，省略订单簿明细等冗余字段），
+并按token预算自动截断：先省略异常明细，再只保留信号最强的交易对，其余交易对汇总为一行。
+"""
+
+import os
+import math
+import logging
+from collections import Counter
+
+from backend.services.analysis_service import format_number
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 分析数据部分的token预算（估算值），0表示不截断
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "4000"))
+# 每个市场最多列出的异常明细条数
+PROMPT_MAX_ANOMALIES = int(os.getenv("PROMPT_MAX_ANOMALIES", "2"))
+
+_MARKET_NAMES = {"spot": "现货", "futures": "期货"}
+
+
+def estimate_tokens(text):
+    """估算token数：按DeepSeek的经验值，1个中文字符约0.6个token，1个英文字符约0.3个token"""
+    cjk = sum(1 for char in text if "\u4e00" <= char <= "\u9fff" or "\u3000" <= char <= "\u303f"
+              or "\uff00" <= char <= "\uffef")
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def _price(value):
+    """价格：沿用format_number的小数位数，去掉末尾的0"""
+    if not value:
+        return "0"
+    text = format_number(float(value))
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+
+def _amount(value):
+    """金额和数量：按K/M/B缩写，保留3位有效数字"""
+    value = float(value or 0)
+    if not math.isfinite(value):
+        return "inf"
+    for unit, scale in (("B", 1e9), ("M", 1e6), ("K", 1e3)):
+        if abs(value) >= scale:
+            return f"{value / scale:.3g}{unit}"
+    return f"{value:.3g}"
+
+
+def _ratio(value, digits=2):
+    """比例和百分比：固定小数位数"""
+    value = float(value or 0)
+    if not math.isfinite(value):
+        return "inf"
+    return f"{value:.{digits}f}"
+
+
+def _columns(units):
+    """表头，可选字段只在有交易对包含时输出"""
+    columns = ["交易对", "市场", "价格", "涨跌%", "成交额", "净流入", "近期净流入", "趋势(置信度)", "阶段",
+               "盘口失衡", "买卖压力比", "压力方向", "价差%", "异常数"]
+    if any(unit.get("trade_flow") for unit in units):
+        columns.append("大单净流入")
+    if any((unit.get("order_book") or {}).get("band") for unit in units):
+        columns.append("近盘失衡")
+    return columns
+
+
+def _unit_row(symbol, market, unit, columns):
+    """单个交易对单个市场的一行数据"""
+    summary = unit["klines_summary"]
+    trend = unit["funding_trend"]
+    order_book = unit.get("order_book") or {}
+    pressure = unit["funding_pressure"]
+
+    row = [
+        symbol,
+        _MARKET_NAMES.get(market, market),
+        _price(summary["current_price"]),
+        _ratio(summary["price_change"]),
+        _amount(summary["total_quote_volume"]),
+        _amount(trend["net_inflow_total"]),
+        _amount(trend["net_inflow_recent"]),
+        f"{trend['trend']}({_ratio(trend['confidence'], 1)})",
+        trend["price_stage"],
+        _ratio(order_book.get("imbalance"), 3),
+        _ratio(pressure.get("bid_ask_ratio"), 2),
+        pressure["pressure_direction"],
+        _ratio(order_book.get("price_range", {}).get("spread_pct"), 4),
+        str(len(unit["anomalies"]["anomalies"]))
+    ]
+    if "大单净流入" in columns:
+        trade_flow = unit.get("trade_flow")
+        row.append(_amount(trade_flow["large_net_inflow"]) if trade_flow else "-")
+    if "近盘失衡" in columns:
+        band = order_book.get("band")
+        row.append(_ratio(band["imbalance"], 3) if band else "-")
+    return row
+
+
+def _anomaly_line(symbol, market, anomaly):
+    """单条异常的简要描述"""
+    parts = [symbol, _MARKET_NAMES.get(market, market), anomaly["time"][5:16]]
+    if "volume" in anomaly:
+        parts.append(f"成交量{anomaly['volume']['z_score']:+.1f}σ")
+    if "net_inflow" in anomaly:
+        parts.append(f"净流入{anomaly['net_inflow']['z_score']:+.1f}σ({_amount(anomaly['net_inflow']['value'])})")
+    if "price_volume_mismatch" in anomaly:
+        parts.append(f"价量背离(涨跌{anomaly['price_volume_mismatch']['price_change']:+.2f}%)")
+    return " ".join(parts)
+
+
+def _significance(analysis):
+    """交易对的信号强度，截断时优先保留：近期净流入占成交额的比例与盘口失衡度之和"""
+    score = 0.0
+    for market in _MARKET_NAMES:
+        unit = analysis[market]
+        quote_volume = unit["klines_summary"]["total_quote_volume"]
+        if quote_volume:
+            score += abs(unit["funding_trend"]["net_inflow_recent"]) / quote_volume
+        score += abs((unit.get("order_book") or {}).get("imbalance", 0))
+        score += len(unit["anomalies"]["anomalies"]) * 0.05
+    return score
+
+
+def _omitted_summary(analysis, symbols):
+    """被省略的交易对汇总为一行：趋势和阶段分布、合计净流入"""
+    trends = Counter()
+    stages = Counter()
+    inflows = {market: 0.0 for market in _MARKET_NAMES}
+    for symbol in symbols:
+        for market in _MARKET_NAMES:
+            trend = analysis[symbol][market]["funding_trend"]
+            trends[trend["trend"]] += 1
+            stages[trend["price_stage"]] += 1
+            inflows[market] += trend["net_inflow_total"]
+
+    return (
+        f"其余{len(symbols)}个交易对（{','.join(symbols)}）已省略明细：\n"
+        f"趋势分布 {', '.join(f'{k}×{v}' for k, v in trends.most_common())}；"
+        f"阶段分布 {', '.join(f'{k}×{v}' for k, v in stages.most_common())}；"
+        f"合计净流入 现货{_amount(inflows['spot'])} 期货{_amount(inflows['futures'])}"
+    )
+
+
+def _render(data, detailed, omitted, max_anomalies):
+    """生成表格文本"""
+    analysis = data.get("analysis", {})
+    metadata = data.get("metadata", {})
+    units = [analysis[symbol][market] for symbol in detailed for market in _MARKET_NAMES]
+    columns = _columns(units)
+
+    lines = [
+        f"周期 {metadata.get('interval', '-')}，每个市场 {metadata.get('klines_count', '-')} 根已收盘K线，"
+        f"分析时间 {metadata.get('analysis_time', '-')}",
+        "金额单位为计价货币（K/M/B=千/百万/十亿），盘口失衡=(买量-卖量)/(买量+卖量)",
+        "",
+        "|".join(columns)
+    ]
+    for symbol in detailed:
+        for market in _MARKET_NAMES:
+            lines.append("|".join(_unit_row(symbol, market, analysis[symbol][market], columns)))
+
+    lines += ["", "现货期货对比", "交易对|价差%|成交量比|净流入差"]
+    for symbol in detailed:
+        comparison = analysis[symbol]["comparison"]
+        lines.append("|".join([
+            symbol,
+            _ratio(comparison["spot_vs_futures_price_diff"], 3),
+            _ratio(comparison["spot_vs_futures_volume_ratio"], 2),
+            _amount(comparison["spot_vs_futures_net_inflow_diff"])
+        ]))
+
+    if max_anomalies > 0:
+        anomaly_lines = [
+            _anomaly_line(symbol, market, anomaly)
+            for symbol in detailed for market in _MARKET_NAMES
+            for anomaly in analysis[symbol][market]["anomalies"]["anomalies"][-max_anomalies:]
+        ]
+        if anomaly_lines:
+            lines += ["", f"最近异常（每个市场最多{max_anomalies}条）"] + anomaly_lines
+
+    if omitted:
+        lines += ["", _omitted_summary(analysis, omitted)]
+    return "\n".join(lines)
+
+
+def build_prompt_data(data, token_budget=None):
+    """将分析结果压缩为表格文本，返回 (文本, 统计信息)
+
+    超出token预算时依次省略异常明细、减少列出明细的交易对（按信号强度保留，保持原有顺序）。
+    """
+    token_budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    symbols = list(data.get("analysis", {}))
+    ranked = sorted(symbols, key=lambda s: _significance(data["analysis"][s]), reverse=True)
+
+    keep = len(symbols)
+    max_anomalies = PROMPT_MAX_ANOMALIES
+    while True:
+        kept = set(ranked[:keep])
+        detailed = [symbol for symbol in symbols if symbol in kept]
+        omitted = [symbol for symbol in symbols if symbol not in kept]
+        text = _render(data, detailed, omitted, max_anomalies)
+        tokens = estimate_tokens(text)
+
+        if not token_budget or tokens <= token_budget or (keep <= 1 and max_anomalies == 0):
+            break
+        if max_anomalies > 0:
+            max_anomalies = 0
+        else:
+            # 按超出比例估算需要保留的交易对数量，至少减少一个
+            keep = max(1, min(keep - 1, int(keep * token_budget / tokens)))
+
+    stats = {
+        "estimated_tokens": tokens,
+        "token_budget": token_budget,
+        "symbols": len(symbols),
+        "symbols_detailed": len(detailed),
+        "anomalies_per_market": max_anomalies,
+        "truncated": bool(omitted) or max_anomalies < PROMPT_MAX_ANOMALIES
+    }
+    if stats["truncated"]:
+        logger.info(f"AI输入数据超出预算({token_budget} tokens)，列出{len(detailed)}/{len(symbols)}个交易对明细")
+    return text, stats
@@ -0,0 +1,316 @@
+"""
+全市场筛选服务
+先用一次全市场24小时行情请求，按计价货币和成交额预筛选候选交易对，只为候选交易对并发获取K线和订单簿；
+候选交易对的K线排列为 交易对×K线 的矩阵，统一计算净流入、异常偏离和综合得分后排序。
+
+候选数量按接口权重预算自动收缩，一次扫描最多使用每分钟权重预算的 SCREENER_WEIGHT_SHARE；
+K线和订单簿走 binance_service 的缓存，同一根K线内的重复扫描只需请求订单簿。
+"""
+
+import os
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+import numpy as np
+
+from backend.services import binance_service
+from backend.utils import helpers, metrics, rate_limiter
+from backend.utils.cache import get_cache
+from backend.utils.klines import derive_flow
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 预筛选配置：计价货币、24小时最低成交额、最多候选交易对数量和排除的交易对（默认排除稳定币交易对）
+SCREENER_QUOTE_ASSET = os.getenv("SCREENER_QUOTE_ASSET", "USDT").upper()
+SCREENER_MIN_QUOTE_VOLUME = float(os.getenv("SCREENER_MIN_QUOTE_VOLUME", "5000000"))
+SCREENER_MAX_CANDIDATES = int(os.getenv("SCREENER_MAX_CANDIDATES", "150"))
+SCREENER_EXCLUDE = {s.strip().upper() for s in os.getenv(
+    "SCREENER_EXCLUDE", "USDCUSDT,FDUSDUSDT,TUSDUSDT,USDPUSDT,EURUSDT,DAIUSDT").split(",") if s.strip()}
+
+# 评分配置：每个交易对的K线数量、近期窗口长度、异常z分数阈值和订单簿档位数（档位越少权重越低）
+SCREENER_KLINES_LIMIT = int(os.getenv("SCREENER_KLINES_LIMIT", "50"))
+SCREENER_WINDOW = int(os.getenv("SCREENER_WINDOW", "10"))
+SCREENER_ANOMALY_THRESHOLD = float(os.getenv("SCREENER_ANOMALY_THRESHOLD", "2.0"))
+SCREENER_DEPTH_LIMIT = int(os.getenv("SCREENER_DEPTH_LIMIT", "50"))
+
+# 并发配置：最大并发请求数、数据获取时限（秒）和单次扫描可使用的权重预算比例
+SCREENER_MAX_WORKERS = int(os.getenv("SCREENER_MAX_WORKERS", "16"))
+SCREENER_DEADLINE = float(os.getenv("SCREENER_DEADLINE", "30"))
+SCREENER_WEIGHT_SHARE = float(os.getenv("SCREENER_WEIGHT_SHARE", "0.5"))
+
+# 扫描结果缓存时间（秒），不跨越K线收盘
+SCREENER_CACHE_TTL = float(os.getenv("SCREENER_CACHE_TTL", "60"))
+# 同一市场和时间间隔同时只进行一次扫描：扫描锁的有效期（秒），以及扫描期间可返回的上一次结果的保留时间（秒）
+SCREENER_LOCK_TTL = float(os.getenv("SCREENER_LOCK_TTL", "120"))
+SCREENER_STALE_TTL = float(os.getenv("SCREENER_STALE_TTL", "900"))
+
+# 可用的排序字段
+SORT_FIELDS = ("score", "net_inflow_recent", "inflow_ratio", "imbalance", "anomaly_score", "price_change")
+
+
+def _family(is_futures):
+    return "futures" if is_futures else "spot"
+
+
+def _ticker_weight(is_futures):
+    family = _family(is_futures)
+    path = "/fapi/v1/ticker/24hr" if is_futures else "/api/v3/ticker/24hr"
+    return rate_limiter.request_weight(family, path)
+
+
+def _symbol_weight(is_futures):
+    """每个候选交易对的K线和订单簿请求权重"""
+    family = _family(is_futures)
+    return (rate_limiter.request_weight(family, "/klines", {"limit": SCREENER_KLINES_LIMIT + 1})
+            + rate_limiter.request_weight(family, "/depth", {"limit": SCREENER_DEPTH_LIMIT}))
+
+
+def _max_candidates(is_futures):
+    """在权重预算内最多可以扫描的候选交易对数量"""
+    if not rate_limiter.RATE_LIMIT_ENABLED:
+        return SCREENER_MAX_CANDIDATES
+    family = _family(is_futures)
+    # 扫描作为后台请求执行，不超过后台请求可用的预算比例
+    share = min(SCREENER_WEIGHT_SHARE, rate_limiter.RATE_LIMIT_BACKGROUND_SHARE)
+    budget = rate_limiter.RATE_LIMIT_WEIGHTS[family] * rate_limiter.RATE_LIMIT_SAFETY * share
+    affordable = int((budget - _ticker_weight(is_futures)) // _symbol_weight(is_futures))
+    return max(0, min(SCREENER_MAX_CANDIDATES, affordable))
+
+
+def _candidates(tickers, max_candidates):
+    """按计价货币和24小时成交额预筛选，返回 (全市场交易对数, 按成交额降序的候选行情列表)"""
+    universe = [t for t in tickers
+                if t["symbol"].endswith(SCREENER_QUOTE_ASSET) and t["symbol"] not in SCREENER_EXCLUDE]
+    liquid = [t for t in universe if float(t["quoteVolume"]) >= SCREENER_MIN_QUOTE_VOLUME]
+    liquid.sort(key=lambda t: float(t["quoteVolume"]), reverse=True)
+    return len(universe), liquid[:max_candidates]
+
+
+def _fetch(symbols, interval, is_futures):
+    """并发获取候选交易对的K线和订单簿，返回 (K线 {symbol: rows}, 订单簿 {symbol: stats}, 错误 {symbol: [原因]})"""
+    klines = {}
+    books = {}
+    errors = {}
+    if not symbols:
+        return klines, books, errors
+
+    tasks = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, min(SCREENER_MAX_WORKERS, len(symbols) * 2)),
+                                  thread_name_prefix="screener-fetch")
+    try:
+        for symbol in symbols:
+            tasks[rate_limiter.submit(executor, binance_service.get_closed_klines, symbol, interval,
+                                      SCREENER_KLINES_LIMIT, is_futures)] = (symbol, klines)
+            tasks[rate_limiter.submit(executor, binance_service.get_orderbook_stats, symbol, is_futures,
+                                      SCREENER_DEPTH_LIMIT)] = (symbol, books)
+        try:
+            for future in as_completed(list(tasks), timeout=SCREENER_DEADLINE):
+                symbol, results = tasks.pop(future)
+                try:
+                    results[symbol] = future.result()
+                except Exception as e:
+                    errors.setdefault(symbol, []).append(str(e))
+        except FuturesTimeoutError:
+            logger.error(f"筛选数据获取超过时限 {SCREENER_DEADLINE} 秒，{len(tasks)} 个请求未完成")
+            for symbol, results in tasks.values():
+                errors.setdefault(symbol, []).append(f"获取{symbol}数据超时（{SCREENER_DEADLINE}秒）")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return klines, books, errors
+
+
+def _matrix(rows_by_symbol):
+    """将各交易对的原始K线排列为 交易对×K线 的矩阵，K线数量不足的交易对（如新上市）不参与评分"""
+    symbols = [symbol for symbol, rows in rows_by_symbol.items() if len(rows) == SCREENER_KLINES_LIMIT]
+    if not symbols:
+        return symbols, None
+
+    data = np.array([rows_by_symbol[symbol] for symbol in symbols], dtype=object)
+    open_price, close_price, volume, quote_volume, taker_buy_volume, taker_buy_quote_volume = (
+        data[:, :, i].astype(np.float64) for i in (1, 4, 5, 7, 9, 10)
+    )
+    buy_volume, sell_volume, net_inflow, price_change_pct = derive_flow(
+        open_price, close_price, volume, quote_volume, taker_buy_volume, taker_buy_quote_volume
+    )
+    return symbols, {
+        "open": open_price,
+        "close": close_price,
+        "volume": volume,
+        "quote_volume": quote_volume,
+        "net_inflow": net_inflow,
+        "price_change_pct": price_change_pct
+    }
+
+
+def _z_scores(values):
+    """按行计算z分数，标准差为0的行记为0"""
+    std = values.std(axis=1, keepdims=True)
+    return np.divide(values - values.mean(axis=1, keepdims=True), std, out=np.zeros_like(values), where=std > 0)
+
+
+def _percentile_rank(values):
+    """横截面百分位排名（0~1），用于合成不同量纲的指标"""
+    if len(values) < 2:
+        return np.ones_like(values)
+    return values.argsort().argsort() / (len(values) - 1)
+
+
+def score_matrix(columns, imbalance):
+    """对 交易对×K线 矩阵计算各项指标和综合得分，所有交易对一次完成
+
+    - 近期净流入占比：最近 SCREENER_WINDOW 根K线的净流入 / 成交额
+    - 盘口失衡：订单簿 (买量-卖量)/(买量+卖量)
+    - 异常偏离：近期窗口内成交量和净流入z分数绝对值的最大值；异常数口径与 detect_anomalies 一致
+    综合得分为三项横截面百分位排名的均值，偏向资金流入、买盘占优且出现异常放量的交易对。
+    """
+    window = min(SCREENER_WINDOW, columns["net_inflow"].shape[1])
+    net_inflow = columns["net_inflow"]
+    quote_volume = columns["quote_volume"]
+
+    net_inflow_total = net_inflow.sum(axis=1)
+    net_inflow_recent = net_inflow[:, -window:].sum(axis=1)
+    recent_quote = quote_volume[:, -window:].sum(axis=1)
+    inflow_ratio = np.divide(net_inflow_recent, recent_quote, out=np.zeros_like(recent_quote), where=recent_quote > 0)
+
+    volume_z = _z_scores(columns["volume"])
+    inflow_z = _z_scores(net_inflow)
+    threshold = SCREENER_ANOMALY_THRESHOLD
+    anomaly_mask = ((np.abs(volume_z) > threshold) | (np.abs(inflow_z) > threshold)
+                    | ((np.abs(columns["price_change_pct"]) > 1.0) & (volume_z < 0)))
+    anomaly_score = np.maximum(np.abs(volume_z), np.abs(inflow_z))[:, -window:].max(axis=1)
+
+    open_price = columns["open"][:, 0]
+    price_change = np.divide(columns["close"][:, -1] - open_price, open_price,
+                             out=np.zeros_like(open_price), where=open_price > 0) * 100
+
+    score = (_percentile_rank(inflow_ratio) + _percentile_rank(imbalance) + _percentile_rank(anomaly_score)) / 3
+    return {
+        "price": columns["close"][:, -1],
+        "price_change": price_change,
+        "net_inflow_total": net_inflow_total,
+        "net_inflow_recent": net_inflow_recent,
+        "inflow_ratio": inflow_ratio,
+        "imbalance": imbalance,
+        "anomalies": anomaly_mask.sum(axis=1),
+        "recent_anomalies": anomaly_mask[:, -window:].sum(axis=1),
+        "anomaly_score": anomaly_score,
+        "score": score
+    }
+
+
+def _scan(interval, is_futures):
+    """执行一次全市场扫描，返回按综合得分降序的全部结果"""
+    start_time = time.time()
+    tickers = binance_service.get_24hr_tickers(is_futures)
+    max_candidates = _max_candidates(is_futures)
+    universe, candidates = _candidates(tickers, max_candidates)
+    tickers_by_symbol = {t["symbol"]: t for t in candidates}
+
+    klines, books, errors = _fetch(list(tickers_by_symbol), interval, is_futures)
+    symbols, columns = _matrix({symbol: rows for symbol, rows in klines.items() if symbol not in errors})
+    for symbol in klines:
+        if symbol not in errors and symbol not in symbols:
+            errors[symbol] = [f"{symbol}已收盘K线不足{SCREENER_KLINES_LIMIT}根"]
+
+    results = []
+    if symbols:
+        imbalance = np.array([books[symbol]["imbalance"] for symbol in symbols], dtype=np.float64)
+        scores = score_matrix(columns, imbalance)
+        for i, symbol in enumerate(symbols):
+            ticker = tickers_by_symbol[symbol]
+            results.append({
+                "symbol": symbol,
+                "quote_volume_24h": float(ticker["quoteVolume"]),
+                "price_change_24h": float(ticker["priceChangePercent"]),
+                **{name: (int(values[i]) if values.dtype.kind == "i" else float(values[i]))
+                   for name, values in scores.items()}
+            })
+        results.sort(key=lambda r: r["score"], reverse=True)
+
+    duration = time.time() - start_time
+    logger.info(f"{_family(is_futures)} {interval} 全市场筛选完成: {universe} 个交易对，"
+                f"{len(candidates)} 个候选，{len(results)} 个完成评分，耗时 {duration:.2f} 秒")
+    return {
+        "results": results,
+        "errors": errors,
+        "metadata": {
+            "analysis_time": helpers.get_current_time_str(),
+            "interval": interval,
+            "klines_count": SCREENER_KLINES_LIMIT,
+            "market": _family(is_futures),
+            "quote_asset": SCREENER_QUOTE_ASSET,
+            "universe": universe,
+            "candidates": len(candidates),
+            "min_quote_volume": SCREENER_MIN_QUOTE_VOLUME,
+            "estimated_weight": _ticker_weight(is_futures) + len(candidates) * _symbol_weight(is_futures),
+            "duration": duration
+        }
+    }
+
+
+def _cache_ttl(interval):
+    """扫描结果的缓存时间，不跨越K线收盘"""
+    interval_ms = helpers.interval_to_ms(interval)
+    until_close = (interval_ms - helpers.get_current_time_ms() % interval_ms) / 1000
+    return min(SCREENER_CACHE_TTL, until_close)
+
+
+def _background_scan(interval, is_futures):
+    """以后台请求执行扫描，与其他后台任务共用后台预算，不占用分析接口的权重"""
+    with metrics.span("screener.scan"), rate_limiter.background():
+        return _scan(interval, is_futures)
+
+
+def _get_scan(interval, is_futures):
+    """读取扫描结果，缓存未命中时由抢到扫描锁的请求（跨工作进程）执行扫描
+
+    其他请求在扫描期间返回上一次的结果（metadata.stale为True），没有上一次结果时等待扫描完成。
+    """
+    if SCREENER_CACHE_TTL <= 0:
+        return _background_scan(interval, is_futures)
+
+    cache = get_cache()
+    cache_key = f"screener:{_family(is_futures)}:{interval}"
+    stale_key = f"screener:stale:{_family(is_futures)}:{interval}"
+    lock_key = f"screener:lock:{_family(is_futures)}:{interval}"
+    owner = uuid.uuid4().hex
+    deadline = time.time() + SCREENER_LOCK_TTL
+    looked_up = False
+
+    while True:
+        scan = cache.get(cache_key)
+        if not looked_up:
+            metrics.cache_lookup("screener", scan is not None)
+            looked_up = True
+        if scan is not None:
+            return scan
+
+        if cache.add(lock_key, owner, ttl=SCREENER_LOCK_TTL):
+            try:
+                scan = _background_scan(interval, is_futures)
+                cache.set(cache_key, scan, ttl=_cache_ttl(interval))
+                cache.set(stale_key, scan, ttl=SCREENER_STALE_TTL)
+            finally:
+                cache.delete(lock_key)
+            return scan
+
+        stale = cache.get(stale_key)
+        if stale is not None:
+            return {**stale, "metadata": {**stale["metadata"], "stale": True}}
+        if time.time() > deadline:
+            raise Exception("全市场筛选正在由其他请求执行，请稍后再试")
+        time.sleep(0.5)
+
+
+def screen(interval="1h", is_futures=False, sort="score", top=20, ascending=False):
+    """全市场筛选：返回按指定字段排序的前top个交易对，完整扫描结果短时间缓存，并发请求共享同一次扫描"""
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"排序字段必须是以下之一: {', '.join(SORT_FIELDS)}")
+
+    scan = _get_scan(interval, is_futures)
+    results = sorted(scan["results"], key=lambda r: r[sort], reverse=not ascending)
+    return {**scan, "results": results[:top]}
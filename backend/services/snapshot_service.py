@@ -0,0 +1,217 @@
+"""
+分析快照调度服务
+在每根K线收盘后为关注列表中的交易对和时间间隔重新计算行情分析，按收盘时间保存为带版本的快照，
+分析接口读取当前版本的快照而不再请求币安，币安请求量只取决于关注列表而与用户请求量无关。
+
+多个工作进程中同时运行调度器时，每个版本由抢到共享缓存锁的进程计算（需要使用 sqlite 或 redis 缓存后端），
+其余进程等待该版本完成；持锁进程异常退出时，锁过期后由其他进程接手。
+部分交易对获取失败时，每隔 SNAPSHOT_RETRY_INTERVAL 秒只重试失败的交易对，全部成功（且AI解读已生成）后该版本才算完成。
+
+分析接口只有在请求的交易对列表与关注列表一致时才能直接返回缓存的完整结果（不请求币安和DeepSeek），
+这需要预先生成关注列表的AI解读（SNAPSHOT_AI_ENABLED，默认随快照开启）；其他交易对组合仍会读取快照，但需要请求AI解读。
+"""
+
+import os
+import uuid
+import logging
+import threading
+
+from backend.services import ai_service, pipeline_service
+from backend.utils import helpers, rate_limiter
+from backend.utils.cache import get_cache
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 快照配置：关注列表默认与 /api/symbols 和 /api/intervals 一致
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "False").lower() == "true"
+SNAPSHOT_SYMBOLS = [s.strip().upper() for s in os.getenv("SNAPSHOT_SYMBOLS", ",".join(helpers.DEFAULT_SYMBOLS)).split(",")
+                    if s.strip()]
+SNAPSHOT_INTERVALS = [i.strip() for i in os.getenv("SNAPSHOT_INTERVALS", ",".join(helpers.SUPPORTED_INTERVALS)).split(",")
+                      if i.strip()]
+# K线收盘后等待多久开始计算（毫秒），给币安留出生成已收盘K线的时间
+SNAPSHOT_DELAY_MS = int(os.getenv("SNAPSHOT_DELAY_MS", "2000"))
+# 计算锁的有效期（秒），超过后其他进程可以接手
+SNAPSHOT_LOCK_TTL = float(os.getenv("SNAPSHOT_LOCK_TTL", "120"))
+# 等待其他进程完成或失败后重试的检查间隔（秒）
+SNAPSHOT_RETRY_INTERVAL = float(os.getenv("SNAPSHOT_RETRY_INTERVAL", "5"))
+# 同一版本最多刷新的次数（首次加上重试），达到后不再重试，等待下一根K线
+SNAPSHOT_MAX_ATTEMPTS = int(os.getenv("SNAPSHOT_MAX_ATTEMPTS", "10"))
+# 是否同时预先生成关注列表整体的AI解读（每根K线收盘都会请求DeepSeek），默认随快照开启
+SNAPSHOT_AI_ENABLED = os.getenv("SNAPSHOT_AI_ENABLED", str(SNAPSHOT_ENABLED)).lower() == "true"
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _lock_key(interval, version):
+    return f"snapshot:lock:{interval}:{version}"
+
+
+def _status_key(interval):
+    return f"snapshot:status:{interval}"
+
+
+class SnapshotScheduler:
+    """快照调度器，在后台线程中按各时间间隔的K线收盘时间刷新快照"""
+
+    def __init__(self, symbols=None, intervals=None):
+        self.symbols = symbols or SNAPSHOT_SYMBOLS
+        self.intervals = intervals or SNAPSHOT_INTERVALS
+        self.owner = uuid.uuid4().hex
+        self._refreshed = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台调度线程"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止调度"""
+        self._stop.set()
+
+    def _run(self):
+        """刷新到期的快照，然后等待到下一根K线收盘（或其他进程的计算结果）"""
+        logger.info(f"快照调度已启动: {', '.join(self.symbols)}，时间间隔: {', '.join(self.intervals)}")
+        while not self._stop.is_set():
+            waiting = False
+            for interval in self.intervals:
+                try:
+                    waiting |= not self._check(interval)
+                except Exception as e:
+                    logger.error(f"刷新 {interval} 快照失败: {e}", exc_info=True)
+                    waiting = True
+            self._stop.wait(self._next_wait(waiting))
+
+    def _check(self, interval):
+        """当前版本的快照已完成或已由本进程刷新时返回True，由其他进程计算中或需要重试时返回False"""
+        version = pipeline_service.snapshot_version(interval)
+        if self._refreshed.get(interval) == version:
+            return True
+
+        status = get_status(interval)
+        if status and status["version"] != version:
+            status = None
+        if status and status.get("complete"):
+            self._refreshed[interval] = version
+            return True
+
+        if helpers.get_current_time_ms() - version < SNAPSHOT_DELAY_MS:
+            return True
+
+        cache = get_cache()
+        lock_key = _lock_key(interval, version)
+        if not cache.add(lock_key, self.owner, ttl=SNAPSHOT_LOCK_TTL):
+            return False
+        try:
+            complete = self._refresh(interval, version, status)
+        except Exception:
+            # 释放锁，稍后由本进程或其他进程重试
+            cache.delete(lock_key)
+            raise
+        if not complete:
+            # 释放锁，SNAPSHOT_RETRY_INTERVAL秒后由本进程或其他进程重试未完成的部分
+            cache.delete(lock_key)
+            return False
+        self._refreshed[interval] = version
+        return True
+
+    def _refresh(self, interval, version, previous=None):
+        """计算关注列表的快照（previous为同一版本上次未完成的状态时只重新获取失败的交易对），作为后台请求使用请求权重
+
+        返回该版本是否已完成：全部交易对成功且AI解读已生成，或已达到最大刷新次数。
+        """
+        start_ms = helpers.get_current_time_ms()
+        done = set(previous["symbols"]) if previous else set()
+        attempts = previous.get("attempts", 0) + 1 if previous else 1
+        pending = [symbol for symbol in self.symbols if symbol not in done]
+
+        with rate_limiter.background():
+            errors = {}
+            if pending:
+                _, refreshed, errors = pipeline_service.refresh_snapshot(pending, interval)
+                done.update(refreshed)
+
+            # AI解读缓存关闭时预先生成没有意义
+            warm_up = SNAPSHOT_AI_ENABLED and ai_service.AI_CACHE_ENABLED
+            ai_ready = not warm_up
+            if warm_up and not errors:
+                # 各单元已在快照中，只需请求关注列表整体的AI解读，结果写入AI解读缓存，与分析接口的请求一致
+                try:
+                    pipeline_service.run_analysis(self.symbols, interval)
+                    ai_ready = pipeline_service.get_cached_analysis(self.symbols, interval) is not None
+                except Exception as e:
+                    logger.error(f"预先生成 {interval} AI解读失败: {e}")
+
+        complete = (not errors and ai_ready) or attempts >= SNAPSHOT_MAX_ATTEMPTS
+        status = {
+            "version": version,
+            "interval": interval,
+            "symbols": [symbol for symbol in self.symbols if symbol in done],
+            "errors": errors,
+            "ai_ready": ai_ready,
+            "attempts": attempts,
+            "complete": complete,
+            "refreshed_at": helpers.get_current_time_str(),
+            "duration": (helpers.get_current_time_ms() - start_ms) / 1000
+        }
+        get_cache().set(_status_key(interval), status, ttl=helpers.interval_to_ms(interval) / 1000 * 2)
+        logger.info(f"{interval} 快照已刷新（版本 {helpers.format_timestamp_ms(version)}，第 {attempts} 次）: "
+                    f"{len(status['symbols'])}/{len(self.symbols)} 个交易对，耗时 {status['duration']:.2f} 秒")
+        if errors or not ai_ready:
+            message = f"{interval} 快照未完成（{f'失败的交易对: {errors}' if errors else 'AI解读未生成'}）"
+            if complete:
+                logger.error(f"{message}，已达到最大刷新次数 {SNAPSHOT_MAX_ATTEMPTS}，等待下一根K线")
+            else:
+                logger.warning(f"{message}，{SNAPSHOT_RETRY_INTERVAL} 秒后重试")
+        return complete
+
+    def _next_wait(self, waiting):
+        """距离下一次需要检查的时间（秒）：最近一根K线收盘后SNAPSHOT_DELAY_MS"""
+        now_ms = helpers.get_current_time_ms()
+        next_ms = None
+        for interval in self.intervals:
+            due_ms = pipeline_service.snapshot_version(interval, now_ms) + SNAPSHOT_DELAY_MS
+            if due_ms <= now_ms:
+                due_ms += helpers.interval_to_ms(interval)
+            next_ms = due_ms if next_ms is None else min(next_ms, due_ms)
+        wait = max((next_ms - now_ms) / 1000, 0)
+        return min(wait, SNAPSHOT_RETRY_INTERVAL) if waiting else wait
+
+
+def start():
+    """启动快照调度（需要在每个工作进程中调用，线程无法跨fork继承）"""
+    global _scheduler
+
+    if not SNAPSHOT_ENABLED:
+        return
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SnapshotScheduler()
+            _scheduler.start()
+
+
+def stop():
+    """停止快照调度"""
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
+
+
+def get_status(interval=None):
+    """快照状态：指定时间间隔时返回该间隔最近一次刷新的信息，否则返回所有关注的时间间隔"""
+    if interval is not None:
+        return get_cache().get(_status_key(interval))
+    return {
+        "enabled": SNAPSHOT_ENABLED,
+        "symbols": SNAPSHOT_SYMBOLS,
+        "intervals": {i: get_cache().get(_status_key(i)) for i in SNAPSHOT_INTERVALS}
+    }
@@ -0,0 +1,100 @@
+"""
+异步HTTP客户端
+ASGI模式下使用的httpx异步客户端，连接池、代理和5xx退避重试（只重试GET）的设置与 http_client 一致。
+每个事件循环使用独立的客户端（uvicorn工作进程中只有一个事件循环）。
+"""
+
+import asyncio
+import logging
+import weakref
+from contextlib import asynccontextmanager
+
+import httpx
+
+from backend.utils.http_client import (
+    POOL_SIZES, DEFAULT_POOL_SIZE, HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR, RETRY_STATUS_CODES, RETRY_METHODS, get_proxies
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def _create_transport(pool_size, url):
+    """创建带连接池的传输层，连接失败时由httpx自动重试"""
+    proxies = get_proxies() or {}
+    return httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        proxy=proxies.get("https" if url.startswith("https") else "http"),
+        retries=HTTP_MAX_RETRIES
+    )
+
+
+def _create_client():
+    """创建异步客户端，并按主机挂载独立的连接池"""
+    mounts = {
+        "https://": _create_transport(DEFAULT_POOL_SIZE, "https://"),
+        "http://": _create_transport(DEFAULT_POOL_SIZE, "http://"),
+    }
+    for prefix, pool_size in POOL_SIZES.items():
+        mounts[prefix] = _create_transport(pool_size, prefix)
+    return httpx.AsyncClient(mounts=mounts, trust_env=False)
+
+
+def get_client():
+    """获取当前事件循环共享的异步客户端"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = _create_client()
+    return client
+
+
+def _retry_delay(response, attempt):
+    """重试等待时间：优先使用Retry-After，否则按指数退避"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return HTTP_BACKOFF_FACTOR * (2 ** attempt)
+
+
+@asynccontextmanager
+async def stream(method, url, **kwargs):
+    """发送请求并以流式读取响应，GET请求的响应状态为5xx时在读取前退避重试"""
+    client = get_client()
+    retries = HTTP_MAX_RETRIES if method in RETRY_METHODS else 0
+    for attempt in range(retries + 1):
+        async with client.stream(method, url, **kwargs) as response:
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                delay = _retry_delay(response, attempt)
+                logger.warning(f"{method} {url} 返回 {response.status_code}，{delay:.1f} 秒后重试")
+            else:
+                yield response
+                return
+        await asyncio.sleep(delay)
+
+
+async def request(method, url, **kwargs):
+    """发送请求并读取完整响应，GET请求的响应状态为5xx时退避重试"""
+    async with stream(method, url, **kwargs) as response:
+        await response.aread()
+        return response
+
+
+async def get(url, **kwargs):
+    """发送GET请求"""
+    return await request("GET", url, **kwargs)
+
+
+async def post(url, **kwargs):
+    """发送POST请求"""
+    return await request("POST", url, **kwargs)
+
+
+async def close():
+    """关闭当前事件循环的客户端"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,307 @@
+"""
+缓存后端
+提供可插拔的键值缓存，供各服务在gunicorn多个工作进程之间共享计算结果
+
+支持的后端（通过环境变量 CACHE_BACKEND 选择）：
+- memory: 进程内LRU缓存（默认，仅在当前进程内有效）
+- sqlite: 本地SQLite文件，同一台机器上的所有工作进程共享
+- redis:  Redis兼容服务，可跨机器共享
+
+sqlite和redis的读写是阻塞调用，事件循环（ASGI模式）中通过 call_async 在线程池中执行。
+"""
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 缓存配置
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "/tmp/binanceflow_cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "binanceflow:")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class CacheBackend:
+    """缓存后端接口，值必须可以JSON序列化，ttl单位为秒，None表示不过期"""
+
+    # 读写是否需要等待磁盘或网络I/O
+    blocking = True
+
+    def get(self, key):
+        """读取缓存，不存在或已过期时返回None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """写入缓存"""
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """仅当键不存在时写入，返回是否写入成功"""
+        raise NotImplementedError
+
+    def incr(self, key, amount=1, ttl=None):
+        """原子地增加数值并返回新值，键不存在时从0开始并设置ttl（已存在时保持原有过期时间）"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        """删除缓存"""
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """进程内LRU缓存，值按引用保存，调用方不应修改读取到的对象"""
+
+    blocking = False
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_entry(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _set_entry(self, key, value, ttl, now):
+        self._data[key] = (value, now + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._get_entry(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set_entry(key, value, ttl, time.time())
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            now = time.time()
+            if self._get_entry(key, now):
+                return False
+            self._set_entry(key, value, ttl, now)
+            return True
+
+    def incr(self, key, amount=1, ttl=None):
+        with self._lock:
+            now = time.time()
+            entry = self._get_entry(key, now)
+            if entry:
+                value = entry[0] + amount
+                self._data[key] = (value, entry[1])
+            else:
+                value = amount
+                self._set_entry(key, value, ttl, now)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteCache(CacheBackend):
+    """基于本地SQLite文件的缓存，同一台机器上的多个进程共享"""
+
+    def __init__(self, path=CACHE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_count = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self):
+        """每个线程（以及fork后的子进程）使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _purge_expired(self, conn):
+        """定期清理过期条目"""
+        self._write_count += 1
+        if self._write_count % 1000 == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        expires_at = time.time() + ttl if ttl is not None else None
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at)
+        )
+        self._purge_expired(conn)
+
+    def add(self, key, value, ttl=None):
+        conn = self._connect()
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def incr(self, key, amount=1, ttl=None):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+            ).fetchone()
+            if row:
+                value = json.loads(row[0]) + amount
+                conn.execute("UPDATE cache SET value = ? WHERE key = ?", (json.dumps(value), key))
+            else:
+                value = amount
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now + ttl if ttl is not None else None)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisCache(CacheBackend):
+    """Redis兼容缓存，client可以是redis.Redis或任何实现了get/set/delete/incrbyfloat的兼容客户端"""
+
+    def __init__(self, url=CACHE_REDIS_URL, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise Exception("使用Redis缓存需要安装redis库: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, json.dumps(value), px=int(ttl * 1000) if ttl is not None else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(key, json.dumps(value), px=int(ttl * 1000) if ttl is not None else None, nx=True))
+
+    def incr(self, key, amount=1, ttl=None):
+        # 先以nx方式创建带过期时间的键，INCRBYFLOAT不会改变已有的过期时间
+        self.client.set(key, 0, px=int(ttl * 1000) if ttl is not None else None, nx=True)
+        return float(self.client.incrbyfloat(key, amount))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class PrefixedCache(CacheBackend):
+    """为所有键添加统一前缀，避免与同一存储中的其他应用冲突"""
+
+    def __init__(self, backend, prefix=CACHE_KEY_PREFIX):
+        self.backend = backend
+        self.prefix = prefix
+
+    @property
+    def blocking(self):
+        return getattr(self.backend, "blocking", True)
+
+    def get(self, key):
+        return self.backend.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(self.prefix + key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        return self.backend.add(self.prefix + key, value, ttl)
+
+    def incr(self, key, amount=1, ttl=None):
+        return self.backend.incr(self.prefix + key, amount, ttl)
+
+    def delete(self, key):
+        self.backend.delete(self.prefix + key)
+
+
+def create_cache(backend=CACHE_BACKEND):
+    """根据名称创建缓存后端"""
+    if backend == "memory":
+        cache = MemoryCache()
+    elif backend == "sqlite":
+        cache = SQLiteCache()
+    elif backend == "redis":
+        cache = RedisCache()
+    else:
+        raise ValueError(f"不支持的缓存后端: {backend}")
+    logger.info(f"使用缓存后端: {backend}")
+    return PrefixedCache(cache)
+
+
+def get_cache():
+    """获取当前进程共享的缓存实例"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache()
+    return _cache
+
+
+def set_cache(cache):
+    """替换当前进程使用的缓存实例（例如接入自定义的Redis兼容客户端）"""
+    global _cache
+    _cache = cache
+
+
+async def call_async(fn, *args, **kwargs):
+    """在事件循环中调用会读写缓存的同步函数：缓存读写会阻塞时在线程池中执行（继承当前上下文），进程内缓存直接调用"""
+    if getattr(get_cache(), "blocking", True):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
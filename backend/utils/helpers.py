@@ -5,17 +5,63 @@
 
 from datetime import datetime
 import logging
+import math
+import time
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 默认交易对和可用的K线时间间隔（即 /api/symbols 和 /api/intervals 返回的列表）
+DEFAULT_SYMBOLS = ["BTCUSDT", "ETHUSDT"]
+SUPPORTED_INTERVALS = ["5m", "15m", "30m", "1h", "4h", "1d"]
+
+# K线周期单位对应的毫秒数
+_INTERVAL_UNIT_MS = {
+    "s": 1000,
+    "m": 60 * 1000,
+    "h": 60 * 60 * 1000,
+    "d": 24 * 60 * 60 * 1000,
+    "w": 7 * 24 * 60 * 60 * 1000
+}
+
+
+def json_safe(value):
+    """将数据中的非有限浮点数（如卖盘为空时的买卖压力比inf）替换为None，
+    使序列化结果是浏览器JSON.parse可以解析的标准JSON"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
 
 def get_current_time_str():
     """获取当前时间字符串"""
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 
+def format_timestamp_ms(timestamp_ms):
+    """将毫秒时间戳格式化为时间字符串"""
+    return datetime.fromtimestamp(int(timestamp_ms) / 1000).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_current_time_ms():
+    """获取当前毫秒时间戳"""
+    return int(time.time() * 1000)
+
+
+def interval_to_ms(interval):
+    """将K线时间间隔（如5m、1h、1d）转换为毫秒数"""
+    unit = interval[-1:]
+    count = interval[:-1]
+    if unit not in _INTERVAL_UNIT_MS or not count.isdigit():
+        raise ValueError(f"不支持的K线时间间隔: {interval}")
+    return int(count) * _INTERVAL_UNIT_MS[unit]
+
+
 def create_analysis_metadata(interval, symbols, klines_count=50):
     """创建分析元数据"""
     return {
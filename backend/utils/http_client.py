@@ -0,0 +1,184 @@
+"""
+HTTP客户端
+提供进程内共享的HTTP会话，复用连接池和keep-alive连接，并在5xx时自动退避重试
+429不重试：币安对收到429后继续请求的IP升级为418封禁，由 rate_limiter 记录暂停时间后直接失败
+只有GET请求在读取超时和5xx时重试；POST（DeepSeek生成解读）不是幂等的，重试会重复生成和计费，只在连接建立失败（请求尚未发出）时重试
+在 deadline() 范围内发出的请求（包括通过 rate_limiter.submit 提交到线程池的请求）的超时不超过剩余时间
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import quote_plus
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 代理设置
+USE_PROXY = os.getenv("USE_PROXY", "False").lower() == "true"
+HTTP_PROXY = os.getenv("HTTP_PROXY")
+HTTPS_PROXY = os.getenv("HTTPS_PROXY")
+PROXY_USERNAME = os.getenv("PROXY_USERNAME")
+PROXY_PASSWORD = os.getenv("PROXY_PASSWORD")
+
+# 各主机的连接池大小（gunicorn每个工作进程内的并发连接上限）
+POOL_SIZES = {
+    "https://api.binance.com": int(os.getenv("HTTP_POOL_SIZE_BINANCE", "16")),
+    "https://fapi.binance.com": int(os.getenv("HTTP_POOL_SIZE_BINANCE_FUTURES", "16")),
+    "https://api.deepseek.com": int(os.getenv("HTTP_POOL_SIZE_DEEPSEEK", "4")),
+}
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "8"))
+
+# 重试设置
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5"))
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+RETRY_METHODS = frozenset(["GET"])
+
+_session = None
+_session_lock = threading.Lock()
+_proxies = None
+_proxies_loaded = False
+# 当前上下文中请求的截止时间（时间戳），None表示不限制
+_deadline = contextvars.ContextVar("http_request_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """已超过请求截止时间"""
+
+
+@contextmanager
+def deadline(timestamp):
+    """在代码块内发出的请求必须在timestamp之前完成"""
+    token = _deadline.set(timestamp)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """距离当前上下文截止时间的秒数，没有截止时间时返回None"""
+    timestamp = _deadline.get()
+    return None if timestamp is None else timestamp - time.time()
+
+
+def _request_timeout(timeout):
+    """按截止时间收紧请求超时（秒数或(连接, 读取)元组），已超过截止时间时抛出DeadlineExceededError"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceededError("已超过请求截止时间")
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    return min(timeout, left)
+
+
+def _build_proxy_url(proxy):
+    """为代理地址添加认证信息"""
+    if PROXY_USERNAME and PROXY_PASSWORD:
+        username = quote_plus(PROXY_USERNAME)
+        password = quote_plus(PROXY_PASSWORD)
+        return proxy.replace("://", f"://{username}:{password}@")
+    return proxy
+
+
+def get_proxies():
+    """获取代理设置（仅在首次调用时解析并记录日志）"""
+    global _proxies, _proxies_loaded
+
+    if _proxies_loaded:
+        return _proxies
+
+    proxies = {}
+    if USE_PROXY:
+        if HTTP_PROXY:
+            proxies['http'] = _build_proxy_url(HTTP_PROXY)
+        if HTTPS_PROXY:
+            proxies['https'] = _build_proxy_url(HTTPS_PROXY)
+
+        if proxies:
+            # 在日志中隐藏密码
+            logged_proxies = {k: v.replace(PROXY_PASSWORD, '******') if PROXY_PASSWORD and v else v
+                              for k, v in proxies.items()}
+            logger.info(f"使用代理: {logged_proxies}")
+        else:
+            logger.warning("USE_PROXY=True 但未配置代理地址")
+
+    _proxies = proxies if proxies else None
+    _proxies_loaded = True
+    return _proxies
+
+
+def _create_adapter(pool_size):
+    """创建带连接池和重试策略的适配器"""
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=RETRY_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    return HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+
+def _create_session():
+    """创建共享会话，并按主机挂载独立的连接池"""
+    session = requests.Session()
+    session.mount("https://", _create_adapter(DEFAULT_POOL_SIZE))
+    session.mount("http://", _create_adapter(DEFAULT_POOL_SIZE))
+    for prefix, pool_size in POOL_SIZES.items():
+        session.mount(prefix, _create_adapter(pool_size))
+
+    proxies = get_proxies()
+    if proxies:
+        session.proxies.update(proxies)
+        # requests每次请求会合并环境变量中的HTTP(S)_PROXY并覆盖session.proxies（丢失代理认证信息）
+        session.trust_env = False
+    return session
+
+
+def get_session():
+    """获取当前进程共享的HTTP会话"""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def get(url, **kwargs):
+    """发送GET请求"""
+    kwargs["timeout"] = _request_timeout(kwargs.get("timeout"))
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    """发送POST请求"""
+    kwargs["timeout"] = _request_timeout(kwargs.get("timeout"))
+    return get_session().post(url, **kwargs)
+
+
+def _reset_after_fork():
+    """子进程中丢弃从父进程继承的会话，避免多个工作进程共用同一套socket"""
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
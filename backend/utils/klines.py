@@ -0,0 +1,151 @@
+"""
+K线数据容器
+以列式数组保存K线数据，时间戳保存为毫秒整数，仅在序列化时格式化
+"""
+
+import numpy as np
+
+from backend.utils import helpers
+
+# K线字段（与原始K线字典的键一致）
+KLINE_FIELDS = (
+    "open_time", "close_time", "open", "high", "low", "close", "volume",
+    "quote_volume", "buy_volume", "sell_volume", "net_inflow", "price_change_pct"
+)
+_TIME_FIELDS = ("open_time", "close_time")
+
+
+def derive_flow(open_price, close_price, volume, quote_volume, taker_buy_volume, taker_buy_quote_volume):
+    """由K线的成交量和主动买入量计算买入量、卖出量、净流入和涨跌幅，支持数组和标量"""
+    # 主动买入量来自K线的第9、10个字段，其余成交量为主动卖出
+    buy_volume = taker_buy_volume
+    sell_volume = volume - taker_buy_volume
+
+    # 计算净流入资金（计价货币）：主动买入成交额 - 主动卖出成交额
+    net_inflow = 2 * taker_buy_quote_volume - quote_volume
+    # 计算价格变化百分比
+    price_change_pct = ((close_price - open_price) / open_price) * 100
+    return buy_volume, sell_volume, net_inflow, price_change_pct
+
+
+class Klines:
+    """列式K线数据，每个字段是一个等长的numpy数组"""
+
+    __slots__ = KLINE_FIELDS
+
+    def __init__(self, **columns):
+        for field in KLINE_FIELDS:
+            dtype = np.int64 if field in _TIME_FIELDS else np.float64
+            setattr(self, field, np.asarray(columns[field], dtype=dtype))
+
+    @classmethod
+    def from_columns(cls, open_time, close_time, open_price, high, low, close_price, volume, quote_volume,
+                     taker_buy_volume, taker_buy_quote_volume):
+        """从币安K线的各列（数值数组）构建"""
+        buy_volume, sell_volume, net_inflow, price_change_pct = derive_flow(
+            open_price, close_price, volume, quote_volume, taker_buy_volume, taker_buy_quote_volume
+        )
+        return cls(
+            open_time=open_time,
+            close_time=close_time,
+            open=open_price,
+            high=high,
+            low=low,
+            close=close_price,
+            volume=volume,
+            quote_volume=quote_volume,
+            buy_volume=buy_volume,
+            sell_volume=sell_volume,
+            net_inflow=net_inflow,
+            price_change_pct=price_change_pct
+        )
+
+    @classmethod
+    def from_raw(cls, rows):
+        """从币安原始K线行构建"""
+        if not rows:
+            return cls.empty()
+
+        data = np.array(rows, dtype=object)
+        return cls.from_columns(
+            *(data[:, i].astype(np.int64) for i in (0, 6)),
+            *(data[:, i].astype(np.float64) for i in (1, 2, 3, 4, 5, 7, 9, 10))
+        )
+
+    @classmethod
+    def empty(cls):
+        """创建空的K线数据"""
+        return cls(**{field: [] for field in KLINE_FIELDS})
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, index):
+        """切片返回新的Klines，整数下标返回单根K线的字典"""
+        if isinstance(index, slice):
+            return Klines(**{field: getattr(self, field)[index] for field in KLINE_FIELDS})
+        return self.record(index)
+
+    def resample(self, interval_ms):
+        """聚合为更长周期的K线（按UTC对齐，只保留包含全部基础K线的完整周期，不支持周线）"""
+        if not len(self):
+            return self
+
+        base_ms = int(self.close_time[0] - self.open_time[0]) + 1
+        if interval_ms % base_ms:
+            raise ValueError(f"无法将 {base_ms}ms 周期的K线聚合为 {interval_ms}ms 周期")
+
+        # 每个目标周期的第一根基础K线的位置
+        buckets = self.open_time // interval_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(self)]
+        complete = (ends - starts) == interval_ms // base_ms
+
+        open_price = self.open[starts]
+        close_price = self.close[ends - 1]
+        columns = {
+            "open_time": self.open_time[starts],
+            "close_time": self.close_time[ends - 1],
+            "open": open_price,
+            "high": np.maximum.reduceat(self.high, starts),
+            "low": np.minimum.reduceat(self.low, starts),
+            "close": close_price,
+            "price_change_pct": ((close_price - open_price) / open_price) * 100
+        }
+        for field in ("volume", "quote_volume", "buy_volume", "sell_volume", "net_inflow"):
+            columns[field] = np.add.reduceat(getattr(self, field), starts)
+
+        return Klines(**{field: values[complete] for field, values in columns.items()})
+
+    def record(self, index):
+        """返回单根K线的字典，时间格式化为字符串"""
+        return {
+            field: helpers.format_timestamp_ms(getattr(self, field)[index]) if field in _TIME_FIELDS
+            else float(getattr(self, field)[index])
+            for field in KLINE_FIELDS
+        }
+
+    def to_records(self):
+        """转换为K线字典列表"""
+        return [self.record(i) for i in range(len(self))]
+
+    def summary(self):
+        """汇总K线数据"""
+        if not len(self):
+            return {
+                "first_time": None,
+                "last_time": None,
+                "price_change": 0,
+                "current_price": 0,
+                "total_volume": 0,
+                "total_quote_volume": 0
+            }
+
+        return {
+            "first_time": helpers.format_timestamp_ms(self.open_time[0]),
+            "last_time": helpers.format_timestamp_ms(self.close_time[-1]),
+            "price_change": float((self.close[-1] - self.open[0]) / self.open[0] * 100),
+            "current_price": float(self.close[-1]),
+            "total_volume": float(self.volume.sum()),
+            "total_quote_volume": float(self.quote_volume.sum())
+        }
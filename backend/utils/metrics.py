@@ -0,0 +1,128 @@
+"""
+性能指标
+记录分析流水线各阶段的耗时（每项数据获取、每个分析函数、AI解读）、币安和DeepSeek接口的响应时间、
+各级缓存的命中情况和进行中的任务数，通过 /metrics 以Prometheus格式输出。
+
+gunicorn多进程部署时由 gunicorn.conf.py 设置 PROMETHEUS_MULTIPROC_DIR，各工作进程把指标写入该目录，
+/metrics 汇总所有工作进程的数据（无论请求落到哪个进程）；单进程运行时直接输出当前进程的指标。
+"""
+
+import os
+import time
+import inspect
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 是否记录和输出性能指标
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"
+
+# 分析函数单次耗时在毫秒以下，阶段耗时的分桶从0.1毫秒开始
+_STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                  1, 2.5, 5, 10, 30, 60, 120)
+_UPSTREAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_DURATION = Histogram(
+    "binanceflow_stage_duration_seconds", "分析流水线各阶段的耗时", ["stage"], buckets=_STAGE_BUCKETS)
+UPSTREAM_DURATION = Histogram(
+    "binanceflow_upstream_request_duration_seconds", "币安和DeepSeek接口的响应时间",
+    ["service", "endpoint", "status"], buckets=_UPSTREAM_BUCKETS)
+CACHE_LOOKUPS = Counter(
+    "binanceflow_cache_lookups_total", "各级缓存的查询次数", ["cache", "result"])
+JOBS_IN_FLIGHT = Gauge(
+    "binanceflow_jobs_in_flight", "当前排队和执行中的分析任务数", ["state"], multiprocess_mode="livesum")
+ANALYSES_IN_FLIGHT = Gauge(
+    "binanceflow_analyses_in_flight", "当前进行中的分析流程数（任务、流式请求和快照）", multiprocess_mode="livesum")
+
+
+def observe_stage(stage, seconds):
+    """记录一个阶段的耗时"""
+    if METRICS_ENABLED:
+        STAGE_DURATION.labels(stage).observe(seconds)
+
+
+@contextmanager
+def span(stage):
+    """记录代码块的耗时（无论是否抛出异常）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """记录函数每次调用耗时的装饰器，支持普通函数和协程函数"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_upstream(service, endpoint, status, seconds):
+    """记录一次外部接口请求的响应时间，status为HTTP状态码，未收到响应时为error"""
+    if METRICS_ENABLED:
+        UPSTREAM_DURATION.labels(service, endpoint, str(status)).observe(seconds)
+
+
+def cache_lookup(cache, hit):
+    """记录一次缓存查询是否命中"""
+    if METRICS_ENABLED:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def job_state(previous, current):
+    """任务状态变化时更新进行中的任务数，previous或current为None表示任务新建或结束"""
+    if not METRICS_ENABLED:
+        return
+    if previous is not None:
+        JOBS_IN_FLIGHT.labels(previous).dec()
+    if current is not None:
+        JOBS_IN_FLIGHT.labels(current).inc()
+
+
+@contextmanager
+def analysis_in_flight():
+    """记录进行中的分析流程数"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    ANALYSES_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        ANALYSES_IN_FLIGHT.dec()
+
+
+def render():
+    """以Prometheus文本格式输出指标，返回 (内容, Content-Type)"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """工作进程退出后移除其实时指标（进行中的任务数），已累计的耗时和计数仍保留"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,237 @@
+"""
+币安请求权重调度
+按现货和期货两个接口族分别统计每分钟已用的请求权重，超出预算时让请求等待到下一个窗口，
+并用响应头 X-MBX-USED-WEIGHT-1M 校准统计值。
+
+已用权重保存在共享缓存中，多个gunicorn工作进程共用同一份预算（需要使用 sqlite 或 redis 缓存后端）。
+后台请求（行情采集回补、归档回补等）只能使用一部分预算，并且在有交互请求等待时主动让出。
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from backend.utils import http_client
+from backend.utils.cache import call_async, get_cache
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 权重调度配置
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() == "true"
+# 各接口族每分钟的权重上限
+RATE_LIMIT_WEIGHTS = {
+    "spot": int(os.getenv("RATE_LIMIT_SPOT_WEIGHT", "6000")),
+    "futures": int(os.getenv("RATE_LIMIT_FUTURES_WEIGHT", "2400")),
+}
+# 只使用上限的一部分，给其他使用同一IP的程序留出余量
+RATE_LIMIT_SAFETY = float(os.getenv("RATE_LIMIT_SAFETY", "0.8"))
+# 后台请求最多使用的预算比例
+RATE_LIMIT_BACKGROUND_SHARE = float(os.getenv("RATE_LIMIT_BACKGROUND_SHARE", "0.5"))
+# 交互请求和后台请求等待权重的最长时间（秒），超过后放弃请求
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+RATE_LIMIT_BACKGROUND_MAX_WAIT = float(os.getenv("RATE_LIMIT_BACKGROUND_MAX_WAIT", "120"))
+
+# 请求优先级
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_WINDOW_MS = 60 * 1000
+# 当前请求优先级：协程任务自动继承；提交到线程池的任务需要通过submit继承
+_priority = contextvars.ContextVar("binance_request_priority", default=INTERACTIVE)
+_waiting_interactive = 0
+_waiting_lock = threading.Lock()
+
+
+class RateLimitExceededError(Exception):
+    """等待请求权重超时"""
+
+
+@contextmanager
+def background():
+    """将当前上下文中之后的币安请求标记为后台请求（包括通过submit提交到线程池的请求）"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    """当前上下文的请求优先级"""
+    return _priority.get()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """向线程池提交任务，任务在提交时的上下文中执行，继承当前的请求优先级和请求截止时间"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def request_weight(family, path, params=None):
+    """估算请求权重（以币安文档为准，实际用量由响应头校准）"""
+    params = params or {}
+    limit = int(params.get("limit", 100))
+
+    if path.endswith("/depth"):
+        if family == "futures":
+            return 2 if limit <= 50 else 5 if limit <= 100 else 10 if limit <= 500 else 20
+        return 5 if limit <= 100 else 25 if limit <= 500 else 50 if limit <= 1000 else 250
+    if path.endswith("/klines"):
+        if family == "futures":
+            return 1 if limit < 100 else 2 if limit < 500 else 5 if limit <= 1000 else 10
+        return 2
+    if path.endswith("/aggTrades"):
+        return 20 if family == "futures" else 4
+    if path.endswith("/ticker/24hr"):
+        # 不指定交易对时返回全市场行情
+        if "symbol" in params:
+            return 1 if family == "futures" else 2
+        return 40 if family == "futures" else 80
+    return 1
+
+
+def _used_key(family, window):
+    return f"ratelimit:{family}:{window}"
+
+
+def _ban_key(family):
+    return f"ratelimit:{family}:banned_until"
+
+
+def _budget(family, priority):
+    budget = RATE_LIMIT_WEIGHTS[family] * RATE_LIMIT_SAFETY
+    return budget * RATE_LIMIT_BACKGROUND_SHARE if priority == BACKGROUND else budget
+
+
+def _try_acquire(cache, family, weight, priority, budget):
+    """尝试预留一次权重，成功时返回None，否则返回建议的等待毫秒数"""
+    now_ms = int(time.time() * 1000)
+    banned_until = cache.get(_ban_key(family))
+    if banned_until and banned_until > now_ms:
+        return banned_until - now_ms
+    if priority == BACKGROUND and _waiting_interactive > 0:
+        # 有交互请求在等待权重时，后台请求让出
+        return 50
+
+    key = _used_key(family, now_ms // _WINDOW_MS)
+    used = cache.incr(key, weight, ttl=2 * _WINDOW_MS / 1000)
+    if used <= budget:
+        return None
+    cache.incr(key, -weight, ttl=2 * _WINDOW_MS / 1000)
+    return _WINDOW_MS - now_ms % _WINDOW_MS
+
+
+@contextmanager
+def _waiting(priority):
+    """记录当前进程中正在等待权重的交互请求数"""
+    global _waiting_interactive
+
+    if priority == INTERACTIVE:
+        with _waiting_lock:
+            _waiting_interactive += 1
+    try:
+        yield
+    finally:
+        if priority == INTERACTIVE:
+            with _waiting_lock:
+                _waiting_interactive -= 1
+
+
+def _check_deadline(family, wait_ms, deadline):
+    """等待后会超过截止时间时放弃请求"""
+    if time.time() + wait_ms / 1000 > deadline:
+        raise RateLimitExceededError(f"币安{family}接口请求权重不足，需要等待{wait_ms / 1000:.1f}秒")
+
+
+def _deadline(priority):
+    """按优先级计算最长等待的截止时间，不超过当前上下文的请求截止时间"""
+    max_wait = RATE_LIMIT_BACKGROUND_MAX_WAIT if priority == BACKGROUND else RATE_LIMIT_MAX_WAIT
+    left = http_client.remaining()
+    return time.time() + (max_wait if left is None else min(max_wait, left))
+
+
+def acquire(family, weight, priority=None):
+    """预留请求权重，预算不足时等待到下一个窗口，超过最长等待时间时抛出RateLimitExceededError"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    priority = priority or current_priority()
+    budget = _budget(family, priority)
+    deadline = _deadline(priority)
+    cache = get_cache()
+
+    with _waiting(priority):
+        while True:
+            wait_ms = _try_acquire(cache, family, weight, priority, budget)
+            if wait_ms is None:
+                return
+            _check_deadline(family, wait_ms, deadline)
+            time.sleep(min(wait_ms / 1000, 1.0))
+
+
+async def acquire_async(family, weight, priority=None):
+    """acquire的异步版本，等待期间和读写共享缓存时不占用事件循环"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    priority = priority or current_priority()
+    budget = _budget(family, priority)
+    deadline = _deadline(priority)
+    cache = get_cache()
+
+    with _waiting(priority):
+        while True:
+            wait_ms = await call_async(_try_acquire, cache, family, weight, priority, budget)
+            if wait_ms is None:
+                return
+            _check_deadline(family, wait_ms, deadline)
+            await asyncio.sleep(min(wait_ms / 1000, 1.0))
+
+
+def observe(family, response):
+    """根据响应头校准已用权重，遇到429/418时记录需要暂停的时间"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    cache = get_cache()
+    now_ms = int(time.time() * 1000)
+
+    used_weight = response.headers.get("X-MBX-USED-WEIGHT-1M")
+    if used_weight is not None:
+        key = _used_key(family, now_ms // _WINDOW_MS)
+        current = cache.get(key) or 0
+        # 服务器统计的是整个IP的用量，只向上校准，避免覆盖其他进程刚预留的权重
+        if int(used_weight) > current:
+            cache.incr(key, int(used_weight) - current, ttl=2 * _WINDOW_MS / 1000)
+
+    if response.status_code in (418, 429):
+        retry_after = int(response.headers.get("Retry-After") or 60)
+        cache.set(_ban_key(family), now_ms + retry_after * 1000, ttl=retry_after)
+        logger.warning(f"币安{family}接口返回 {response.status_code}，暂停请求 {retry_after} 秒")
+
+
+def get_status():
+    """各接口族当前窗口的权重使用情况"""
+    cache = get_cache()
+    now_ms = int(time.time() * 1000)
+    status = {}
+    for family, limit in RATE_LIMIT_WEIGHTS.items():
+        used = cache.get(_used_key(family, now_ms // _WINDOW_MS)) or 0
+        budget = _budget(family, INTERACTIVE)
+        banned_until = cache.get(_ban_key(family))
+        status[family] = {
+            "limit": limit,
+            "budget": budget,
+            "background_budget": _budget(family, BACKGROUND),
+            "used": used,
+            "remaining": max(budget - used, 0),
+            "usage_pct": used / budget * 100 if budget else 0,
+            "resets_in": (_WINDOW_MS - now_ms % _WINDOW_MS) / 1000,
+            "banned_for": max(banned_until - now_ms, 0) / 1000 if banned_until else 0
+        }
+    return {"enabled": RATE_LIMIT_ENABLED, "families": status}
@@ -9,6 +9,10 @@ class AnalysisResults {
         this.results = null;
         this.isLoading = false;
         this.error = null;
+        this.progressMessage = null;
+        this.partialInterpretation = '';
+        this.interpretationNode = null;
+        this.interpretationFrame = null;
         this.render();
     }
 
@@ -19,9 +23,48 @@ class AnalysisResults {
     setLoading(isLoading) {
         this.isLoading = isLoading;
         this.error = null;
+        this.progressMessage = null;
+        this.partialInterpretation = '';
         this.render();
     }
 
+    /**
+     * 更新分析进度
+     * @param {string} message - 进度消息
+     */
+    setProgress(message) {
+        this.progressMessage = message;
+        this.render();
+    }
+
+    /**
+     * 追加流式返回的AI解读片段
+     * @param {string} content - 解读片段
+     */
+    appendInterpretation(content) {
+        this.partialInterpretation += content;
+        // 同一帧内收到的片段合并为一次更新
+        if (this.interpretationFrame === null) {
+            this.interpretationFrame = requestAnimationFrame(() => this.renderInterpretation());
+        }
+    }
+
+    /**
+     * 只更新部分AI解读节点，不重新渲染整个组件
+     */
+    renderInterpretation() {
+        this.interpretationFrame = null;
+        if (!this.isLoading || !this.partialInterpretation) {
+            return;
+        }
+        if (!this.interpretationNode) {
+            this.interpretationNode = document.createElement('div');
+            this.interpretationNode.className = 'markdown-content';
+            this.container.appendChild(this.interpretationNode);
+        }
+        this.interpretationNode.innerHTML = marked.parse(this.partialInterpretation);
+    }
+
     /**
      * 设置结果数据
      * @param {Object} results - 分析结果数据
@@ -57,8 +100,15 @@ class AnalysisResults {
      * 渲染组件
      */
     render() {
+        // 完整渲染会包含已收到的解读片段，取消待执行的解读更新
+        if (this.interpretationFrame !== null) {
+            cancelAnimationFrame(this.interpretationFrame);
+            this.interpretationFrame = null;
+        }
+
         // 清空容器
         this.container.innerHTML = '';
+        this.interpretationNode = null;
 
         // 如果正在加载，显示加载动画
         if (this.isLoading) {
@@ -70,12 +120,15 @@ class AnalysisResults {
             
             const loadingText = document.createElement('p');
             loadingText.className = 'mt-3';
-            loadingText.textContent = '正在分析，请稍候...';
+            loadingText.textContent = this.progressMessage || '正在分析，请稍候...';
             
             loadingContainer.appendChild(spinner);
             loadingContainer.appendChild(loadingText);
             
             this.container.appendChild(loadingContainer);
+
+            // 显示已收到的部分AI解读
+            this.renderInterpretation();
             return;
         }
 
@@ -140,8 +140,13 @@ class Dashboard {
         this.analysisResults.setLoading(true);
         
         try {
-            // 发送分析请求
-            const response = await api.analyzeSymbols(symbols, interval);
+            // 发送流式分析请求，实时显示进度和AI解读
+            const response = await api.analyzeSymbolsStream(symbols, interval, {
+                progress: (payload) => this.analysisResults.setProgress(payload.message),
+                symbol: (payload) => this.analysisResults.setProgress(`${payload.symbol} 数据分析完成`),
+                symbol_error: (payload) => this.analysisResults.setProgress(`${payload.symbol} 数据获取失败`),
+                ai_delta: (payload) => this.analysisResults.appendInterpretation(payload.content)
+            });
             
             // 处理响应
             if (response.status === 'success') {
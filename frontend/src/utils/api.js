@@ -6,6 +6,9 @@
 // API基础URL，基于当前窗口域名构建
 const API_BASE_URL = (window.location.origin || 'http://localhost:5000') + '/api';
 
+// 分析任务轮询间隔（毫秒）
+const JOB_POLL_INTERVAL = 1000;
+
 /**
  * 发送HTTP请求
  * @param {string} endpoint - API端点
@@ -59,14 +62,108 @@ export async function getIntervals() {
     return fetchAPI('/intervals');
 }
 
+/**
+ * 查询分析任务状态
+ * @param {string} jobId - 任务ID
+ * @returns {Promise} - 任务状态和结果
+ */
+export async function getJob(jobId) {
+    return fetchAPI(`/jobs/${jobId}`);
+}
+
 /**
  * 分析交易对资金流向
+ * 提交分析任务后轮询任务状态，直到任务完成
  * @param {Array} symbols - 交易对列表
  * @param {string} interval - K线时间间隔
  * @returns {Promise} - 分析结果
  */
 export async function analyzeSymbols(symbols, interval) {
-    return fetchAPI('/analyze', 'POST', { symbols, interval });
+    const submitResponse = await fetchAPI('/analyze', 'POST', { symbols, interval });
+    const jobId = submitResponse.data.job_id;
+
+    // 结果已缓存时任务直接完成，无需轮询
+    if (submitResponse.data.job_status === 'success') {
+        return { status: 'success', data: submitResponse.data.result };
+    }
+
+    while (true) {
+        const jobResponse = await getJob(jobId);
+        const job = jobResponse.data;
+
+        if (job.status === 'success') {
+            return { status: 'success', data: job.result };
+        }
+        if (job.status === 'error') {
+            return { status: 'error', message: job.message };
+        }
+
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+    }
+}
+
+/**
+ * 流式分析交易对资金流向
+ * 通过Server-Sent Events逐步接收分析进度、单个交易对结果和AI解读片段
+ * @param {Array} symbols - 交易对列表
+ * @param {string} interval - K线时间间隔
+ * @param {Object} handlers - 事件回调，键为事件名（progress、symbol、symbol_error、ai_delta）
+ * @returns {Promise} - 最终分析结果
+ */
+export async function analyzeSymbolsStream(symbols, interval, handlers = {}) {
+    const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify({ symbols, interval })
+    });
+
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.message || '请求失败');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+
+        buffer += decoder.decode(value, { stream: true });
+        const messages = buffer.split('\n\n');
+        buffer = messages.pop();
+
+        for (const message of messages) {
+            let event = 'message';
+            let data = '';
+            for (const line of message.split('\n')) {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            }
+
+            const payload = data ? JSON.parse(data) : null;
+            if (event === 'result') {
+                return { status: 'success', data: payload };
+            }
+            if (event === 'error') {
+                return { status: 'error', message: payload.message };
+            }
+            if (handlers[event]) {
+                handlers[event](payload);
+            }
+        }
+    }
+
+    throw new Error('分析结果流意外中断');
 }
 
 /**
@@ -81,5 +178,7 @@ export default {
     getDefaultSymbols,
     getIntervals,
     analyzeSymbols,
+    analyzeSymbolsStream,
+    getJob,
     checkHealth
 }; 
\ No newline at end of file
@@ -1,14 +1,29 @@
 """
 Gunicorn 配置文件
-用于生产环境的 WSGI 服务器配置
+用于生产环境的 WSGI 服务器配置；SERVER_MODE=asgi 时使用uvicorn工作进程运行 asgi:app
 """
 
+import os
+import glob
+
+# 服务模式：wsgi（同步Flask，每个请求占用一个线程）或 asgi（异步，等待网络I/O时不占用线程）
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+
 # 工作进程数
 workers = 4
 
-# 每个工作进程的线程数
+# 任务状态、合并记录和请求权重保存在共享缓存中，多个工作进程时默认使用sqlite缓存；
+# 进程内缓存（memory）下轮询任务的请求落到其他工作进程时会查不到任务，直接拒绝启动
+if workers > 1:
+    if os.environ.setdefault("CACHE_BACKEND", "sqlite").lower() == "memory":
+        raise Exception("CACHE_BACKEND=memory 时各工作进程的任务状态互不可见，多个工作进程请使用 sqlite 或 redis 缓存后端")
+
+# 每个工作进程的线程数（仅wsgi模式）
 threads = 2
 
+if SERVER_MODE == "asgi":
+    worker_class = "uvicorn_worker.UvicornWorker"
+
 # 监听地址和端口
 bind = "0.0.0.0:10000"
 
@@ -23,4 +38,24 @@ access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"
 errorlog = "-"
 
 # 预加载应用
-preload_app = True 
\ No newline at end of file
+preload_app = True
+
+# 性能指标：各工作进程把指标写入该目录，/metrics 汇总所有进程（需要在加载应用之前设置），启动时清除上次运行的数据
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "prometheus"))
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+    os.remove(path)
+
+
+def post_fork(server, worker):
+    """工作进程启动后开启行情数据采集（只在抢到租约的一个进程中运行）和快照调度（预加载时创建的线程不会被子进程继承）"""
+    from backend.services import ingest_service, snapshot_service
+    ingest_service.start()
+    snapshot_service.start()
+
+
+def child_exit(server, worker):
+    """工作进程退出后移除其进行中任务数等实时指标"""
+    from backend.utils import metrics
+    metrics.mark_process_dead(worker.pid)
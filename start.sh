@@ -9,5 +9,9 @@ pip install gunicorn
 # 加载环境变量
 export $(cat .env | xargs)
 
-# 启动应用
-gunicorn -c gunicorn.conf.py wsgi:app 
\ No newline at end of file
+# 启动应用（SERVER_MODE=asgi 时使用异步服务模式）
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn -c gunicorn.conf.py asgi:app
+else
+    gunicorn -c gunicorn.conf.py wsgi:app
+fi 
\ No newline at end of file
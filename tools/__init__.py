@@ -0,0 +1,4 @@
+"""
+开发工具
+本地模拟服务等测试辅助脚本
+"""
@@ -0,0 +1,82 @@
+"""
+信号回测工具
+用本地归档的K线回放分析信号，输出各信号在不同持有期的样本数、平均收益和命中率
+
+用法:
+    python tools/kline_backfill.py --symbols BTCUSDT,ETHUSDT --intervals 5m --days 365
+    python tools/backtest.py --symbols BTCUSDT,ETHUSDT --interval 5m --days 365 --horizons 1,12,48 --out report.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import backtest_service  # noqa: E402
+from backend.utils import helpers  # noqa: E402
+
+
+def _print_summary(summary):
+    """打印汇总的信号统计"""
+    for name, by_horizon in summary.items():
+        print(f"\n[{name}]")
+        for horizon, values in by_horizon.items():
+            print(f"  持有 {horizon} 根K线:")
+            for value, stats in values.items():
+                if not stats["count"]:
+                    continue
+                hit_rate = f"{stats['hit_rate']:.2%}" if stats["hit_rate"] is not None else "-"
+                print(f"    {value:<22} 样本 {stats['count']:>8}  平均收益 {stats['mean_return_pct']:>8.4f}%  "
+                      f"命中率 {hit_rate}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析信号回测工具")
+    parser.add_argument("--symbols", default="BTCUSDT,ETHUSDT", help="交易对，逗号分隔 (默认: BTCUSDT,ETHUSDT)")
+    parser.add_argument("--interval", default="1h", help="K线周期 (默认: 1h)")
+    parser.add_argument("--days", type=float, default=None, help="只回测最近多少天 (默认: 全部归档数据)")
+    parser.add_argument("--market", choices=["spot", "futures", "both"], default="both", help="市场 (默认: both)")
+    parser.add_argument("--horizons", default="1,5,10", help="持有期（K线数量），逗号分隔 (默认: 1,5,10)")
+    parser.add_argument("--window", type=int, default=backtest_service.INDICATOR_WINDOW,
+                        help=f"分析窗口长度 (默认: {backtest_service.INDICATOR_WINDOW})")
+    parser.add_argument("--workers", type=int, default=None, help="进程数 (默认: CPU核数)")
+    parser.add_argument("--out", default=None, help="将完整结果写入JSON文件")
+    args = parser.parse_args()
+
+    try:
+        horizons = [int(h) for h in args.horizons.split(",") if h.strip()]
+    except ValueError:
+        parser.error("--horizons 必须是逗号分隔的正整数")
+    if not horizons or any(h <= 0 for h in horizons):
+        parser.error("--horizons 必须是逗号分隔的正整数")
+
+    start_time = None
+    if args.days:
+        start_time = helpers.get_current_time_ms() - int(args.days * 24 * 60 * 60 * 1000)
+
+    report = backtest_service.run_backtest(
+        [s.strip().upper() for s in args.symbols.split(",") if s.strip()],
+        interval=args.interval,
+        markets=("spot", "futures") if args.market == "both" else (args.market,),
+        start_time=start_time,
+        horizons=horizons,
+        window=args.window,
+        max_workers=args.workers
+    )
+
+    _print_summary(report["summary"])
+    for symbol, markets in report["errors"].items():
+        for market, message in markets.items():
+            print(f"回测 {market} {symbol} 失败: {message}")
+    print(f"\n共回放 {report['metadata']['bars']} 根K线，耗时 {report['metadata']['duration']:.1f} 秒")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,644 @@
+"""
+分析流水线基准测试
+用录制（或合成）的币安和DeepSeek数据启动本地模拟服务，测量：
+- 端到端分析延迟（/api/analyze 提交到任务完成）和各阶段耗时（数据获取、首个AI片段、完成）
+- 并发负载下的吞吐量和延迟分布（/api/analyze/batch、/api/analyze/stream）
+- K线解析、订单簿统计、各分析函数和AI输入构建在不同交易对数量和K线数量下的耗时
+结果写入JSON报告，用 compare 子命令对比两次报告（例如修改前后）。
+
+用法:
+    python tools/benchmark.py record --symbols BTCUSDT,ETHUSDT --interval 1h --out data/benchmark_fixtures.json
+    python tools/benchmark.py run --fixtures data/benchmark_fixtures.json --out data/bench_before.json
+    python tools/benchmark.py run --suites micro,pipeline --out data/bench_after.json   （不指定fixtures时使用合成数据）
+    python tools/benchmark.py compare data/bench_before.json data/bench_after.json
+
+测试期间关闭单元、K线、订单簿和AI解读缓存以及权重调度，每次测量都完整执行流水线；
+模拟服务只在本进程内运行，不会请求真实的币安和DeepSeek接口（record 子命令除外）。
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+from backend.utils import helpers  # noqa: E402
+from tools import mock_deepseek  # noqa: E402
+
+# 真实的币安地址和接口路径（仅录制时使用）
+_REST_URLS = {"spot": "https://api.binance.com", "futures": "https://fapi.binance.com"}
+_REST_PATHS = {
+    "spot": {"klines": "/api/v3/klines", "depth": "/api/v3/depth"},
+    "futures": {"klines": "/fapi/v1/klines", "depth": "/fapi/v1/depth"}
+}
+
+# 基准测试期间的环境变量：关闭各级缓存、权重调度和后台任务，保证每次测量都完整执行流水线
+_BENCH_ENV = {
+    "CACHE_BACKEND": "memory",
+    "UNIT_CACHE_TTL": "0",
+    "KLINE_CACHE_ENABLED": "False",
+    "ORDERBOOK_CACHE_TTL": "0",
+    "AI_CACHE_ENABLED": "False",
+    "RATE_LIMIT_ENABLED": "False",
+    "INGEST_ENABLED": "False",
+    "SNAPSHOT_ENABLED": "False",
+    "KLINE_ARCHIVE_ENABLED": "False",
+    "HTTP_MAX_RETRIES": "0",
+    # 模拟服务都在本机地址上，使用与真实币安主机相同的默认连接池大小
+    "HTTP_POOL_SIZE": "16",
+}
+
+# 合成数据的DeepSeek解读内容（约为真实解读的长度）
+_SYNTHETIC_CONTENT = mock_deepseek.DEFAULT_CONTENT * 8
+
+
+# ---------------------------------------------------------------------------
+# 测试数据
+# ---------------------------------------------------------------------------
+
+def generate_fixtures(symbols=4, bars=1000, depth=1000, seed=42):
+    """生成合成数据：随机游走的K线和围绕最新价的订单簿，相同seed生成的数据相同"""
+    rng = random.Random(seed)
+    interval_ms = helpers.interval_to_ms("1h")
+    binance = {}
+    for market in ("spot", "futures"):
+        binance[market] = {}
+        for index in range(symbols):
+            price = rng.uniform(1, 50000)
+            rows = []
+            for i in range(bars + 1):
+                close = price * (1 + rng.gauss(0, 0.01))
+                volume = rng.uniform(100, 1000) * (5 if rng.random() < 0.03 else 1)
+                taker_buy = volume * rng.uniform(0.3, 0.7)
+                open_time = i * interval_ms
+                rows.append([open_time, str(price), str(max(price, close) * 1.002), str(min(price, close) * 0.998),
+                             str(close), str(volume), open_time + interval_ms - 1, str(volume * close), 100,
+                             str(taker_buy), str(taker_buy * close), "0"])
+                price = close
+            tick = price * 0.0001
+            binance[market][f"SYN{index}USDT"] = {
+                "klines": rows,
+                "depth": {
+                    "lastUpdateId": 1,
+                    "bids": [[str(price - tick * i), str(rng.uniform(0.1, 10))] for i in range(1, depth + 1)],
+                    "asks": [[str(price + tick * i), str(rng.uniform(0.1, 10))] for i in range(1, depth + 1)]
+                }
+            }
+
+    return {
+        "meta": {"source": "synthetic", "seed": seed, "symbols": symbols, "bars": bars, "depth": depth,
+                 "created_at": helpers.get_current_time_str()},
+        "binance": binance,
+        "deepseek": {"content": _SYNTHETIC_CONTENT, "chunk_size": 8, "chunk_delay": 0.005}
+    }
+
+
+def record_fixtures(symbols, interval, bars, depth, deepseek=False):
+    """录制真实的币安K线和订单簿快照；deepseek为True时再用录制数据请求一次真实的DeepSeek流式解读"""
+    binance = {}
+    for market, base_url in _REST_URLS.items():
+        binance[market] = {}
+        for symbol in symbols:
+            klines = requests.get(f"{base_url}{_REST_PATHS[market]['klines']}", timeout=10,
+                                  params={"symbol": symbol, "interval": interval, "limit": min(bars + 1, 1000)})
+            klines.raise_for_status()
+            snapshot = requests.get(f"{base_url}{_REST_PATHS[market]['depth']}", timeout=10,
+                                    params={"symbol": symbol, "limit": depth})
+            snapshot.raise_for_status()
+            binance[market][symbol] = {"klines": klines.json(), "depth": snapshot.json()}
+            print(f"已录制 {market} {symbol}: {len(binance[market][symbol]['klines'])} 根K线")
+
+    fixtures = {
+        "meta": {"source": "binance", "interval": interval, "symbols": symbols,
+                 "created_at": helpers.get_current_time_str()},
+        "binance": binance,
+        "deepseek": {"content": _SYNTHETIC_CONTENT, "chunk_size": 8, "chunk_delay": 0.005}
+    }
+    if deepseek:
+        fixtures["deepseek"] = _record_deepseek(fixtures, symbols, interval)
+    return fixtures
+
+
+def _record_deepseek(fixtures, symbols, interval):
+    """用模拟币安服务回放录制数据，请求真实的DeepSeek接口，记录解读内容和片段间隔"""
+    binance_server = create_binance_server(fixtures)
+    _serve(binance_server)
+    os.environ.update({
+        "BINANCE_API_URL": f"http://127.0.0.1:{binance_server.server_port}",
+        "BINANCE_FUTURES_API_URL": f"http://127.0.0.1:{binance_server.server_port}",
+        "AI_CACHE_ENABLED": "False"
+    })
+    from backend.services import pipeline_service
+
+    chunks = []
+    start = time.perf_counter()
+    first = None
+    for event, payload in pipeline_service.iter_analysis(symbols, interval):
+        if event == "ai_delta":
+            first = first or time.perf_counter()
+            chunks.append(payload["content"])
+    binance_server.shutdown()
+
+    content = "".join(chunks)
+    elapsed = time.perf_counter() - (first or start)
+    print(f"已录制DeepSeek解读: {len(content)} 个字符，{len(chunks)} 个片段")
+    return {
+        "content": content,
+        "chunk_size": max(1, round(len(content) / max(len(chunks), 1))),
+        "chunk_delay": elapsed / max(len(chunks), 1),
+        "first_chunk_delay": (first - start) if first else 0
+    }
+
+
+def load_fixtures(path):
+    """读取测试数据，未指定路径时生成合成数据"""
+    if not path:
+        return generate_fixtures()
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------------------------------------------------------------------------
+# 模拟服务
+# ---------------------------------------------------------------------------
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # 并发负载测试时需要较大的连接队列
+    request_queue_size = 256
+
+
+def _replay_klines(rows, interval, limit):
+    """按请求的周期重新排列录制K线的时间，使最后一根为当前未完成的K线"""
+    interval_ms = helpers.interval_to_ms(interval)
+    now_ms = helpers.get_current_time_ms()
+    current_open = now_ms - now_ms % interval_ms
+    rows = rows[-limit:]
+    replayed = []
+    for i, row in enumerate(rows):
+        open_time = current_open - (len(rows) - 1 - i) * interval_ms
+        replayed.append([open_time, *row[1:6], open_time + interval_ms - 1, *row[7:]])
+    return replayed
+
+
+def create_binance_server(fixtures, latency=0.0, host="127.0.0.1", port=0):
+    """创建回放测试数据的币安模拟服务（K线和订单簿），server.latency 为每个请求的模拟网络延迟（秒）
+
+    未录制的交易对（如扩展交易对数量时使用的 BENCH12USDT）按名称固定映射到某个录制的交易对。
+    """
+    markets = fixtures["binance"]
+
+    def resolve(market, symbol):
+        data = markets[market]
+        if symbol in data:
+            return data[symbol]
+        names = sorted(data)
+        return data[names[zlib.crc32(symbol.encode()) % len(names)]]
+
+    class BinanceHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 响应头和响应体分两次写出，关闭Nagle算法避免小响应额外等待约40毫秒
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            time.sleep(server.latency)
+            url = urlsplit(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            market = "futures" if url.path.startswith("/fapi/") else "spot"
+
+            if url.path.endswith("/klines"):
+                rows = resolve(market, query["symbol"])["klines"]
+                body = _replay_klines(rows, query.get("interval", "1h"), int(query.get("limit", 500)))
+            elif url.path.endswith("/depth"):
+                snapshot = resolve(market, query["symbol"])["depth"]
+                limit = int(query.get("limit", 100))
+                body = {"lastUpdateId": snapshot.get("lastUpdateId", 1),
+                        "bids": snapshot["bids"][:limit], "asks": snapshot["asks"][:limit]}
+            else:
+                self.send_error(404)
+                return
+
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _Server((host, port), BinanceHandler)
+    server.latency = latency
+    return server
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_environment(fixtures, binance_latency, deepseek_delay=None):
+    """启动币安和DeepSeek模拟服务，并设置环境变量（需要在导入后端模块之前调用）"""
+    deepseek = fixtures["deepseek"]
+    binance_server = _serve(create_binance_server(fixtures, binance_latency))
+    deepseek_server = _serve(mock_deepseek.create_server(
+        content=deepseek["content"],
+        delay=deepseek["chunk_delay"] if deepseek_delay is None else deepseek_delay,
+        chunk_size=deepseek["chunk_size"]
+    ))
+
+    os.environ.update(_BENCH_ENV)
+    os.environ.update({
+        "BINANCE_API_URL": f"http://127.0.0.1:{binance_server.server_port}",
+        "BINANCE_FUTURES_API_URL": f"http://127.0.0.1:{binance_server.server_port}",
+        "DEEPSEEK_API_URL": f"http://127.0.0.1:{deepseek_server.server_port}/v1/chat/completions",
+        "DEEPSEEK_API_KEY": "benchmark-key"
+    })
+    return binance_server, deepseek_server
+
+
+# ---------------------------------------------------------------------------
+# 计时
+# ---------------------------------------------------------------------------
+
+def summarize(samples_ms):
+    """汇总耗时样本（毫秒）"""
+    samples = sorted(samples_ms)
+    if not samples:
+        return {"runs": 0}
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p95_ms": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "max_ms": samples[-1],
+        "stdev_ms": statistics.stdev(samples) if len(samples) > 1 else 0.0
+    }
+
+
+def measure(func, min_time=0.2, max_runs=200, min_runs=5, warmup=1):
+    """重复执行func直到累计min_time秒（至少min_runs次，最多max_runs次），返回耗时统计"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    start = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - start < min_time):
+        begin = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - begin) * 1000)
+    return summarize(samples)
+
+
+def _bench_symbols(count, offset=0):
+    """生成不重复的交易对名称，避免相同参数的分析任务被合并"""
+    return [f"BENCH{offset + i}USDT" for i in range(count)]
+
+
+# ---------------------------------------------------------------------------
+# 测试套件
+# ---------------------------------------------------------------------------
+
+def run_micro(fixtures, binance_server, interval, bars_list, depths, symbol_counts, min_time):
+    """微基准：K线解析、订单簿统计、各分析函数和AI输入构建，HTTP相关项不加模拟网络延迟"""
+    from backend.services import analysis_service, binance_service, pipeline_service, prompt_builder
+    from backend.services.orderbook import OrderBook
+    from backend.utils.klines import Klines
+
+    results = {}
+    latency, binance_server.latency = binance_server.latency, 0.0
+    symbol = sorted(fixtures["binance"]["spot"])[0]
+    fixture = fixtures["binance"]["spot"][symbol]
+    orderbook_stats = OrderBook.from_snapshot(fixture["depth"]).stats()
+
+    try:
+        for bars in bars_list:
+            rows = fixture["klines"][-bars:]
+            if len(rows) < bars:
+                print(f"测试数据只有 {len(rows)} 根K线，跳过 bars={bars}")
+                continue
+            klines = Klines.from_raw(rows)
+            cases = {
+                "klines.from_raw": lambda: Klines.from_raw(rows),
+                "binance.get_klines_data": lambda: binance_service.get_klines_data(symbol, interval, bars),
+                "analysis.analyze_funding_flow_trend": lambda: analysis_service.analyze_funding_flow_trend(klines),
+                "analysis.detect_anomalies": lambda: analysis_service.detect_anomalies(klines),
+                "analysis.analyze_funding_pressure":
+                    lambda: analysis_service.analyze_funding_pressure(klines, orderbook_stats),
+            }
+            for name, func in cases.items():
+                results[f"{name}[bars={bars}]"] = measure(func, min_time)
+
+        for depth in depths:
+            snapshot = {"lastUpdateId": 1, "bids": fixture["depth"]["bids"][:depth],
+                        "asks": fixture["depth"]["asks"][:depth]}
+            results[f"orderbook.from_snapshot_stats[depth={depth}]"] = measure(
+                lambda: OrderBook.from_snapshot(snapshot).stats(), min_time)
+            results[f"binance.get_orderbook_stats[depth={depth}]"] = measure(
+                lambda: binance_service.get_orderbook_stats(symbol, False, depth), min_time)
+
+        for count in symbol_counts:
+            data = pipeline_service.analyze_batch(_bench_symbols(count), interval)
+            results[f"prompt_builder.build_prompt_data[symbols={count}]"] = measure(
+                lambda: prompt_builder.build_prompt_data(data), min_time)
+    finally:
+        binance_server.latency = latency
+    return results
+
+
+def _wait_job(client, job_id, poll_interval=0.005):
+    """轮询任务直到完成，返回任务信息"""
+    while True:
+        job = client.get(f"/api/jobs/{job_id}").get_json()["data"]
+        if job["status"] in ("success", "error"):
+            return job
+        time.sleep(poll_interval)
+
+
+def run_pipeline(interval, symbol_counts, repeats):
+    """端到端延迟（提交任务到任务完成）和流水线各阶段耗时"""
+    from backend.api.api_server import create_app
+    from backend.services import pipeline_service
+
+    client = create_app().test_client()
+    results = {}
+    offset = 0
+    for count in symbol_counts:
+        e2e = []
+        errors = 0
+        for _ in range(repeats):
+            symbols = _bench_symbols(count, offset)
+            offset += count
+            start = time.perf_counter()
+            response = client.post("/api/analyze", json={"symbols": symbols, "interval": interval})
+            job = response.get_json()["data"]
+            if job["job_status"] != "success":
+                job = _wait_job(client, job["job_id"])
+                errors += job["status"] != "success"
+            e2e.append((time.perf_counter() - start) * 1000)
+        results[f"analyze.e2e[symbols={count}]"] = {**summarize(e2e), "errors": errors}
+
+        stages = {"first_symbol": [], "fetch": [], "first_ai_delta": [], "ai": [], "total": []}
+        for _ in range(repeats):
+            symbols = _bench_symbols(count, offset)
+            offset += count
+            start = time.perf_counter()
+            marks = {}
+            progress = 0
+            for event, payload in pipeline_service.iter_analysis(symbols, interval):
+                elapsed = (time.perf_counter() - start) * 1000
+                if event == "symbol":
+                    marks.setdefault("first_symbol", elapsed)
+                elif event == "progress":
+                    progress += 1
+                    if progress == 2:
+                        # 第二条进度消息表示数据获取和分析完成，开始请求AI解读
+                        marks["fetch"] = elapsed
+                elif event == "ai_delta":
+                    marks.setdefault("first_ai_delta", elapsed)
+                elif event == "result":
+                    marks["total"] = elapsed
+            marks["ai"] = marks["total"] - marks.get("fetch", 0)
+            for stage, value in marks.items():
+                stages[stage].append(value)
+        for stage, samples in stages.items():
+            results[f"pipeline.stage.{stage}[symbols={count}]"] = summarize(samples)
+    return results
+
+
+def _load_request(url, payload, endpoint):
+    """发送一个负载请求，返回 (耗时毫秒, 是否成功)"""
+    start = time.perf_counter()
+    try:
+        response = requests.post(url, json=payload, timeout=120)
+        if endpoint == "stream":
+            ok = response.ok and "event: result" in response.text
+        else:
+            ok = response.ok and response.json().get("status") == "success"
+    except requests.RequestException:
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def run_load(interval, concurrency_levels, symbols_per_request, requests_per_client):
+    """并发负载：在本地线程化服务器上以不同并发数请求批量分析和流式分析"""
+    from werkzeug.serving import make_server
+    from backend.api.api_server import create_app
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    _serve(server)
+    base_url = f"http://127.0.0.1:{server.server_port}/api/analyze"
+
+    results = {}
+    offset = 0
+    try:
+        for endpoint in ("batch", "stream"):
+            for concurrency in concurrency_levels:
+                total = concurrency * requests_per_client
+                payloads = []
+                for _ in range(total):
+                    payloads.append({"symbols": _bench_symbols(symbols_per_request, offset), "interval": interval})
+                    offset += symbols_per_request
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    outcomes = list(executor.map(
+                        lambda payload: _load_request(f"{base_url}/{endpoint}", payload, endpoint), payloads))
+                wall = time.perf_counter() - start
+
+                latencies = [elapsed for elapsed, ok in outcomes]
+                results[f"load.{endpoint}[concurrency={concurrency}]"] = {
+                    **summarize(latencies),
+                    "concurrency": concurrency,
+                    "requests": total,
+                    "errors": sum(1 for elapsed, ok in outcomes if not ok),
+                    "throughput_rps": total / wall if wall else 0.0
+                }
+    finally:
+        server.shutdown()
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 报告
+# ---------------------------------------------------------------------------
+
+def _git_info():
+    """当前代码版本，便于对比报告时确认测试的是哪次修改"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=_ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=_ROOT,
+                                    capture_output=True, text=True, timeout=30).stdout.strip())
+        return {"commit": commit or None, "dirty": dirty}
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+
+
+def _print_results(results):
+    """打印结果摘要"""
+    print(f"\n{'测试项':<58} {'中位数(ms)':>12} {'P95(ms)':>12} {'吞吐(req/s)':>12}")
+    for name, stats in results.items():
+        throughput = f"{stats['throughput_rps']:.2f}" if "throughput_rps" in stats else "-"
+        median = f"{stats['median_ms']:.3f}" if "median_ms" in stats else "-"
+        p95 = f"{stats['p95_ms']:.3f}" if "p95_ms" in stats else "-"
+        errors = f"  错误 {stats['errors']}" if stats.get("errors") else ""
+        print(f"{name:<58} {median:>12} {p95:>12} {throughput:>12}{errors}")
+
+
+def compare_reports(base, new, threshold=5.0):
+    """对比两份报告，返回 [(测试项, 指标, 基准值, 新值, 变化百分比, 结论)]
+
+    负载测试比较吞吐量（越高越好），其余比较耗时中位数（越低越好）；变化超过threshold%时标记为提升或回退。
+    """
+    rows = []
+    base_results = base["results"]
+    new_results = new["results"]
+    for name in sorted(set(base_results) | set(new_results)):
+        old, current = base_results.get(name), new_results.get(name)
+        if old is None or current is None:
+            rows.append((name, "-", old, current, None, "仅在新报告中" if old is None else "仅在基准报告中"))
+            continue
+
+        metric = "throughput_rps" if "throughput_rps" in current else "median_ms"
+        old_value, new_value = old.get(metric), current.get(metric)
+        if not old_value or new_value is None:
+            rows.append((name, metric, old_value, new_value, None, "-"))
+            continue
+
+        change = (new_value - old_value) / old_value * 100
+        better = change > threshold if metric == "throughput_rps" else change < -threshold
+        worse = change < -threshold if metric == "throughput_rps" else change > threshold
+        rows.append((name, metric, old_value, new_value, change, "提升" if better else "回退" if worse else "持平"))
+    return rows
+
+
+def _print_comparison(rows):
+    print(f"{'测试项':<58} {'指标':<16} {'基准':>12} {'新值':>12} {'变化':>9}  结论")
+    for name, metric, old, new, change, verdict in rows:
+        old_text = f"{old:.3f}" if isinstance(old, (int, float)) else "-"
+        new_text = f"{new:.3f}" if isinstance(new, (int, float)) else "-"
+        change_text = f"{change:+.1f}%" if change is not None else "-"
+        print(f"{name:<58} {metric:<16} {old_text:>12} {new_text:>12} {change_text:>9}  {verdict}")
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析流水线基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="录制真实的币安（和DeepSeek）数据作为测试数据")
+    record_parser.add_argument("--symbols", default="BTCUSDT,ETHUSDT", help="交易对，逗号分隔 (默认: BTCUSDT,ETHUSDT)")
+    record_parser.add_argument("--interval", default="1h", help="K线周期 (默认: 1h)")
+    record_parser.add_argument("--bars", type=int, default=999, help="每个交易对录制的K线数量 (默认: 999)")
+    record_parser.add_argument("--depth", type=int, default=1000, help="订单簿档位数 (默认: 1000)")
+    record_parser.add_argument("--deepseek", action="store_true", help="同时录制一次真实的DeepSeek流式解读")
+    record_parser.add_argument("--out", default="data/benchmark_fixtures.json", help="输出文件")
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--fixtures", default=None, help="测试数据文件 (默认: 生成合成数据)")
+    run_parser.add_argument("--suites", default="micro,pipeline,load", help="测试套件，逗号分隔 (默认: 全部)")
+    run_parser.add_argument("--interval", default="1h", help="K线周期 (默认: 1h)")
+    run_parser.add_argument("--bars", default="50,200,999", help="微基准的K线数量 (默认: 50,200,999)")
+    run_parser.add_argument("--depths", default="100,1000", help="微基准的订单簿档位数 (默认: 100,1000)")
+    run_parser.add_argument("--symbol-counts", default="1,5,20", help="交易对数量 (默认: 1,5,20)")
+    run_parser.add_argument("--repeats", type=int, default=5, help="端到端测试的重复次数 (默认: 5)")
+    run_parser.add_argument("--concurrency", default="1,4,16", help="负载测试的并发数 (默认: 1,4,16)")
+    run_parser.add_argument("--load-symbols", type=int, default=2, help="负载测试每个请求的交易对数量 (默认: 2)")
+    run_parser.add_argument("--load-requests", type=int, default=4, help="负载测试每个并发的请求数 (默认: 4)")
+    run_parser.add_argument("--binance-latency", type=float, default=0.02,
+                            help="模拟币安接口的网络延迟，单位秒 (默认: 0.02)")
+    run_parser.add_argument("--deepseek-delay", type=float, default=None,
+                            help="模拟DeepSeek流式片段间隔，单位秒 (默认: 使用测试数据中的值)")
+    run_parser.add_argument("--min-time", type=float, default=0.2, help="每个微基准的最短测量时间，单位秒 (默认: 0.2)")
+    run_parser.add_argument("--out", default=None, help="将报告写入JSON文件")
+
+    compare_parser = subparsers.add_parser("compare", help="对比两份基准测试报告")
+    compare_parser.add_argument("base", help="基准报告")
+    compare_parser.add_argument("new", help="新报告")
+    compare_parser.add_argument("--threshold", type=float, default=5.0, help="判定变化的百分比阈值 (默认: 5)")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        fixtures = record_fixtures([s.strip().upper() for s in args.symbols.split(",") if s.strip()],
+                                   args.interval, args.bars, args.depth, args.deepseek)
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(fixtures, f, ensure_ascii=False)
+        print(f"录制完成: {args.out}")
+        return
+
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        _print_comparison(compare_reports(base, new, args.threshold))
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    binance_server, deepseek_server = start_environment(fixtures, args.binance_latency, args.deepseek_delay)
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    symbol_counts = _int_list(args.symbol_counts)
+
+    results = {}
+    started = time.perf_counter()
+    try:
+        if "micro" in suites:
+            print("运行微基准...")
+            results.update(run_micro(fixtures, binance_server, args.interval, _int_list(args.bars),
+                                     _int_list(args.depths), symbol_counts, args.min_time))
+        if "pipeline" in suites:
+            print("运行端到端和分阶段测试...")
+            results.update(run_pipeline(args.interval, symbol_counts, args.repeats))
+        if "load" in suites:
+            print("运行并发负载测试...")
+            results.update(run_load(args.interval, _int_list(args.concurrency), args.load_symbols,
+                                    args.load_requests))
+    finally:
+        binance_server.shutdown()
+        deepseek_server.shutdown()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "duration": time.perf_counter() - started,
+            "git": _git_info(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "fixtures": fixtures["meta"],
+            "settings": {key: value for key, value in vars(args).items() if key != "command"}
+        },
+        "results": results
+    }
+    _print_results(results)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
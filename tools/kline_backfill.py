@@ -0,0 +1,48 @@
+"""
+K线归档回补工具
+分页获取币安历史K线并写入本地归档（backend/services/kline_archive.py）
+
+用法:
+    python tools/kline_backfill.py --symbols BTCUSDT,ETHUSDT --intervals 1h,4h --days 180
+    python tools/kline_backfill.py --symbols BTCUSDT --intervals 1h --info
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services import kline_archive  # noqa: E402
+from backend.utils import helpers, rate_limiter  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="币安K线归档回补工具")
+    parser.add_argument("--symbols", default="BTCUSDT,ETHUSDT", help="交易对，逗号分隔 (默认: BTCUSDT,ETHUSDT)")
+    parser.add_argument("--intervals", default="1h", help="K线周期，逗号分隔 (默认: 1h)")
+    parser.add_argument("--days", type=float, default=30, help="回补最近多少天 (默认: 30)")
+    parser.add_argument("--market", choices=["spot", "futures", "both"], default="both", help="市场 (默认: both)")
+    parser.add_argument("--info", action="store_true", help="只显示归档概况，不回补")
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    intervals = [i.strip() for i in args.intervals.split(",") if i.strip()]
+    markets = [False, True] if args.market == "both" else [args.market == "futures"]
+    start_time = helpers.get_current_time_ms() - int(args.days * 24 * 60 * 60 * 1000)
+
+    # 回补作为后台请求，只使用部分请求权重（与服务共用sqlite或redis缓存时共享同一份预算）
+    with rate_limiter.background():
+        for is_futures in markets:
+            for symbol in symbols:
+                for interval in intervals:
+                    label = f"{'futures' if is_futures else 'spot'} {symbol} {interval}"
+                    if not args.info:
+                        added = kline_archive.backfill(symbol, interval, is_futures, start_time=start_time)
+                        print(f"{label}: 新增 {added} 根K线")
+                    info = kline_archive.get_info(symbol, interval, is_futures)
+                    print(f"{label}: 共 {info['count']} 根K线 ({info['first_time']} ~ {info['last_time']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+DeepSeek模拟服务
+在本地模拟 /v1/chat/completions 接口，支持普通响应和流式(SSE)响应，便于离线测试AI解读流程
+
+用法:
+    python tools/mock_deepseek.py --port 8001 --delay 0.05
+    export DEEPSEEK_API_URL=http://127.0.0.1:8001/v1/chat/completions
+    export DEEPSEEK_API_KEY=mock-key
+"""
+
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认返回的解读内容
+DEFAULT_CONTENT = (
+    "## 模拟分析结果\n\n"
+    "| 交易对 | 阶段 | 建议 |\n"
+    "| --- | --- | --- |\n"
+    "| 示例 | 整理中 | 观望 |\n\n"
+    "以上内容由本地模拟服务生成，仅用于测试。"
+)
+
+
+def split_content(content, chunk_size=8):
+    """将内容切分为流式片段"""
+    return [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+
+def create_handler(content=DEFAULT_CONTENT, delay=0.0, chunk_size=8):
+    """创建请求处理器，delay为普通响应的延迟或流式响应中每个片段的间隔（秒）"""
+
+    class MockDeepSeekHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self.send_error(400, "invalid json")
+                return
+
+            if payload.get("stream"):
+                self._send_stream(payload)
+            else:
+                self._send_json(payload)
+
+        def _send_json(self, payload):
+            time.sleep(delay)
+            body = json.dumps({
+                "id": uuid.uuid4().hex,
+                "object": "chat.completion",
+                "model": payload.get("model", "deepseek-chat"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }]
+            }, ensure_ascii=False).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, payload):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            completion_id = uuid.uuid4().hex
+            for chunk in split_content(content, chunk_size):
+                time.sleep(delay)
+                event = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": payload.get("model", "deepseek-chat"),
+                    "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockDeepSeekHandler
+
+
+def create_server(host="127.0.0.1", port=0, content=DEFAULT_CONTENT, delay=0.0, chunk_size=8):
+    """创建模拟服务，port为0时自动分配端口（通过 server.server_port 获取）"""
+    return ThreadingHTTPServer((host, port), create_handler(content, delay, chunk_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DeepSeek API 本地模拟服务")
+    parser.add_argument("-H", "--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("-p", "--port", type=int, default=8001, help="监听端口 (默认: 8001)")
+    parser.add_argument("--delay", type=float, default=0.0, help="响应延迟或流式片段间隔，单位秒 (默认: 0)")
+    parser.add_argument("--chunk-size", type=int, default=8, help="流式片段的字符数 (默认: 8)")
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, delay=args.delay, chunk_size=args.chunk_size)
+    print(f"DeepSeek模拟服务运行在 http://{args.host}:{server.server_port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+币安行情回放服务
+录制币安K线/深度WebSocket流和REST快照，并在本地回放，用于离线测试行情采集服务
+
+录制:
+    python tools/ws_replay.py record --symbols BTCUSDT,ETHUSDT --intervals 1m --duration 60 --out replay.jsonl
+
+回放:
+    python tools/ws_replay.py serve --file replay.jsonl --ws-port 9001 --rest-port 9002
+    export BINANCE_WS_URL=ws://127.0.0.1:9001/spot
+    export BINANCE_FUTURES_WS_URL=ws://127.0.0.1:9001/futures
+    export BINANCE_API_URL=http://127.0.0.1:9002/spot
+    export BINANCE_FUTURES_API_URL=http://127.0.0.1:9002/futures
+
+录制文件每行一条记录：
+    {"type": "ws", "market": "spot", "ts": 毫秒时间戳, "message": 组合流消息}
+    {"type": "rest", "market": "spot", "path": "/api/v3/depth", "symbol": "BTCUSDT", "response": 响应内容}
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from websockets.sync.client import connect
+from websockets.sync.server import serve
+
+# 真实的币安地址
+_WS_URLS = {"spot": "wss://stream.binance.com:9443", "futures": "wss://fstream.binance.com"}
+_REST_URLS = {"spot": "https://api.binance.com", "futures": "https://fapi.binance.com"}
+_REST_PATHS = {
+    "spot": {"klines": "/api/v3/klines", "depth": "/api/v3/depth"},
+    "futures": {"klines": "/fapi/v1/klines", "depth": "/fapi/v1/depth"}
+}
+
+# 用于对齐回放时间的K线周期（毫秒）
+_INTERVAL_MS = {"m": 60 * 1000, "h": 60 * 60 * 1000, "d": 24 * 60 * 60 * 1000}
+
+
+def _interval_ms(interval):
+    return int(interval[:-1]) * _INTERVAL_MS[interval[-1]]
+
+
+def load_records(path):
+    """读取录制文件"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def shift_records(records, offset_ms):
+    """平移录制数据中的K线和事件时间，使回放数据看起来是最新的"""
+    for record in records:
+        if record["type"] == "ws":
+            data = record["message"].get("data", {})
+            if "E" in data:
+                data["E"] += offset_ms
+            if "k" in data:
+                data["k"]["t"] += offset_ms
+                data["k"]["T"] += offset_ms
+        elif record["type"] == "rest" and record["path"].endswith("klines"):
+            for row in record["response"]:
+                row[0] += offset_ms
+                row[6] += offset_ms
+    return records
+
+
+def align_offset(records):
+    """计算与当前时间对齐的平移量（录制中最大K线周期的整数倍，保证K线边界不变）"""
+    interval_ms = max([_interval_ms(r["message"]["data"]["k"]["i"]) for r in records
+                       if r["type"] == "ws" and "k" in r["message"].get("data", {})] or [_INTERVAL_MS["h"]])
+    ws_times = [r["ts"] for r in records if r["type"] == "ws"]
+    start_ms = ws_times[0] if ws_times else int(time.time() * 1000)
+    return round((time.time() * 1000 - start_ms) / interval_ms) * interval_ms
+
+
+def record(symbols, intervals, duration, out_path, depth_limit=1000, kline_limit=200):
+    """录制现货和期货的行情流及REST快照"""
+    with open(out_path, "w", encoding="utf-8") as out:
+        lock = threading.Lock()
+
+        def write(entry):
+            with lock:
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        def record_market(market):
+            streams = [f"{s.lower()}@kline_{i}" for s in symbols for i in intervals]
+            streams += [f"{s.lower()}@depth@100ms" for s in symbols]
+            url = f"{_WS_URLS[market]}/stream?streams={'/'.join(streams)}"
+            deadline = time.time() + duration
+
+            with connect(url, max_size=None) as websocket:
+                # 连接建立后再获取快照，与采集服务的同步流程一致
+                for symbol in symbols:
+                    for name, params in (("depth", {"limit": depth_limit}),
+                                         *(("klines", {"interval": i, "limit": kline_limit + 1}) for i in intervals)):
+                        path = _REST_PATHS[market][name]
+                        response = requests.get(f"{_REST_URLS[market]}{path}",
+                                                params={"symbol": symbol, **params}, timeout=10)
+                        response.raise_for_status()
+                        write({"type": "rest", "market": market, "path": path, "symbol": symbol,
+                               "params": params, "response": response.json()})
+
+                while time.time() < deadline:
+                    try:
+                        message = websocket.recv(timeout=max(0.0, deadline - time.time()))
+                    except TimeoutError:
+                        break
+                    write({"type": "ws", "market": market, "ts": int(time.time() * 1000),
+                           "message": json.loads(message)})
+
+        threads = [threading.Thread(target=record_market, args=(market,)) for market in _WS_URLS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def _find_rest_response(records, market, path, query):
+    """查找与请求匹配的REST录制数据"""
+    symbol = query.get("symbol", [None])[0]
+    interval = query.get("interval", [None])[0]
+    for entry in reversed(records):
+        if entry["type"] != "rest" or entry["market"] != market or entry["path"] != path:
+            continue
+        if entry["symbol"] != symbol:
+            continue
+        if interval and entry.get("params", {}).get("interval") != interval:
+            continue
+        response = entry["response"]
+        limit = query.get("limit", [None])[0]
+        if isinstance(response, list) and limit:
+            response = response[-int(limit):]
+        return response
+    return None
+
+
+def create_rest_server(records, host="127.0.0.1", port=0):
+    """创建回放录制REST响应的HTTP服务，地址格式为 /<market>/<原始路径>"""
+
+    class ReplayRestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            market, _, path = url.path.lstrip("/").partition("/")
+            response = _find_rest_response(records, market, f"/{path}", parse_qs(url.query))
+            if response is None:
+                self.send_error(404, "no recorded response")
+                return
+
+            body = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), ReplayRestHandler)
+
+
+def create_ws_server(records, host="127.0.0.1", port=0, speed=1.0, loop=False):
+    """创建回放WebSocket流的服务，地址格式为 /<market>/stream?streams=..."""
+
+    def handler(websocket):
+        url = urlsplit(websocket.request.path)
+        market = url.path.strip("/").split("/")[0]
+        streams = set(parse_qs(url.query).get("streams", [""])[0].split("/"))
+        messages = [r for r in records if r["type"] == "ws" and r["market"] == market
+                    and r["message"].get("stream") in streams]
+
+        while True:
+            previous_ts = None
+            for entry in messages:
+                if previous_ts is not None and speed > 0:
+                    time.sleep(max(0.0, entry["ts"] - previous_ts) / 1000 / speed)
+                previous_ts = entry["ts"]
+                websocket.send(json.dumps(entry["message"]))
+            if not loop:
+                break
+        # 回放结束后保持连接，模拟没有新行情的状态
+        websocket.recv()
+
+    return serve(handler, host, port, max_size=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="币安行情回放服务")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="录制真实行情")
+    record_parser.add_argument("--symbols", default="BTCUSDT", help="交易对，逗号分隔 (默认: BTCUSDT)")
+    record_parser.add_argument("--intervals", default="1m", help="K线周期，逗号分隔 (默认: 1m)")
+    record_parser.add_argument("--duration", type=float, default=60, help="录制时长，单位秒 (默认: 60)")
+    record_parser.add_argument("--out", default="replay.jsonl", help="输出文件 (默认: replay.jsonl)")
+
+    serve_parser = subparsers.add_parser("serve", help="回放录制的行情")
+    serve_parser.add_argument("--file", required=True, help="录制文件")
+    serve_parser.add_argument("-H", "--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    serve_parser.add_argument("--ws-port", type=int, default=9001, help="WebSocket端口 (默认: 9001)")
+    serve_parser.add_argument("--rest-port", type=int, default=9002, help="REST端口 (默认: 9002)")
+    serve_parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，0表示不等待 (默认: 1)")
+    serve_parser.add_argument("--loop", action="store_true", help="循环回放")
+    serve_parser.add_argument("--no-shift", action="store_true", help="不平移时间戳")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record([s.strip().upper() for s in args.symbols.split(",")],
+               [i.strip() for i in args.intervals.split(",")], args.duration, args.out)
+        print(f"录制完成: {args.out}")
+        return
+
+    records = load_records(args.file)
+    if not args.no_shift:
+        shift_records(records, align_offset(records))
+
+    rest_server = create_rest_server(records, args.host, args.rest_port)
+    threading.Thread(target=rest_server.serve_forever, daemon=True).start()
+    ws_server = create_ws_server(records, args.host, args.ws_port, args.speed, args.loop)
+    print(f"WebSocket回放服务: ws://{args.host}:{args.ws_port}/<spot|futures>")
+    print(f"REST回放服务: http://{args.host}:{args.rest_port}/<spot|futures>")
+    try:
+        ws_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ws_server.shutdown()
+        rest_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()